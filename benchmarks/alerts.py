@@ -0,0 +1,185 @@
+"""
+Alert dispatcher and mailer against a local SMTP stand-in: notify() cost
+in the detection loop, digests delivered, connection reuse and errors
+
+Usage: python -m benchmarks.alerts [--cameras 9] [--seconds 5] [--digest 1]
+"""
+import argparse
+import asyncio
+import base64
+import threading
+import time
+
+import numpy as np
+
+from sodistec.contrib.alert import AlertDispatcher
+from sodistec.contrib.mail import Mailer
+
+USER = "sodistec@localhost"
+PASSWORD = "secret"
+REFUSED = "refused@localhost"
+
+
+class SMTPStandIn:
+    """
+    Minimal SMTP server on localhost, counts the connections and the
+    messages, refuses REFUSED and the wrong passwords, optionally drops
+    the connection after every message like an idle timeout would
+    """
+    def __init__(self, delay: float = 0.0) -> None:
+        self.delay = delay
+        self.drop_after_message = False
+
+        self.connections = 0
+        self.messages = []
+        self.port = None
+
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+
+    def start(self):
+        t = threading.Thread(target=self._run)
+        t.daemon = True
+        t.start()
+        self._ready.wait()
+
+        return self
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        server = self._loop.run_until_complete(asyncio.start_server(self._session, "127.0.0.1", 0))
+        self.port = server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self._loop.run_forever()
+
+    async def _session(self, reader, writer) -> None:
+        self.connections += 1
+
+        async def reply(line: str) -> None:
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            writer.write(f"{line}\r\n".encode())
+            await writer.drain()
+
+        await reply("220 localhost stand-in")
+        try:
+            while True:
+                line = (await reader.readline()).decode().strip()
+                if not line:
+                    break
+                command = line.upper()
+
+                if command.startswith("EHLO"):
+                    writer.write(b"250-localhost\r\n250-AUTH PLAIN\r\n")
+                    await reply("250 OK")
+                elif command.startswith("HELO") or command.startswith("NOOP") or command.startswith("RSET"):
+                    await reply("250 OK")
+                elif command.startswith("AUTH PLAIN"):
+                    credentials = base64.b64decode(line.split()[2]).split(b"\0")
+                    ok = credentials[1:] == [USER.encode(), PASSWORD.encode()]
+                    await reply("235 OK" if ok else "535 Authentication failed")
+                elif command.startswith("MAIL FROM"):
+                    await reply("250 OK")
+                elif command.startswith("RCPT TO"):
+                    await reply("550 Mailbox unavailable" if REFUSED.upper() in command else "250 OK")
+                elif command == "DATA":
+                    await reply("354 End data with <CR><LF>.<CR><LF>")
+                    data = await reader.readuntil(b"\r\n.\r\n")
+                    self.messages.append(data)
+                    await reply("250 Queued")
+                    if self.drop_after_message:
+                        break
+                elif command == "QUIT":
+                    await reply("221 Bye")
+                    break
+                else:
+                    await reply("502 Not implemented")
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+def check_mailer(server: SMTPStandIn) -> None:
+    # Connection reuse, reconnect after a drop and no retry on the errors
+    # a new connection does not fix
+    def mailer(password=PASSWORD):
+        return Mailer("127.0.0.1", server.port, USER, password, use_ssl=False, timeout=5.0)
+
+    checks = []
+
+    (connections, messages) = (server.connections, len(server.messages))
+    m = mailer()
+    sent = all(m.send("admin@localhost") for _ in range(5))
+    checks.append(("5 mails, one connection", sent and server.connections - connections == 1
+                   and len(server.messages) - messages == 5))
+    m.close()
+
+    server.drop_after_message = True
+    (connections, messages) = (server.connections, len(server.messages))
+    m = mailer()
+    sent = all(m.send("admin@localhost") for _ in range(3))
+    checks.append(("server drops the connection, reconnected", sent and server.connections - connections == 3
+                   and len(server.messages) - messages == 3))
+    m.close()
+    server.drop_after_message = False
+
+    connections = server.connections
+    m = mailer()
+    refused = m.send(REFUSED)
+    checks.append(("refused recipient, not retried", not refused and server.connections - connections == 1))
+    m.close()
+
+    connections = server.connections
+    m = mailer("wrong")
+    denied = m.send("admin@localhost")
+    checks.append(("wrong password, not retried", not denied and server.connections - connections == 1
+                   and m.server is None))
+
+    for (name, ok) in checks:
+        print(f"{name:>45}: {'ok' if ok else 'FAILED'}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--cameras", type=int, default=9)
+    parser.add_argument("--fps", type=float, default=15.0, help="frames per second of every camera")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--digest", type=float, default=1.0, help="seconds between two digests")
+    parser.add_argument("--delay", type=float, default=0.05, help="delay of every SMTP reply (slow server)")
+    args = parser.parse_args()
+
+    server = SMTPStandIn(delay=args.delay).start()
+    check_mailer(server)
+
+    # every camera frame has a violation, the dispatcher
+    # debounces and rate limits them into digests
+    (connections, messages) = (server.connections, len(server.messages))
+    mailer = Mailer("127.0.0.1", server.port, USER, PASSWORD, use_ssl=False, timeout=5.0)
+    dispatcher = AlertDispatcher(play_buzzer=False, send_mail=True, digest_interval=args.digest,
+                                 mail_to="admin@localhost", mailer=mailer).start()
+
+    latencies = []
+    frames = int(args.seconds * args.fps)
+    start = time.perf_counter()
+    for index in range(frames):
+        delay = start + index / args.fps - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+        for camera_id in range(args.cameras):
+            begin = time.perf_counter()
+            dispatcher.notify(camera_id, 2, 5)
+            latencies.append(time.perf_counter() - begin)
+
+    dispatcher.stop()
+
+    samples = np.asarray(latencies) * 1e6
+    print(f"notify() per frame: p50 {np.percentile(samples, 50):.1f} us, p99 {np.percentile(samples, 99):.1f} us, "
+          f"max {samples.max():.0f} us with a {args.delay * 1000:.0f} ms SMTP server")
+    print(f"{frames * args.cameras} violating frames: {dispatcher.sent} alerts, {dispatcher.dropped} dropped, "
+          f"{len(server.messages) - messages} digests over {server.connections - connections} connection(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Compare the CPU inference backends and precisions on yolov4-tiny
+
+Usage: python -m benchmarks.backends [--runs 30] [--size 416] [--onnx yolov4-tiny.onnx]
+"""
+import argparse
+import time
+
+import numpy as np
+
+try:
+    from cv2 import cv2
+except ImportError:
+    import cv2
+
+from benchmarks.common import ensure_weights, synthetic_frame
+from sodistec.contrib.yolo import backend as backends
+from sodistec.contrib.yolo import yolo
+from sodistec.core.preprocess import letterbox
+
+
+def run(backend, blob, runs: int) -> tuple:
+    # Return the forward pass latencies (ms) and the last outputs
+    backends.warmup(backend, 2)
+
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        outputs = backend.forward(blob)
+        latencies.append(time.perf_counter() - start)
+
+    return (np.array(latencies) * 1000, outputs)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("--size", type=int, default=416, help="network input size")
+    parser.add_argument("--onnx", help="yolov4-tiny exported to ONNX, fp16 and int8 variants next to it")
+    args = parser.parse_args()
+
+    cv2.setRNGSeed(0)
+    ensure_weights()
+    if args.onnx:
+        yolo.YOLO4_MINI_ONNX_PATH = args.onnx
+
+    (image, _) = letterbox(synthetic_frame(0, 1920, 1080), args.size)
+    blob = cv2.dnn.blobFromImage(image, 1 / 255.0, swapRB=True, crop=False)
+
+    print(f"{'backend':>12} {'precision':>9} {'p50 ms':>8} {'p95 ms':>8} {'fps':>7} {'max diff':>9}")
+
+    # OpenCV fp32 first, the reference of the other ones
+    available = sorted(backends.probe().items(), key=lambda item: item[0] != ("opencv", "fp32"))
+
+    reference = None
+    for ((name, precision), backend) in available:
+        if isinstance(backend, Exception):
+            print(f"{name:>12} {precision:>9}   not available: {backend}")
+            continue
+
+        size_blob = blob
+        if backend.input_size is not None and backend.input_size != args.size:
+            (fixed, _) = letterbox(synthetic_frame(0, 1920, 1080), backend.input_size)
+            size_blob = cv2.dnn.blobFromImage(fixed, 1 / 255.0, swapRB=True, crop=False)
+
+        (latencies, outputs) = run(backend, size_blob, args.runs)
+        outputs = np.concatenate([o.reshape(-1, o.shape[-1]) for o in outputs])
+
+        # difference of the scores with OpenCV fp32 on the same input
+        diff = "-"
+        if (name, precision) == ("opencv", "fp32"):
+            reference = outputs
+        if reference is not None and reference.shape == outputs.shape:
+            diff = f"{np.abs(reference[:, 4:] - outputs[:, 4:]).max():.4f}"
+
+        p50 = np.percentile(latencies, 50)
+        print(f"{name:>12} {precision:>9} {p50:>8.1f} {np.percentile(latencies, 95):>8.1f} "
+              f"{1000 / p50:>7.1f} {diff:>9}")
+
+
+if __name__ == "__main__":
+    main()
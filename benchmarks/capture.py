@@ -0,0 +1,82 @@
+"""
+CPU used by the capture threads, every frame decoded against frames only
+retrieved when the detector asks for one, local clips played at real time
+
+Usage: python -m benchmarks.capture [--cameras 1 4] [--detect-fps 5] [--seconds 10]
+"""
+import argparse
+import threading
+import time
+
+from benchmarks.common import synthetic_clip
+from sodistec.contrib.multicapture import DECODE_ALL, DECODE_ON_DEMAND, LATEST, CaptureThread
+
+MODES = (
+    ("decode all", {"decode": DECODE_ALL}),
+    ("on-demand", {"decode": DECODE_ON_DEMAND}),
+    ("on-demand, 1 thread", {"decode": DECODE_ON_DEMAND, "threads": 1}),
+)
+
+
+def run(clip: str, cameras: int, detect_fps: float, seconds: float, options: dict) -> dict:
+    captures = [
+        CaptureThread(clip, policy=LATEST, realtime=True, **options).start() for _ in range(cameras)
+    ]
+    ages = []
+
+    def detector(capture):
+        # a detector taking 1 / detect_fps per frame, without using the CPU
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            frame = capture.next(timeout=5)
+            if frame is None:
+                break
+            ages.append(time.perf_counter() - frame.timestamp)
+            time.sleep(1 / detect_fps)
+
+    (wall, cpu) = (time.perf_counter(), time.process_time())
+
+    threads = [threading.Thread(target=detector, args=(c,)) for c in captures]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    (wall, cpu) = (time.perf_counter() - wall, time.process_time() - cpu)
+
+    for capture in captures:
+        capture.stop()
+
+    grabbed = sum(c.grabbed for c in captures)
+    skipped = sum(c.skipped for c in captures)
+
+    return {
+        "cpu": 100 * cpu / wall / cameras,
+        "grabbed": grabbed / cameras,
+        "retrieved": (grabbed - skipped) / cameras,
+        "detected": len(ages) / cameras,
+        "age": 1000 * sum(ages) / max(1, len(ages)),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--cameras", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--detect-fps", type=float, default=5.0, help="frames asked per second by each detector")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--source", help="video file, a generated 1080p clip by default")
+    args = parser.parse_args()
+
+    clip = args.source or synthetic_clip(frames=int(args.seconds * 25) + 50, width=1920, height=1080)
+
+    print(f"{'cameras':>8} {'mode':>20} {'cpu %/cam':>10} {'grabbed':>8} {'retrieved':>10} "
+          f"{'detected':>9} {'age ms':>7}")
+    for cameras in args.cameras:
+        for (name, options) in MODES:
+            r = run(clip, cameras, args.detect_fps, args.seconds, options)
+            print(f"{cameras:>8} {name:>20} {r['cpu']:>10.1f} {r['grabbed']:>8.0f} {r['retrieved']:>10.0f} "
+                  f"{r['detected']:>9.0f} {r['age']:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
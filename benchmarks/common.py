@@ -0,0 +1,106 @@
+import os
+import tempfile
+
+import numpy as np
+
+from sodistec.contrib.yolo import yolo
+
+# yolov4-tiny has ~6M parameters, extra data is ignored by the loader
+SYNTHETIC_WEIGHT_COUNT = 7_000_000
+
+
+def ensure_weights(seed: int = 0) -> str:
+    """
+    Make sure the yolov4-tiny weights exist, otherwise write seeded random
+    weights (same layer sizes, so same compute cost) to a temporary file
+    """
+    if os.path.exists(yolo.YOLO4_MINI_WEIGHT_PATH):
+        return yolo.YOLO4_MINI_WEIGHT_PATH
+
+    path = os.path.join(tempfile.gettempdir(), f"sodistec-yolov4-tiny-{seed}.weights")
+
+    if not os.path.exists(path):
+        rng = np.random.default_rng(seed)
+        with open(path, "wb") as f:
+            # darknet header: major, minor, revision and images seen
+            np.array([0, 2, 5], dtype=np.int32).tofile(f)
+            np.array([0], dtype=np.int64).tofile(f)
+            rng.uniform(0.0, 0.02, SYNTHETIC_WEIGHT_COUNT).astype(np.float32).tofile(f)
+
+    print(f"[INFO] {yolo.YOLO4_MINI_WEIGHT_PATH} not found, using synthetic weights")
+    yolo.YOLO4_MINI_WEIGHT_PATH = path
+
+    return path
+
+
+def synthetic_frame(seed: int, width: int = 960, height: int = 540):
+    """Deterministic noise frame"""
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+
+
+def memory_mb() -> float:
+    """Resident memory of this process in MB"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def synthetic_outputs(people: int, seed: int = 0, candidates: int = 3):
+    """
+    Deterministic yolov4-tiny shaped layer outputs with `people` persons,
+    each one reported by a few overlapping candidates like the real network
+    """
+    rng = np.random.default_rng(seed)
+
+    # background rows, class scores well under the confidence threshold
+    outputs = [rng.uniform(0, 0.1, size=(rows, 85)).astype(np.float32) for rows in (507, 2028)]
+
+    rows = rng.choice(len(outputs[1]), size=min(people * candidates, len(outputs[1])), replace=False)
+    centers = rng.uniform(0.05, 0.95, size=(people, 2))
+    sizes = rng.uniform((0.03, 0.15), (0.08, 0.35), size=(people, 2))
+
+    for (k, row) in enumerate(rows):
+        person = k // candidates
+        jitter = rng.normal(0, 0.005, size=4)
+
+        outputs[1][row, 0:2] = centers[person] + jitter[0:2]
+        outputs[1][row, 2:4] = sizes[person] + jitter[2:4]
+        outputs[1][row, 4] = 1.0
+        outputs[1][row, 5] = rng.uniform(0.5, 0.95)
+
+    return outputs
+
+
+def synthetic_clip(frames: int = 50, width: int = 960, height: int = 540, seed: int = 0) -> str:
+    """
+    Write (once) a small deterministic clip of moving boxes and return its path
+    """
+    import cv2
+
+    path = os.path.join(tempfile.gettempdir(), f"sodistec-clip-{seed}-{frames}-{width}x{height}.avi")
+    if os.path.exists(path):
+        return path
+
+    rng = np.random.default_rng(seed)
+    positions = rng.uniform(0, (width - 60, height - 150), size=(20, 2))
+    velocity = rng.normal(0, 3, size=(20, 2))
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 25, (width, height))
+    for _ in range(frames):
+        frame = np.full((height, width, 3), 90, dtype=np.uint8)
+        for (x, y) in positions.astype(int):
+            cv2.rectangle(frame, (x, y), (x + 60, y + 150), (40, 60, 200), -1)
+        writer.write(frame)
+
+        positions = np.clip(positions + velocity, 0, (width - 60, height - 150))
+    writer.release()
+
+    return path
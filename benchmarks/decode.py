@@ -0,0 +1,148 @@
+"""
+Decoding of the YOLO layer outputs against the per-row loop it replaced:
+identical people and time per frame
+
+Usage: python -m benchmarks.decode [--frames 50] [--people 10]
+
+The outputs are recorded from the network on noise frames (synthetic
+weights when the real ones are missing) and randomized yolov4-tiny shaped
+outputs with people in them.
+"""
+import argparse
+import time
+
+import numpy as np
+
+try:
+    from cv2 import cv2
+except ImportError:
+    import cv2
+
+from benchmarks.common import ensure_weights, synthetic_frame, synthetic_outputs
+from sodistec.apps import config
+from sodistec.core.decode import KNOW_DISTANCE, KNOW_WIDTH, decode_outputs, suppress
+from sodistec.core.pipeline import Pipeline
+
+
+def row_loop(layerOutputs, W, H, person_index, min_conf, offset=(0, 0)):
+    # The loop used by DetectPerson._detect_people before decode_outputs,
+    # the offset (letterbox padding) added since
+    boxes = []
+    centroids = []
+    confidences = []
+    distances = []
+
+    for output in layerOutputs:
+        for detection in output:
+            scores = detection[5:]
+            class_id = np.argmax(scores)
+            confidence = scores[class_id]
+
+            if class_id == person_index and confidence > min_conf:
+                box = detection[0:4] * np.array([W, H, W, H]) - np.array([offset[0], offset[1], 0, 0])
+                (centerX, centerY, width, height) = box.astype("int")
+
+                x = int(centerX - (width / 2))
+                y = int(centerY - (height / 2))
+
+                focal_length = (width * KNOW_DISTANCE + x) / KNOW_WIDTH
+
+                boxes.append([x, y, int(width), int(height)])
+                centroids.append((centerX, centerY))
+                confidences.append(float(confidence))
+                distances.append(focal_length)
+
+    results = []
+    idxs = cv2.dnn.NMSBoxes(boxes, confidences, min_conf, config.NMS_THRESH)
+
+    if len(idxs) > 0:
+        for i in np.asarray(idxs).flatten():
+            (x, y) = (boxes[i][0], boxes[i][1])
+            (w, h) = (boxes[i][2], boxes[i][3])
+            results.append((confidences[i], (x, y, x + w, y + h), centroids[i], distances[i]))
+
+    return results
+
+
+def vectorized(layerOutputs, W, H, person_index, min_conf, offset=(0, 0)):
+    # decode_outputs and the suppression, as the tuples of row_loop
+    people = suppress(decode_outputs(layerOutputs, W, H, person_index, min_conf, offset), min_conf, config.NMS_THRESH)
+    return [
+        (float(confidence), tuple(box), tuple(centroid), float(distance))
+        for (confidence, box, centroid, distance) in zip(
+            people.confidences.tolist(), people.boxes.tolist(), people.centroids.tolist(), people.distances.tolist()
+        )
+    ]
+
+
+def same(expected: list, got: list) -> bool:
+    # Detections keeps the distances as float32
+    return [
+        (c, tuple(int(v) for v in b), tuple(int(v) for v in p), float(np.float32(d))) for (c, b, p, d) in expected
+    ] == got
+
+
+def recorded_outputs(frames: int) -> list:
+    # Layer outputs of the network on noise frames, a few classes
+    # made the strongest so the person argmax matters
+    ensure_weights()
+    pipeline = Pipeline(0, use_gpu=False)
+
+    rng = np.random.default_rng(0)
+    recorded = []
+    for i in range(frames):
+        outputs = [np.array(output) for output in pipeline.forward(pipeline.blob(synthetic_frame(i, 416, 416)))]
+        for output in outputs:
+            rows = rng.choice(len(output), size=len(output) // 4, replace=False)
+            output[rows, 5:] = rng.uniform(0, 1, size=(len(rows), output.shape[1] - 5))
+            output[rows, 0:4] = rng.uniform(0, 1, size=(len(rows), 4))
+        recorded.append(outputs)
+
+    return recorded
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--frames", type=int, default=50)
+    parser.add_argument("--people", type=int, default=10)
+    args = parser.parse_args()
+
+    cases = {
+        "recorded": recorded_outputs(args.frames),
+        "randomized": [synthetic_outputs(args.people, seed) for seed in range(args.frames)],
+    }
+    settings = [
+        ((960, 540), 0, config.MIN_CONF, (0, 0)),
+        ((1920, 1080), 0, 0.5, (0, 0)),
+        ((960, 960), 0, config.MIN_CONF, (0, 210)),
+        ((960, 540), 2, config.MIN_CONF, (0, 0)),
+    ]
+
+    failed = False
+    print(f"{'outputs':>10} {'size':>10} {'class':>5} {'offset':>9} {'people':>7} {'loop ms':>8} {'vector ms':>9}")
+    for (name, outputs) in cases.items():
+        for ((w, h), person_index, min_conf, offset) in settings:
+            (loop, vector, people, identical) = ([], [], 0, True)
+            for layerOutputs in outputs:
+                start = time.perf_counter()
+                expected = row_loop(layerOutputs, w, h, person_index, min_conf, offset)
+                loop.append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                got = vectorized(layerOutputs, w, h, person_index, min_conf, offset)
+                vector.append(time.perf_counter() - start)
+
+                people += len(got)
+                identical &= same(expected, got)
+
+            failed |= not identical
+            print(f"{name:>10} {f'{w}x{h}':>10} {person_index:>5} {str(offset):>9} {people / len(outputs):>7.1f} "
+                  f"{np.median(loop) * 1000:>8.2f} {np.median(vector) * 1000:>9.2f}"
+                  f"{'' if identical else '  DIFFERENT'}")
+
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
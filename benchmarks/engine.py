@@ -0,0 +1,95 @@
+"""
+Compare per-camera networks with the shared batched inference engine
+
+Usage: python -m benchmarks.engine [--cameras 1 4 9] [--seconds 10]
+"""
+import argparse
+import threading
+import time
+
+try:
+    from cv2 import cv2
+except ImportError:
+    import cv2
+
+from benchmarks.common import ensure_weights, memory_mb, synthetic_frame
+from sodistec.contrib.yolo import yolo
+from sodistec.core.engine import InferenceEngine
+from sodistec.core.preprocess import letterbox
+
+
+def per_camera(cameras: int):
+    # Today's setup: every camera loads and runs its own network
+    models = []
+    for _ in range(cameras):
+        model = cv2.dnn.readNetFromDarknet(
+            yolo.YOLO4_MINI_CONFIG_PATH, yolo.YOLO4_MINI_WEIGHT_PATH
+        )
+        layer = model.getLayerNames()
+        layer = [layer[i - 1] for i in model.getUnconnectedOutLayers()]
+        models.append((model, layer))
+
+    def infer(camera_id, frame):
+        (model, layer) = models[camera_id]
+        blob = cv2.dnn.blobFromImage(frame, 1 / 255.0, swapRB=True, crop=False)
+        model.setInput(blob)
+        return model.forward(layer)
+
+    return (infer, lambda: None)
+
+
+def shared(cameras: int, batch_size: int, max_wait: float):
+    engine = InferenceEngine(batch_size=batch_size, max_wait=max_wait, use_gpu=False).start()
+    return (engine.infer, engine.stop)
+
+
+def run(cameras: int, seconds: float, setup) -> tuple:
+    before = memory_mb()
+    (infer, stop) = setup()
+
+    counts = [0] * cameras
+    deadline = time.monotonic() + seconds
+
+    def camera(camera_id):
+        (frame, _) = letterbox(synthetic_frame(camera_id), 416)
+        while time.monotonic() < deadline:
+            infer(camera_id, frame)
+            counts[camera_id] += 1
+
+    threads = [threading.Thread(target=camera, args=(i,)) for i in range(cameras)]
+    start = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - start
+
+    memory = memory_mb() - before
+    stop()
+
+    return (sum(counts) / elapsed, memory)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--cameras", type=int, nargs="+", default=[1, 4, 9])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--batch-size", type=int, default=9)
+    parser.add_argument("--max-wait", type=float, default=0.01)
+    args = parser.parse_args()
+
+    ensure_weights()
+
+    print(f"{'cameras':>8} {'mode':>12} {'total fps':>10} {'memory MB':>10}")
+    for cameras in args.cameras:
+        modes = [
+            ("per-camera", lambda: per_camera(cameras)),
+            ("shared", lambda: shared(cameras, args.batch_size, args.max_wait)),
+        ]
+        for (name, setup) in modes:
+            (fps, memory) = run(cameras, args.seconds, setup)
+            print(f"{cameras:>8} {name:>12} {fps:>10.2f} {memory:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
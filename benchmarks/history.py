@@ -0,0 +1,111 @@
+"""
+Cost of the statistics history in the detection loop, batched write
+throughput and roll-up query time over months of data
+
+Usage: python -m benchmarks.history [--cameras 9] [--days 180] [--frames 100000]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from sodistec.core.history import HistoryStore
+
+
+class _Result:
+    __slots__ = ("total_people", "total_serious_violations")
+
+    def __init__(self, people: int, violators: int) -> None:
+        self.total_people = people
+        self.total_serious_violations = violators
+
+
+def synthetic_rows(cameras: int, days: float, interval: int, start: int, seed: int = 0) -> list:
+    # One interval of every camera, busy during the day
+    rng = np.random.default_rng(seed)
+    count = int(days * 86400 / interval)
+    starts = start + np.arange(count) * interval
+    busy = 1 + 4 * (np.sin((starts % 86400) / 86400 * 2 * np.pi - np.pi / 2) + 1)
+
+    rows = []
+    for camera_id in range(cameras):
+        frames = np.full(count, int(15 * interval))
+        people = rng.poisson(busy * frames)
+        events = rng.poisson(busy / 2)
+        for i in range(count):
+            rows.append((
+                camera_id, int(starts[i]), float(interval), int(frames[i]), int(people[i]), int(busy[i] * 2),
+                int(people[i] // 10), int(busy[i] // 2), int(events[i] * 30), int(events[i]),
+            ))
+
+    rows.sort(key=lambda row: row[1])
+    return rows
+
+
+def timed(function, repeat: int = 5) -> tuple:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        samples.append(time.perf_counter() - start)
+    return (result, np.median(samples) * 1000)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--cameras", type=int, default=9)
+    parser.add_argument("--days", type=float, default=180.0, help="days of history written")
+    parser.add_argument("--interval", type=int, default=60, help="seconds per interval")
+    parser.add_argument("--frames", type=int, default=100_000, help="frames recorded for the loop cost")
+    parser.add_argument("--batch", type=float, default=30.0, help="seconds of intervals per flush")
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="sodistec-history-"), "history.sqlite3")
+    store = HistoryStore(path, interval=args.interval, keep_days=0, threshold=0)
+    store.start()
+    store.stop()
+
+    # record() per frame, the cameras taking turns
+    results = [_Result(p, p // 4) for p in np.random.default_rng(0).poisson(5, 1000)]
+    now = time.time()
+    start = time.perf_counter()
+    for i in range(args.frames):
+        store.record(i % args.cameras, results[i % len(results)], now + i / (15 * args.cameras))
+    record_us = (time.perf_counter() - start) / args.frames * 1e6
+
+    # months of intervals, written in the batches of the flush thread
+    end = int(time.time()) // 86400 * 86400
+    begin = end - int(args.days * 86400)
+    rows = synthetic_rows(args.cameras, args.days, args.interval, begin)
+    per_batch = max(1, int(args.batch / args.interval * args.cameras))
+
+    connection = store._connect()
+    start = time.perf_counter()
+    for i in range(0, len(rows), per_batch):
+        store.write(rows[i:i + per_batch], connection)
+    write_seconds = time.perf_counter() - start
+    connection.close()
+
+    size = sum(os.path.getsize(path + suffix) for suffix in ("", "-wal") if os.path.exists(path + suffix))
+
+    print(f"record() per frame: {record_us:.2f} us")
+    print(f"{len(rows)} intervals ({args.cameras} cameras, {args.days:.0f} days) in "
+          f"batches of {per_batch}: {write_seconds:.1f} s, {len(rows) / write_seconds:.0f} intervals/s, "
+          f"{size / 1024 / 1024:.0f} MB")
+
+    queries = {
+        "minute, 1 camera, last day": lambda: store.rollup("minute", end - 86400, end, camera_id=0),
+        "hour, every camera, last week": lambda: store.rollup("hour", end - 7 * 86400, end),
+        "day, every camera, everything": lambda: store.rollup("day", begin, end),
+        "day, 1 camera, everything": lambda: store.rollup("day", begin, end, camera_id=0),
+        "alerts per hour, everything": lambda: store.alerts("hour", begin, end, threshold=15),
+    }
+    for (name, query) in queries.items():
+        (rows, ms) = timed(query)
+        print(f"{name:>32}: {ms:8.1f} ms, {len(rows)} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Per stage benchmark of the detection pipeline on deterministic CPU input
+
+Usage: python -m benchmarks.pipeline [--cameras 1 4] [--people 0 10 50 150]
+                                     [--frames 50] [--source synthetic|clip]
+                                     [--network-size 320|416|512|608]
+                                     [--output results.json]
+                                     [--compare baseline.json]
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import threading
+import time
+
+import numpy as np
+
+try:
+    from cv2 import cv2
+except ImportError:
+    import cv2
+
+from benchmarks.common import ensure_weights, synthetic_clip, synthetic_frame, synthetic_outputs
+from sodistec.apps import config
+from sodistec.core.decode import decode_outputs
+from sodistec.core.engine import InferenceEngine
+from sodistec.core.pipeline import FRAME_SIZE, Pipeline
+from sodistec.core.preprocess import letterbox
+
+STAGES = ["read", "resize", "letterbox", "blob", "forward", "decode", "nms", "violation", "draw", "qt"]
+PERCENTILES = [50, 90, 99]
+
+
+def qt_converter():
+    # The frame to QImage conversion of the camera thread,
+    # skipped when PyQt5 is not available
+    try:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        from PyQt5.QtWidgets import QApplication
+        from sodistec.core.display import DISPLAY_SIZE, prepare_image
+    except ImportError:
+        return None
+
+    qt_converter.app = QApplication.instance() or QApplication([])
+    return lambda frame: prepare_image(frame, DISPLAY_SIZE)
+
+
+def frames_source(source: str, camera_id: int, frames: int):
+    # Yield (read time, frame) for every frame of the camera
+    if source == "synthetic":
+        frame = synthetic_frame(camera_id, 1920, 1080)
+        for _ in range(frames):
+            yield (None, frame.copy())
+        return
+
+    capture = cv2.VideoCapture(synthetic_clip() if source == "clip" else source)
+    for _ in range(frames):
+        start = time.perf_counter()
+        (grabbed, frame) = capture.read()
+        if not grabbed:
+            capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            (grabbed, frame) = capture.read()
+        yield (time.perf_counter() - start, frame)
+    capture.release()
+
+
+def run_camera(camera_id: int, args, people: int, pipeline: Pipeline, convert, timings: dict) -> None:
+    def timed(stage, func, *func_args):
+        start = time.perf_counter()
+        value = func(*func_args)
+        timings[stage].append(time.perf_counter() - start)
+        return value
+
+    outputs = synthetic_outputs(people, seed=camera_id)
+    (H, W) = FRAME_SIZE[::-1]
+
+    for (read, frame) in frames_source(args.source, camera_id, args.frames):
+        if read is not None:
+            timings["read"].append(read)
+
+        # the network runs on the real frame, but the random weights say
+        # nothing useful so the rest uses a synthetic crowd of people
+        (image, _) = timed("letterbox", letterbox, frame, pipeline.network_size)
+        frame = timed("resize", cv2.resize, frame, FRAME_SIZE, cv2.INTER_LINEAR)
+
+        if pipeline.engine is not None:
+            timed("forward", pipeline.engine.infer, camera_id, image)
+        else:
+            blob = timed("blob", pipeline.blob, image)
+            timed("forward", pipeline.forward, blob)
+
+        candidates = timed("decode", decode_outputs, outputs, W, H, pipeline.person_index, config.MIN_CONF)
+        detections = timed("nms", pipeline.suppress, candidates)
+        timed("violation", pipeline.check_violations, detections)
+        timed("draw", pipeline.draw, frame, detections)
+
+        if convert is not None:
+            timed("qt", convert, frame)
+
+
+def run(cameras: int, people: int, args, convert) -> dict:
+    engine = None
+    if args.shared_engine:
+        engine = InferenceEngine(use_gpu=False).start()
+
+    pipelines = [Pipeline(camera_id, False, engine) for camera_id in range(cameras)]
+    for pipeline in pipelines:
+        pipeline.network_size = args.network_size
+    timings = [{stage: [] for stage in STAGES} for _ in range(cameras)]
+
+    # warm up every network once, the first forward pass is much slower
+    for pipeline in pipelines:
+        pipeline.detect_people(synthetic_frame(0, *FRAME_SIZE))
+
+    threads = [
+        threading.Thread(target=run_camera, args=(i, args, people, pipelines[i], convert, timings[i]))
+        for i in range(cameras)
+    ]
+
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    if engine is not None:
+        engine.stop()
+
+    stages = {}
+    for stage in STAGES:
+        samples = np.concatenate([t[stage] for t in timings]) * 1000
+        if len(samples) == 0:
+            continue
+
+        stages[stage] = {f"p{p}": round(float(np.percentile(samples, p)), 4) for p in PERCENTILES}
+        stages[stage]["mean"] = round(float(samples.mean()), 4)
+
+    return {
+        "cameras": cameras,
+        "people": people,
+        "frames": args.frames * cameras,
+        "fps": round(args.frames * cameras / elapsed, 3),
+        "stages": stages,
+    }
+
+
+def compare(runs: list, baseline_path: str, tolerance: float) -> bool:
+    # Print the change against a previous run, return False on regression
+    with open(baseline_path) as f:
+        baseline = {(r["cameras"], r["people"]): r for r in json.load(f)["runs"]}
+
+    ok = True
+    print(f"\nCompared with {baseline_path} (tolerance {tolerance:.0%})")
+    for run in runs:
+        old = baseline.get((run["cameras"], run["people"]))
+        if old is None:
+            continue
+
+        changes = [("fps", old["fps"] / run["fps"])]
+        for (stage, value) in run["stages"].items():
+            if stage in old["stages"] and old["stages"][stage]["p50"] > 0:
+                changes.append((stage, value["p50"] / old["stages"][stage]["p50"]))
+
+        for (name, ratio) in changes:
+            regression = ratio > 1 + tolerance
+            ok = ok and not regression
+            flag = "REGRESSION" if regression else ""
+            print(f"  cameras={run['cameras']} people={run['people']} {name:>10}: {ratio - 1:+7.1%} {flag}")
+
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--cameras", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--people", type=int, nargs="+", default=[0, 10, 50, 150])
+    parser.add_argument("--frames", type=int, default=50, help="frames per camera")
+    parser.add_argument("--source", default="synthetic", help="synthetic, clip (generated video) or a video path")
+    parser.add_argument("--shared-engine", action="store_true", default=False)
+    parser.add_argument("--network-size", type=int, default=416, help="network input size")
+    parser.add_argument("--output", help="save the results as JSON")
+    parser.add_argument("--compare", help="previous JSON results to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed slow down before failing")
+    args = parser.parse_args()
+
+    # CPU only and seeded, so runs can be compared over time
+    cv2.setRNGSeed(0)
+    ensure_weights()
+    convert = qt_converter()
+
+    runs = []
+    for cameras in args.cameras:
+        for people in args.people:
+            run_result = run(cameras, people, args, convert)
+            runs.append(run_result)
+
+            print(f"cameras={cameras} people={people} fps={run_result['fps']:.2f}")
+            for (stage, value) in run_result["stages"].items():
+                print(f"  {stage:>10}: " + " ".join(f"{k}={v:.3f}ms" for (k, v) in value.items()))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "meta": {
+                    "date": datetime.datetime.now().isoformat(timespec="seconds"),
+                    "python": platform.python_version(),
+                    "opencv": cv2.__version__,
+                    "numpy": np.__version__,
+                    "machine": platform.machine(),
+                    "cpu_count": os.cpu_count(),
+                    "source": args.source,
+                    "shared_engine": args.shared_engine,
+                    "network_size": args.network_size,
+                },
+                "runs": runs,
+            }, f, indent=2)
+
+    if args.compare and not compare(runs, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Cost of the violation clip recorder in the detection loop, clips written,
+dropped and their write latency, cameras fed at their frame rate
+
+Usage: python -m benchmarks.recorder [--cameras 4] [--fps 15] [--seconds 20] [--every 4]
+"""
+import argparse
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+try:
+    from cv2 import cv2
+except ImportError:
+    import cv2
+
+from benchmarks.common import memory_mb, synthetic_clip
+from sodistec.contrib.recorder import ClipRecorder
+
+
+def load_frames(count: int = 50) -> list:
+    capture = cv2.VideoCapture(synthetic_clip())
+    frames = []
+    while len(frames) < count:
+        (grabbed, frame) = capture.read()
+        if not grabbed:
+            break
+        frames.append(frame)
+    capture.release()
+    return frames
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--cameras", type=int, default=4)
+    parser.add_argument("--fps", type=float, default=15.0, help="frames per second of every camera")
+    parser.add_argument("--seconds", type=float, default=20.0)
+    parser.add_argument("--every", type=float, default=4.0, help="seconds between two violations of a camera")
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--quota", type=float, default=2048.0, help="disk quota in MB")
+    args = parser.parse_args()
+
+    frames = load_frames()
+    directory = tempfile.mkdtemp(prefix="sodistec-clips-")
+    memory = memory_mb()
+
+    recorder = ClipRecorder(directory, pre_seconds=2.0, post_seconds=2.0, max_writers=args.writers,
+                            quota_mb=args.quota).start()
+    latencies = [[] for _ in range(args.cameras)]
+
+    def camera(camera_id):
+        start = time.perf_counter()
+        for index in range(int(args.seconds * args.fps)):
+            # at the camera frame rate
+            delay = start + index / args.fps - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+            now = time.perf_counter() - start
+            violation = (now + camera_id) % args.every < 0.5
+
+            begin = time.perf_counter()
+            recorder.add(camera_id, frames[index % len(frames)], violation)
+            latencies[camera_id].append(time.perf_counter() - begin)
+
+    threads = [threading.Thread(target=camera, args=(i,)) for i in range(args.cameras)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    peak = memory_mb() - memory
+    recorder.stop()
+
+    snapshot = recorder.snapshot()
+    samples = np.concatenate(latencies) * 1000
+
+    print(f"clips in {directory}")
+    print(f"add() per frame: p50 {np.percentile(samples, 50):.2f} ms, p95 {np.percentile(samples, 95):.2f} ms, "
+          f"max {samples.max():.2f} ms")
+    print(f"clips written {snapshot['clips']}, dropped {snapshot['dropped_clips']} "
+          f"({snapshot['dropped_frames']} frames), deleted for the quota {snapshot['deleted']}")
+    print(f"write latency p50 {snapshot['write']['p50']:.0f} ms, p95 {snapshot['write']['p95']:.0f} ms, "
+          f"disk {snapshot['usage_mb']:.1f} MB, memory +{peak:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
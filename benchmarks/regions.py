@@ -0,0 +1,127 @@
+"""
+Compute against reach of the regions of interest and tiles of a camera:
+forward passes, detection time, smallest person found and people found
+
+Usage: python -m benchmarks.regions [--source 4k|video.mp4] [--tiles 1x1 1x2 2x2 2x3]
+                                    [--roi 0,200 960,200 960,540 0,540]
+                                    [--network-size 416] [--frames 20]
+
+The people found only mean something with the real yolov4-tiny weights
+and a real video, the synthetic weights find nobody.
+"""
+import argparse
+import time
+
+import numpy as np
+
+try:
+    from cv2 import cv2
+except ImportError:
+    import cv2
+
+from benchmarks.common import ensure_weights, synthetic_frame
+from sodistec.apps import config
+from sodistec.core.pipeline import FRAME_SIZE, Pipeline
+from sodistec.core.preprocess import letterbox
+
+# Height (in network input pixels) of the smallest person yolov4-tiny
+# finds reliably, its smallest anchors are about that size
+MIN_PERSON_PIXELS = 20
+
+
+def read_frames(source: str, count: int) -> list:
+    if source == "4k":
+        return [synthetic_frame(i, 3840, 2160) for i in range(min(count, 3))]
+
+    capture = cv2.VideoCapture(source)
+    frames = []
+    while len(frames) < count:
+        (grabbed, frame) = capture.read()
+        if not grabbed:
+            break
+        frames.append(frame)
+    capture.release()
+
+    if not frames:
+        raise SystemExit(f"Cannot read {source}")
+    return frames
+
+
+def parse_tiles(text: str) -> tuple:
+    (rows, cols) = text.lower().split("x")
+    return (int(rows), int(cols))
+
+
+def smallest_person(pipeline: Pipeline, source_size: tuple) -> float:
+    # Height in source pixels of the smallest person found, from the
+    # most downscaled network input of the camera
+    if not pipeline.regions.enabled:
+        crops = [(0, 0, *source_size)]
+    else:
+        crops = pipeline.regions.crops(source_size)
+
+    scales = [
+        letterbox(np.empty((y1 - y0, x1 - x0, 3), dtype=np.uint8), pipeline.network_size)[1].scale
+        for (x0, y0, x1, y1) in crops
+    ]
+    return MIN_PERSON_PIXELS / min(scales)
+
+
+def run(setting: dict, frames: list, network_size: int) -> dict:
+    config.CAMERA_SETTINGS = {0: dict(setting, NETWORK_SIZE=network_size)}
+    pipeline = Pipeline(0, use_gpu=False)
+    (h, w) = frames[0].shape[:2]
+
+    # the first forward pass of a batch size allocates the network
+    pipeline.detect_people(frames[0], pipeline.person_index, FRAME_SIZE)
+
+    (samples, people) = ([], [])
+    for frame in frames:
+        start = time.perf_counter()
+        detections = pipeline.detect_people(frame, pipeline.person_index, FRAME_SIZE)
+        samples.append(time.perf_counter() - start)
+        people.append(len(detections))
+
+    crops = len(pipeline.regions.crops((w, h))) if pipeline.regions.enabled else 1
+    return {
+        "crops": crops,
+        "megapixels": crops * network_size ** 2 / 1e6,
+        "detect_ms": np.median(samples) * 1000,
+        "smallest": smallest_person(pipeline, (w, h)),
+        "people": np.mean(people),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--source", default="4k", help="\"4k\" (synthetic) or a video file")
+    parser.add_argument("--tiles", nargs="+", default=["1x1", "1x2", "2x2", "2x3"], help="rows x cols")
+    parser.add_argument("--roi", nargs="*", default=["0,200", "960,200", "960,540", "0,540"],
+        help="polygon in 960x540 coordinates, also run with it, empty for none")
+    parser.add_argument("--overlap", type=float, default=config.DETECT_TILE_OVERLAP)
+    parser.add_argument("--network-size", type=int, default=416)
+    parser.add_argument("--frames", type=int, default=20)
+    args = parser.parse_args()
+
+    ensure_weights()
+    frames = read_frames(args.source, args.frames)
+    (h, w) = frames[0].shape[:2]
+
+    rois = {"whole frame": []}
+    if args.roi:
+        rois["roi"] = [[tuple(int(v) for v in point.split(",")) for point in args.roi]]
+
+    print(f"{w}x{h} source, network {args.network_size}, people under the smallest "
+          f"height are missed (in source pixels)")
+    print(f"{'setting':>20} {'crops':>6} {'Mpx':>6} {'detect':>10} {'smallest':>9} {'people':>7}")
+
+    for (name, roi) in rois.items():
+        for tiles in args.tiles:
+            setting = {"DETECT_ROIS": roi, "DETECT_TILES": parse_tiles(tiles), "DETECT_TILE_OVERLAP": args.overlap}
+            result = run(setting, frames, args.network_size)
+            print(f"{name + ' ' + tiles:>20} {result['crops']:>6} {result['megapixels']:>6.2f} "
+                  f"{result['detect_ms']:>7.1f} ms {result['smallest']:>6.0f} px {result['people']:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+GUI thread cost of showing the camera feeds: the old per frame signal with
+the conversion on the GUI thread, the newest frame painted at a capped
+refresh rate, and the video wall painted as one image
+
+Usage: python -m benchmarks.render [--cameras 1 4 9 16] [--fps 30] [--seconds 5] [--modes signal latest wall]
+"""
+import argparse
+import os
+import threading
+import time
+
+import numpy as np
+
+try:
+    from cv2 import cv2
+except ImportError:
+    import cv2
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtCore import QObject, QTimer, Qt, pyqtSignal
+from PyQt5.QtGui import QImage, QPixmap
+from PyQt5.QtWidgets import QApplication, QGridLayout, QLabel, QWidget
+
+from benchmarks.common import synthetic_frame
+from sodistec.core.display import LatestFrame, VideoWidget
+from sodistec.core.mosaic import Mosaic, MosaicWidget
+from sodistec.core.pipeline import FRAME_SIZE
+from sodistec.core.stats import CameraStats
+
+
+def convert_cv_qt(cv_img):
+    # The previous conversion, run on the GUI thread for every frame
+    rgb_image = cv2.cvtColor(cv_img, cv2.COLOR_BGR2RGB)
+    h, w, ch = rgb_image.shape
+    convert_to_Qt_format = QImage(rgb_image.data, w, h, ch * w, QImage.Format_RGB888)
+    p = convert_to_Qt_format.scaled(960, 540)
+    return QPixmap.fromImage(p)
+
+
+class Producer(QObject):
+    frame_signal = pyqtSignal(np.ndarray, int, float)
+
+
+def produce(camera_id: int, fps: float, deadline: float, emit) -> None:
+    # A camera thread delivering annotated frames at a fixed rate
+    frame = cv2.resize(synthetic_frame(camera_id), FRAME_SIZE)
+    next_frame = time.perf_counter()
+
+    while time.perf_counter() < deadline:
+        emit(camera_id, frame.copy())
+
+        next_frame += 1 / fps
+        time.sleep(max(0.0, next_frame - time.perf_counter()))
+
+
+def run(app, cameras: int, fps: float, seconds: float, mode: str, refresh_rate: float) -> dict:
+    window = QWidget()
+    grid = QGridLayout(window)
+    window.resize(1920, 1080)
+
+    gui_time = []
+    latencies = []
+    producers = []
+
+    if mode == "signal":
+        labels = [QLabel() for _ in range(cameras)]
+        for (i, label) in enumerate(labels):
+            grid.addWidget(label, i // 3, i % 3)
+
+        def update_image(cv_img, camera_id, timestamp):
+            start = time.perf_counter()
+            labels[camera_id].setPixmap(convert_cv_qt(cv_img))
+            labels[camera_id].repaint()
+            gui_time.append(time.perf_counter() - start)
+            latencies.append(time.perf_counter() - timestamp)
+
+        producer = Producer()
+        producer.frame_signal.connect(update_image, Qt.QueuedConnection)
+        emit = lambda camera_id, frame: producer.frame_signal.emit(frame, camera_id, time.perf_counter())
+        stale = lambda: 0
+    elif mode == "wall":
+        # 3 x 3 tiles, the cameras beyond are on the next pages
+        stats = [CameraStats(i) for i in range(cameras)]
+        mosaic = Mosaic(cameras, 3, 3)
+        tiles = [mosaic.tile(i, stats[i]) for i in range(cameras)]
+        widget = MosaicWidget(mosaic)
+        grid.addWidget(widget, 0, 0)
+
+        def refresh():
+            start = time.perf_counter()
+            if mosaic.dirty:
+                widget.refresh()
+                widget.repaint()
+                gui_time.append(time.perf_counter() - start)
+
+        timer = QTimer()
+        timer.timeout.connect(refresh)
+        timer.start(int(1000 / refresh_rate))
+        producers.append(timer)
+
+        def emit(camera_id, frame):
+            tiles[camera_id].status = None
+            tiles[camera_id].put(frame)
+
+        stale = lambda: 0
+    else:
+        stats = [CameraStats(i) for i in range(cameras)]
+        buffers = [LatestFrame(s) for s in stats]
+        widgets = [VideoWidget(b) for b in buffers]
+        for (i, widget) in enumerate(widgets):
+            grid.addWidget(widget, i // 3, i % 3)
+
+        def refresh():
+            for widget in widgets:
+                start = time.perf_counter()
+                if widget.buffer.image is not None:
+                    widget.refresh()
+                    widget.repaint()
+                    gui_time.append(time.perf_counter() - start)
+
+        timer = QTimer()
+        timer.timeout.connect(refresh)
+        timer.start(int(1000 / refresh_rate))
+        producers.append(timer)
+
+        emit = lambda camera_id, frame: buffers[camera_id].put(frame)
+        stale = lambda: sum(b.stale for b in buffers)
+
+    window.show()
+    app.processEvents()
+
+    start = time.perf_counter()
+    deadline = start + seconds
+    threads = [threading.Thread(target=produce, args=(i, fps, deadline, emit)) for i in range(cameras)]
+    for t in threads:
+        t.start()
+
+    # the GUI event loop, the queued frames are painted until the
+    # backlog is cleared
+    while any(t.is_alive() for t in threads) or app.hasPendingEvents():
+        app.processEvents()
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - start
+
+    window.close()
+
+    samples = np.array(gui_time) * 1000
+    return {
+        "paints": len(gui_time),
+        "gui_ms_p50": float(np.percentile(samples, 50)) if len(samples) else 0.0,
+        "gui_busy": float(samples.sum() / 1000 / elapsed),
+        "latency_ms_p95": float(np.percentile(latencies, 95) * 1000) if latencies else None,
+        "stale": stale(),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--cameras", type=int, nargs="+", default=[1, 4, 9, 16])
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--refresh-rate", type=float, default=30)
+    parser.add_argument("--modes", nargs="+", choices=["signal", "latest", "wall"],
+                        default=["signal", "latest", "wall"])
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication([])
+
+    print(f"{'cameras':>8} {'mode':>8} {'paints':>7} {'GUI ms p50':>11} {'GUI busy':>9} "
+          f"{'latency p95':>12} {'stale':>6}")
+
+    for cameras in args.cameras:
+        for mode in args.modes:
+            result = run(app, cameras, args.fps, args.seconds, mode, args.refresh_rate)
+            latency = result["latency_ms_p95"]
+            print(f"{cameras:>8} {mode:>8} {result['paints']:>7} {result['gui_ms_p50']:>11.2f} "
+                  f"{result['gui_busy']:>8.0%} "
+                  f"{(f'{latency:.0f} ms' if latency is not None else '-'):>12} {result['stale']:>6}")
+
+
+if __name__ == "__main__":
+    main()
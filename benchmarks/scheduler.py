@@ -0,0 +1,79 @@
+"""
+Frame rate of every camera with and without the activity scheduler,
+cameras sharing one (simulated) accelerator, one of them crowded
+
+Usage: python -m benchmarks.scheduler [--cameras 4 9] [--budget 20] [--cost 40] [--seconds 10]
+"""
+import argparse
+import threading
+import time
+
+from sodistec.apps import config
+from sodistec.core.detections import Detections
+from sodistec.core.pipeline import FrameResult
+from sodistec.core.scheduler import CameraScheduler
+
+
+def fake_result(people: int, violations: int) -> FrameResult:
+    detections = Detections([(0, 0, 1, 1)] * people, [(0, 0)] * people, [1.0] * people, [0.0] * people,
+                            [i < violations for i in range(people)])
+    return FrameResult(None, detections, None, motion=1.0 if people else 0.0)
+
+
+def run(cameras: int, scheduler: CameraScheduler, cost: float, seconds: float) -> list:
+    # camera 0 is crowded, the other ones are empty
+    device = threading.Lock()
+    frames = [0] * cameras
+    deadline = time.perf_counter() + seconds
+
+    def camera(camera_id):
+        result = fake_result(30, 6) if camera_id == 0 else fake_result(0, 0)
+
+        if scheduler is not None:
+            scheduler.register(camera_id)
+
+        while time.perf_counter() < deadline:
+            if scheduler is not None and not scheduler.wait(camera_id):
+                break
+
+            # the detection of a frame, one at a time on the device
+            with device:
+                time.sleep(cost)
+            frames[camera_id] += 1
+
+            if scheduler is not None:
+                scheduler.report(camera_id, result)
+
+        if scheduler is not None:
+            scheduler.unregister(camera_id)
+
+    threads = [threading.Thread(target=camera, args=(i,)) for i in range(cameras)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    return [count / seconds for count in frames]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--cameras", type=int, nargs="+", default=[4, 9])
+    parser.add_argument("--budget", type=float, default=20.0, help="FPS budget of the scheduler")
+    parser.add_argument("--min-fps", type=float, default=1.0)
+    parser.add_argument("--cost", type=float, default=40.0, help="detection time of a frame in ms")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    args = parser.parse_args()
+
+    config.CAMERA_MIN_FPS = args.min_fps
+
+    print(f"{'cameras':>8} {'mode':>10} {'crowded fps':>12} {'empty fps (min)':>16} {'total fps':>10} {'device %':>9}")
+    for cameras in args.cameras:
+        for (name, scheduler) in (("free", None), ("scheduler", CameraScheduler(args.budget))):
+            fps = run(cameras, scheduler, args.cost / 1000, args.seconds)
+            busy = 100 * sum(fps) * args.cost / 1000
+            print(f"{cameras:>8} {name:>10} {fps[0]:>12.1f} {min(fps[1:]):>16.1f} {sum(fps):>10.1f} {busy:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
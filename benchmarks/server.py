@@ -0,0 +1,182 @@
+"""
+Load test of the metrics and MJPEG server on localhost: concurrent stream
+clients (some of them slow), metrics scrapes and the cost of publish()
+
+Usage: python -m benchmarks.server [--cameras 4] [--clients 8] [--slow 4] [--seconds 10]
+"""
+import argparse
+import asyncio
+import multiprocessing as mp
+import socket
+import threading
+import time
+
+import numpy as np
+
+try:
+    from cv2 import cv2
+except ImportError:
+    import cv2
+
+from benchmarks.common import synthetic_frame
+from sodistec.contrib.server import MonitorServer
+from sodistec.core.pipeline import FRAME_SIZE
+
+
+class _Result:
+    __slots__ = ("frame", "total_people", "total_serious_violations")
+
+    def __init__(self, frame, people: int, violators: int) -> None:
+        self.frame = frame
+        self.total_people = people
+        self.total_serious_violations = violators
+
+
+def annotated_frames(count: int = 10) -> list:
+    # A noisy background with moving boxes, like a drawn frame
+    (w, h) = FRAME_SIZE
+    background = cv2.GaussianBlur(synthetic_frame(0, w, h), (31, 31), 0)
+    frames = []
+    for i in range(count):
+        frame = background.copy()
+        for j in range(8):
+            x = (i * 20 + j * 110) % (w - 60)
+            cv2.rectangle(frame, (x, 100 + j * 40), (x + 60, 220 + j * 40), (0, 255, 0), 2)
+        frames.append(frame)
+    return frames
+
+
+async def _stream_client(port: int, camera: int, delay: float, deadline: float) -> int:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if delay:
+        # a slow link does not buffer megabytes like the loopback
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 64 * 1024)
+    sock.connect(("127.0.0.1", port))
+
+    (reader, writer) = await asyncio.open_connection(sock=sock)
+    writer.write(f"GET /camera/{camera} HTTP/1.0\r\n\r\n".encode())
+    await writer.drain()
+    await reader.readuntil(b"\r\n\r\n")
+
+    frames = 0
+    try:
+        while time.time() < deadline:
+            headers = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), deadline - time.time())
+            length = int(headers.split(b"Content-Length: ")[1].split(b"\r\n")[0])
+            await reader.readexactly(length + 2)
+            frames += 1
+
+            # a slow client (e.g. on a bad network) reads a frame now and then
+            if delay:
+                await asyncio.sleep(delay)
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+    return frames
+
+
+async def _metrics_client(port: int, deadline: float) -> list:
+    latencies = []
+    while time.time() < deadline:
+        start = time.perf_counter()
+        (reader, writer) = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /metrics HTTP/1.0\r\n\r\n")
+        await reader.read()
+        writer.close()
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0.5)
+    return latencies
+
+
+def run_clients(port: int, cameras: int, clients: int, slow: int, deadline: float, output) -> None:
+    # Every client in one asyncio loop of a separate process
+    async def run():
+        tasks = [
+            _stream_client(port, i % cameras + 1, 0.5 if i < slow else 0.0, deadline)
+            for i in range(clients)
+        ]
+        return await asyncio.gather(_metrics_client(port, deadline), *tasks)
+
+    (latencies, *frames) = asyncio.run(run())
+    output.send((latencies, frames))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--cameras", type=int, default=4)
+    parser.add_argument("--fps", type=float, default=15.0, help="frames per second of every camera")
+    parser.add_argument("--clients", type=int, default=8, help="stream clients")
+    parser.add_argument("--slow", type=int, default=4, help="slow stream clients among them")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--stream-fps", type=float, default=10.0)
+    args = parser.parse_args()
+
+    frames = annotated_frames()
+    server = MonitorServer("127.0.0.1", 0, fps=args.stream_fps, max_clients=0)
+    for camera_id in range(args.cameras):
+        server.register(camera_id)
+    server.start()
+
+    stopped = threading.Event()
+    latencies = [[] for _ in range(args.cameras)]
+    published = [0] * args.cameras
+
+    def camera(camera_id):
+        start = time.perf_counter()
+        index = 0
+        while not stopped.is_set():
+            # at the camera frame rate
+            delay = start + index / args.fps - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+            result = _Result(frames[(index + camera_id) % len(frames)], 5, 1)
+            begin = time.perf_counter()
+            server.publish(camera_id, result)
+            latencies[camera_id].append(time.perf_counter() - begin)
+
+            published[camera_id] += 1
+            index += 1
+
+    threads = [threading.Thread(target=camera, args=(i,)) for i in range(args.cameras)]
+    for t in threads:
+        t.start()
+
+    # the clients connect after a second, to a stream already running
+    time.sleep(1.0)
+    (receiver, sender) = mp.Pipe(duplex=False)
+    deadline = time.time() + args.seconds
+    clients = mp.Process(target=run_clients,
+                         args=(server.port, args.cameras, args.clients, args.slow, deadline, sender))
+    clients.start()
+    (metrics_latencies, received) = receiver.recv()
+    clients.join()
+
+    stopped.set()
+    for t in threads:
+        t.join()
+
+    skipped = sum(feed.skipped for feed in server.feeds.values())
+    server.stop()
+
+    samples = np.concatenate(latencies) * 1e6
+    fast = received[args.slow:]
+    slow = received[:args.slow]
+
+    print(f"publish() per frame: p50 {np.percentile(samples, 50):.1f} us, p95 {np.percentile(samples, 95):.1f} us, "
+          f"max {samples.max():.0f} us, cameras at {sum(published) / len(published) / (args.seconds + 1):.1f} FPS")
+    print(f"frames encoded: {server.encodes} ({server.encodes / args.seconds / args.cameras:.1f} per camera "
+          f"per second), {server.encode_seconds / max(server.encodes, 1) * 1000:.1f} ms each")
+    if fast:
+        print(f"{len(fast)} clients: {np.mean(fast) / args.seconds:.1f} FPS each")
+    if slow:
+        print(f"{len(slow)} slow clients: {np.mean(slow) / args.seconds:.1f} FPS each, {skipped} frames skipped")
+    if metrics_latencies:
+        print(f"/metrics: p50 {np.percentile(metrics_latencies, 50) * 1000:.1f} ms "
+              f"over {len(metrics_latencies)} scrapes")
+
+
+if __name__ == "__main__":
+    main()
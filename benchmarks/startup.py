@@ -0,0 +1,94 @@
+"""
+Start-up time of the GUI: imports, window shown and first frame of every
+camera, each run in a fresh process
+
+Usage: python -m benchmarks.startup [--cameras 1 9] [--source clip|URL]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+def child(cameras: int, source: str) -> dict:
+    # One start-up, measured from the first import
+    start = time.perf_counter()
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtWidgets import QApplication
+    import sodistec.core.gui as gui
+    imported = time.perf_counter()
+
+    from benchmarks.common import ensure_weights, synthetic_clip
+    from sodistec.apps import config
+
+    ensure_weights()
+    config.USE_GPU = False
+    config.CAMERAS_URL = [synthetic_clip() if source == "clip" else source] * cameras
+
+    # no camera dialog, the URLs are set above
+    class SetCamera:
+        def __init__(self, parent) -> None:
+            pass
+
+        def exec(self) -> None:
+            pass
+
+    gui.SetCamera = SetCamera
+
+    app = QApplication.instance() or QApplication([])
+    setup = time.perf_counter()
+
+    window = gui.WindowApp()
+    window.show()
+    app.processEvents()
+    shown = time.perf_counter()
+
+    # wait for a frame on every feed
+    deadline = shown + 120
+    displays = list(window.display_feed.values())
+    while time.perf_counter() < deadline and any(d.image is None for d in displays):
+        app.processEvents()
+        time.sleep(0.005)
+    first_frame = time.perf_counter()
+
+    window.close()
+
+    return {
+        "cameras": cameras,
+        "import": imported - start,
+        "window": shown - setup,
+        "first_frame": first_frame - setup,
+        "all_frames": all(d.image is not None for d in displays),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--cameras", type=int, nargs="+", default=[1, 9])
+    parser.add_argument("--source", default="clip", help="clip (generated video) or a video path / URL")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        print(json.dumps(child(args.child, args.source)))
+        sys.stdout.flush()
+        os._exit(0)
+
+    print(f"{'cameras':>8} {'import s':>9} {'window s':>9} {'first frame s':>14}")
+    for cameras in args.cameras:
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.startup", "--child", str(cameras), "--source", args.source],
+            capture_output=True, text=True,
+        ).stdout
+
+        result = json.loads(output.strip().splitlines()[-1])
+        missing = "" if result["all_frames"] else " (some feeds never showed a frame)"
+        print(f"{cameras:>8} {result['import']:>9.2f} {result['window']:>9.2f} "
+              f"{result['first_frame']:>14.2f}{missing}")
+
+
+if __name__ == "__main__":
+    main()
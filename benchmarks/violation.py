@@ -0,0 +1,95 @@
+"""
+Scaling benchmark for the violation check
+
+Usage: python -m benchmarks.violation [--repeat 50] [--max-people 500]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from scipy.spatial import distance as dist
+
+from sodistec.apps import config
+from sodistec.core.calibration import GroundPlane
+from sodistec.core.detections import Detections
+from sodistec.core.violation import find_violations, flag_violations
+
+# A floor of 3 x 4 metres seen from above and in front
+GROUND_POINTS = [(380, 260), (580, 260), (700, 500), (260, 500)]
+GROUND_METRES = [(0, 0), (3, 0), (3, 4), (0, 4)]
+
+
+def pair_loop(centroids, distances, min_distance, min_radius):
+    # The nested loop used by DetectPerson.run before the violation engine
+    serious = set()
+    data = dist.cdist(centroids, centroids, metric="euclidean")
+
+    for i in range(0, data.shape[0]):
+        for j in range(i + 1, data.shape[1]):
+            jarak = dist.euclidean([distances[i]], [distances[j]])
+
+            if data[i, j] < min_distance and (jarak < min_radius or data[i, j] < 0):
+                serious.add(i)
+                serious.add(j)
+
+    return serious
+
+
+def crowd(people: int, seed: int = 0):
+    # People spread over a 960x540 frame with a plausible distance column
+    rng = np.random.default_rng(seed)
+    centroids = rng.integers(0, (960, 540), size=(people, 2))
+    distances = rng.uniform(0, 400, size=people)
+    return (centroids, distances)
+
+
+def crowd_detections(centroids, distances) -> Detections:
+    # 40x100 boxes around the centroids, feet in the frame
+    boxes = np.concatenate([centroids - (20, 50), centroids + (20, 50)], axis=1)
+    return Detections(boxes, centroids, np.ones(len(centroids)), distances)
+
+
+def timeit(func, repeat: int) -> float:
+    # Return the median run time in milliseconds
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return float(np.median(samples)) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--max-people", type=int, default=500)
+    args = parser.parse_args()
+
+    sizes = [n for n in (2, 5, 10, 25, 50, 100, 150, 250, 500) if n <= args.max_people]
+
+    start = time.perf_counter()
+    ground = GroundPlane((960, 540), GROUND_POINTS, GROUND_METRES)
+    print(f"ground map of 960x540 computed once in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    print(f"{'people':>8} {'loop ms':>10} {'matrix ms':>10} {'kdtree ms':>10} {'pairs':>8} {'metres ms':>10}")
+    for people in sizes:
+        (centroids, distances) = crowd(people)
+        args_ = (centroids, distances, config.MIN_DISTANCE, config.MIN_RADIUS)
+
+        (serious, pairs) = find_violations(*args_)
+        assert serious == pair_loop(*args_)
+
+        loop = timeit(lambda: pair_loop(*args_), max(1, args.repeat // 10))
+        matrix = timeit(lambda: find_violations(*args_, kdtree_min_people=args.max_people + 1), args.repeat)
+        kdtree = timeit(lambda: find_violations(*args_, kdtree_min_people=0), args.repeat)
+
+        # the whole check of a frame with the feet on the floor
+        detections = crowd_detections(centroids, distances)
+        metres = timeit(lambda: flag_violations(detections, config.MIN_DISTANCE_METRES, None, ground), args.repeat)
+
+        print(f"{people:>8} {loop:>10.3f} {matrix:>10.3f} {kdtree:>10.3f} {len(pairs):>8} {metres:>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Core scaling of the camera threads against the camera processes
+
+Usage: python -m benchmarks.workers [--cameras 1 2 4 8] [--frames 60]
+"""
+import argparse
+import os
+import threading
+import time
+
+from benchmarks.common import ensure_weights, synthetic_clip
+from sodistec.contrib.multicapture import DROP_OLDEST, CaptureThread
+from sodistec.core.pipeline import Pipeline
+from sodistec.core.workers import CameraProcess
+
+
+def capture_options(frames: int) -> dict:
+    # keep every frame of the clip, so both modes do the same work
+    return {"policy": DROP_OLDEST, "buffer_size": frames}
+
+
+def threads_mode(cameras: int, clip: str, frames: int) -> list:
+    done = [[] for _ in range(cameras)]
+
+    def camera(camera_id):
+        pipeline = Pipeline(camera_id, False)
+        capture = CaptureThread(clip, **capture_options(frames)).start()
+        while True:
+            captured = capture.next(timeout=5)
+            if captured is None:
+                break
+            pipeline.process(captured.image)
+            done[camera_id].append(time.perf_counter())
+
+    run_threads(camera, cameras)
+    return done
+
+
+def processes_mode(cameras: int, clip: str, frames: int) -> list:
+    done = [[] for _ in range(cameras)]
+    workers = [
+        CameraProcess(clip, i, False, capture_options(frames)).start() for i in range(cameras)
+    ]
+
+    def camera(camera_id):
+        # read the results concurrently, a full result queue drops frames
+        while workers[camera_id].next(timeout=60) is not None:
+            done[camera_id].append(time.perf_counter())
+
+    run_threads(camera, cameras)
+
+    for worker in workers:
+        worker.stop()
+
+    return done
+
+
+def run_threads(target, cameras: int) -> None:
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(cameras)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def fps(done: list) -> float:
+    # steady state throughput, from the first processed frame (so the
+    # process start up and the model loading are not counted)
+    times = sorted(t for camera in done for t in camera)
+    if len(times) < 2:
+        return 0.0
+    return (len(times) - 1) / (times[-1] - times[0])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--cameras", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--frames", type=int, default=60, help="frames of the clip")
+    args = parser.parse_args()
+
+    ensure_weights()
+    clip = synthetic_clip(args.frames, 640, 360)
+
+    print(f"CPU cores: {os.cpu_count()}")
+    print(f"{'cameras':>8} {'threads fps':>12} {'processes fps':>14}")
+    for cameras in args.cameras:
+        results = [fps(mode(cameras, clip, args.frames)) for mode in (threads_mode, processes_mode)]
+
+        print(f"{cameras:>8} {results[0]:>12.2f} {results[1]:>14.2f}")
+
+
+if __name__ == '__main__':
+    main()
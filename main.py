@@ -1,4 +1,5 @@
 import sys
+from multiprocessing import freeze_support
 
 from sodistec.core.gui import WindowApp
 
@@ -18,4 +19,6 @@ def main(argv):
 
 
 if __name__ == '__main__':
+    # Needed by the camera processes in a frozen executable
+    freeze_support()
     main(sys.argv)
@@ -0,0 +1,361 @@
+"""
+Export the yolov4-tiny darknet network to ONNX for the onnxruntime backend
+
+The boxes are decoded in the model, its outputs are the (rows, 85) rows
+of OpenCV dnn. The fp16 and int8 variants are written next to the model,
+int8 needs onnxruntime (calibrated on frames of a video, when given).
+
+Usage: python -m sodistec.apps.export [--size 416] [--precision fp32 fp16 int8]
+                                      [--calibration video.mp4] [-o yolov4-tiny.onnx]
+"""
+import argparse
+import os
+import tempfile
+
+import numpy as np
+
+try:
+    from cv2 import cv2
+except ImportError:
+    import cv2
+
+from sodistec.contrib.yolo import backend as backends
+from sodistec.contrib.yolo import yolo
+from sodistec.core.preprocess import letterbox
+
+OPSET = 13
+IR_VERSION = 7
+
+# Slope of the darknet leaky activation
+LEAKY_SLOPE = 0.1
+
+# Batch normalization epsilon of the OpenCV darknet reader
+BATCHNORM_EPS = 1e-6
+
+# Class scores under this are zeroed, as by the OpenCV yolo layer
+CLASS_THRESH = 0.2
+
+
+def read_cfg(path: str) -> list:
+    # (section, options) of every darknet cfg section, in order
+    sections = []
+    with open(path) as f:
+        for line in f:
+            line = line.split("#")[0].strip()
+            if not line:
+                continue
+            if line.startswith("["):
+                sections.append((line.strip("[]"), {}))
+            else:
+                (key, value) = line.split("=", 1)
+                sections[-1][1][key.strip()] = value.strip()
+
+    return sections
+
+
+def read_weights(path: str):
+    # The float32 values of a darknet weights file, after its header
+    with open(path, "rb") as f:
+        (major, minor, _) = np.fromfile(f, dtype=np.int32, count=3)
+        seen = np.int64 if major * 10 + minor >= 2 else np.int32
+        np.fromfile(f, dtype=seen, count=1)
+
+        return np.fromfile(f, dtype=np.float32)
+
+
+def ints(value: str) -> list:
+    return [int(v) for v in value.split(",")]
+
+
+class GraphBuilder:
+    """
+    ONNX nodes and initializers of the darknet layers, in the float
+    type of the exported precision
+    """
+    def __init__(self, dtype) -> None:
+        self.dtype = dtype
+        self.nodes = []
+        self.initializers = []
+        self._names = 0
+
+    def name(self, prefix: str) -> str:
+        self._names += 1
+        return f"{prefix}_{self._names}"
+
+    def constant(self, value, dtype=None) -> str:
+        from onnx import numpy_helper
+
+        name = self.name("const")
+        self.initializers.append(numpy_helper.from_array(np.asarray(value, dtype=dtype or self.dtype), name))
+        return name
+
+    def add(self, op: str, inputs: list, output: str = None, **attributes) -> str:
+        from onnx import helper
+
+        output = output or self.name(op.lower())
+        self.nodes.append(helper.make_node(op, inputs, [output], **attributes))
+        return output
+
+    def split(self, x: str, sizes: list, axis: int) -> list:
+        from onnx import helper
+
+        outputs = [self.name("split") for _ in sizes]
+        self.nodes.append(helper.make_node("Split", [x, self.constant(sizes, np.int64)], outputs, axis=axis))
+        return outputs
+
+    def convolutional(self, x: str, options: dict, channels: int, weights, offset: int) -> tuple:
+        # Convolution with its batch normalization folded in, return
+        # (output, filters, offset of the next layer weights)
+        filters = int(options["filters"])
+        size = int(options.get("size", 1))
+        stride = int(options.get("stride", 1))
+        padding = size // 2 if int(options.get("pad", 0)) else int(options.get("padding", 0))
+
+        def take(count: int):
+            nonlocal offset
+            values = weights[offset:offset + count]
+            if len(values) != count:
+                raise ValueError("The weights file is too short for the cfg")
+            offset += count
+            return values
+
+        bias = take(filters)
+        if int(options.get("batch_normalize", 0)):
+            (scale, mean, variance) = (take(filters), take(filters), take(filters))
+        kernel = take(filters * channels * size * size).reshape(filters, channels, size, size)
+
+        if int(options.get("batch_normalize", 0)):
+            factor = scale / np.sqrt(variance + BATCHNORM_EPS)
+            kernel = kernel * factor[:, None, None, None]
+            bias = bias - mean * factor
+
+        y = self.add("Conv", [x, self.constant(kernel), self.constant(bias)],
+                     kernel_shape=[size, size], strides=[stride, stride], pads=[padding] * 4)
+
+        activation = options.get("activation", "linear")
+        if activation == "leaky":
+            y = self.add("LeakyRelu", [y], alpha=LEAKY_SLOPE)
+        elif activation != "linear":
+            raise ValueError(f"Darknet activation {activation!r} is not supported")
+
+        return (y, filters, offset)
+
+    def route(self, inputs: list, channels: list, options: dict) -> tuple:
+        # Concatenation of the layers, or one of the groups of their channels
+        (groups, group_id) = (int(options.get("groups", 1)), int(options.get("group_id", 0)))
+
+        parts = []
+        for (x, c) in zip(inputs, channels):
+            if groups > 1:
+                (start, end) = (c // groups * group_id, c // groups * (group_id + 1))
+                x = self.add("Slice", [x, self.constant([start], np.int64), self.constant([end], np.int64),
+                                       self.constant([1], np.int64)])
+            parts.append(x)
+
+        y = parts[0] if len(parts) == 1 else self.add("Concat", parts, axis=1)
+        return (y, sum(channels) // groups)
+
+    def maxpool(self, x: str, options: dict) -> str:
+        size = int(options.get("size", 1))
+        stride = int(options.get("stride", 1))
+        padding = int(options.get("padding", size - 1))
+
+        return self.add("MaxPool", [x], kernel_shape=[size, size], strides=[stride, stride],
+                        pads=[padding // 2, padding // 2, padding - padding // 2, padding - padding // 2])
+
+    def upsample(self, x: str, options: dict) -> str:
+        stride = float(options.get("stride", 2))
+        scales = self.constant([1.0, 1.0, stride, stride], np.float32)
+
+        return self.add("Resize", [x, "", scales], mode="nearest",
+                        coordinate_transformation_mode="asymmetric", nearest_mode="floor")
+
+    def yolo(self, x: str, options: dict, grid: tuple, network_size: tuple, output: str) -> str:
+        # (batch, rows, 85) rows of (centerX, centerY, width, height,
+        # objectness, class scores) relative to the input, the row of
+        # (y, x, anchor) being (y * cols + x) * anchors + anchor
+        mask = ints(options["mask"])
+        anchors = np.array(ints(options["anchors"]), dtype=np.float64).reshape(-1, 2)[mask]
+        classes = int(options["classes"])
+        scale_x_y = float(options.get("scale_x_y", 1))
+        (rows, cols) = grid
+        (count, cells) = (len(mask), rows * cols * len(mask))
+
+        x = self.add("Reshape", [x, self.constant([-1, count, 5 + classes, rows, cols], np.int64)])
+        x = self.add("Transpose", [x], perm=[0, 3, 4, 1, 2])
+        x = self.add("Reshape", [x, self.constant([-1, cells, 5 + classes], np.int64)])
+
+        (xy, wh, objectness, scores) = self.split(x, [2, 2, 1, classes], axis=2)
+
+        (gy, gx, _) = np.meshgrid(np.arange(rows), np.arange(cols), np.arange(count), indexing="ij")
+        cell = np.stack([gx, gy], axis=-1).reshape(1, cells, 2)
+        size = np.array([cols, rows])
+
+        xy = self.add("Mul", [self.add("Sigmoid", [xy]), self.constant(scale_x_y / size)])
+        xy = self.add("Add", [xy, self.constant((cell - (scale_x_y - 1) / 2) / size)])
+
+        anchor = np.tile(anchors / np.array(network_size), (rows * cols, 1)).reshape(1, cells, 2)
+        wh = self.add("Mul", [self.add("Exp", [wh]), self.constant(anchor)])
+
+        objectness = self.add("Sigmoid", [objectness])
+        scores = self.add("Mul", [self.add("Sigmoid", [scores]), objectness])
+        scores = self.add("Where", [self.add("Greater", [scores, self.constant(CLASS_THRESH)]),
+                                    scores, self.constant(0)])
+
+        return self.add("Concat", [xy, wh, objectness, scores], output, axis=2)
+
+
+def build_model(cfg_path: str, weight_path: str, size: int, dtype=np.float32):
+    """
+    ONNX model of a darknet network (convolutional, route, maxpool,
+    upsample and yolo layers) for (batch, 3, size, size) inputs
+    """
+    import onnx
+    from onnx import helper
+
+    sections = read_cfg(cfg_path)
+    (net, layers) = (sections[0][1], sections[1:])
+    weights = read_weights(weight_path)
+
+    graph = GraphBuilder(dtype)
+    elem_type = helper.np_dtype_to_tensor_dtype(np.dtype(dtype))
+
+    (x, channels, stride) = ("input", int(net.get("channels", 3)), 1)
+    (outputs, shapes, offset, results) = ([], [], 0, [])
+
+    for (index, (kind, options)) in enumerate(layers):
+        if kind == "convolutional":
+            (x, channels, offset) = graph.convolutional(x, options, channels, weights, offset)
+            stride *= int(options.get("stride", 1))
+        elif kind == "route":
+            sources = [i if i >= 0 else index + i for i in ints(options["layers"])]
+            (x, channels) = graph.route([outputs[i] for i in sources], [shapes[i][0] for i in sources], options)
+            stride = shapes[sources[0]][1]
+        elif kind == "maxpool":
+            x = graph.maxpool(x, options)
+            stride *= int(options.get("stride", 1))
+        elif kind == "upsample":
+            x = graph.upsample(x, options)
+            stride //= int(options.get("stride", 2))
+        elif kind == "yolo":
+            grid = (size // stride, size // stride)
+            x = graph.yolo(x, options, grid, (size, size), f"yolo_{index}")
+            rows = grid[0] * grid[1] * len(ints(options["mask"]))
+            results.append(helper.make_tensor_value_info(x, elem_type, ["batch", rows, 5 + int(options["classes"])]))
+        else:
+            raise ValueError(f"Darknet layer [{kind}] is not supported")
+
+        outputs.append(x)
+        shapes.append((channels, stride))
+
+    if offset != len(weights):
+        print(f"[WARNING] {len(weights) - offset} values of {weight_path} not used by the cfg")
+
+    model = helper.make_model(
+        helper.make_graph(graph.nodes, "yolov4-tiny",
+                          [helper.make_tensor_value_info("input", elem_type, ["batch", 3, size, size])],
+                          results, graph.initializers),
+        opset_imports=[helper.make_opsetid("", OPSET)],
+        ir_version=IR_VERSION,
+        producer_name="sodistec",
+    )
+    onnx.checker.check_model(model)
+
+    return model
+
+
+def calibration_inputs(size: int, video: str = None, count: int = 16) -> list:
+    # Letterboxed frames of the video, or the gray inputs with noise
+    # the OpenCV int8 network is calibrated on
+    if video is None:
+        blob = np.full((1, 3, size, size), 0.5, dtype=np.float32)
+        blob[:, :, 60:-60, :] = np.random.RandomState(0).rand(3, size - 120, size)
+        return [blob]
+
+    capture = cv2.VideoCapture(video)
+    blobs = []
+    while len(blobs) < count:
+        (grabbed, frame) = capture.read()
+        if not grabbed:
+            break
+        (image, _) = letterbox(frame, size)
+        blobs.append(cv2.dnn.blobFromImage(image, 1 / 255.0, swapRB=True, crop=False))
+    capture.release()
+
+    if not blobs:
+        raise SystemExit(f"Cannot read {video}")
+    return blobs
+
+
+def quantize(source: str, path: str, blobs: list) -> None:
+    # Static int8 quantization of the convolutions, the box decoding
+    # stays in float
+    from onnxruntime import quantization
+
+    # shapes inferred and the graph optimized first, as onnxruntime advises
+    with tempfile.TemporaryDirectory() as folder:
+        prepared = os.path.join(folder, "prepared.onnx")
+        quantization.quant_pre_process(source, prepared, skip_symbolic_shape=True)
+        _quantize_static(prepared, path, blobs)
+
+
+def _quantize_static(source: str, path: str, blobs: list) -> None:
+    from onnxruntime import quantization
+
+    class Reader(quantization.CalibrationDataReader):
+        def __init__(self) -> None:
+            self.blobs = iter(blobs)
+
+        def get_next(self):
+            blob = next(self.blobs, None)
+            return None if blob is None else {"input": blob}
+
+    quantization.quantize_static(
+        source, path, Reader(),
+        quant_format=quantization.QuantFormat.QDQ,
+        op_types_to_quantize=["Conv"],
+        per_channel=True,
+        weight_type=quantization.QuantType.QInt8,
+        activation_type=quantization.QuantType.QUInt8,
+    )
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--size", type=int, default=416, help="network input size, a multiple of 32")
+    parser.add_argument("--precision", nargs="+", choices=backends.PRECISIONS, default=["fp32"])
+    parser.add_argument("--calibration", help="video whose first frames calibrate the int8 model")
+    parser.add_argument("--weights", default=yolo.YOLO4_MINI_WEIGHT_PATH)
+    parser.add_argument("-o", "--output", default=yolo.YOLO4_MINI_ONNX_PATH)
+    args = parser.parse_args(argv)
+
+    if args.size % 32:
+        raise SystemExit(f"--size must be a multiple of 32, got {args.size}")
+    if not os.path.exists(args.weights):
+        raise SystemExit(f"{args.weights} not found")
+
+    yolo.YOLO4_MINI_ONNX_PATH = args.output
+
+    # int8 is quantized from the fp32 model
+    for precision in sorted(set(args.precision), key=backends.PRECISIONS.index):
+        path = backends.onnx_model_path(precision)
+
+        if precision == "int8":
+            source = backends.onnx_model_path("fp32")
+            if not os.path.exists(source):
+                raise SystemExit(f"int8 is quantized from {source}, export fp32 first")
+
+            quantize(source, path, calibration_inputs(args.size, args.calibration))
+        else:
+            import onnx
+            dtype = np.float16 if precision == "fp16" else np.float32
+            onnx.save(build_model(yolo.YOLO4_MINI_CONFIG_PATH, args.weights, args.size, dtype), path)
+
+        print(f"[INFO] {precision} model written to {path}")
+
+    print(f"[INFO] Compare the backends with: python -m benchmarks.backends --onnx {args.output} "
+          f"--size {args.size}")
+
+
+if __name__ == '__main__':
+    main()
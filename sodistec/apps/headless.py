@@ -0,0 +1,231 @@
+"""
+Run the detection without the GUI over video files or streams
+
+Usage: python -m sodistec.apps.headless INPUT [INPUT ...] -o results.jsonl
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    from cv2 import cv2
+except ImportError:
+    import cv2
+
+from sodistec.apps import config
+from sodistec.contrib.server import MonitorServer
+from sodistec.core.engine import InferenceEngine
+from sodistec.core.history import HistoryStore
+from sodistec.core.pipeline import FrameResult, Pipeline
+from sodistec.core.replay import DetectionLog
+from sodistec.core.stats import StatsDumper, make_stats
+
+CSV_FIELDS = [
+    "camera_id", "source", "frame", "timestamp", "people", "violations", "boxes", "pairs",
+    "track_ids", "unique_people",
+]
+
+
+def to_int(word: str):
+    # "0" is a webcam index, anything else a file or an URL
+    try:
+        return int(word)
+    except ValueError:
+        return word
+
+
+class ResultWriter:
+    """
+    Thread safe writer of the per frame results as JSON lines or CSV
+    """
+    def __init__(self, path: str, output_format: str = None) -> None:
+        if output_format is None:
+            output_format = "csv" if path.endswith(".csv") else "jsonl"
+
+        self.output_format = output_format
+        self.file = sys.stdout if path == "-" else open(path, "w", newline="")
+        self.lock = threading.Lock()
+
+        if self.output_format == "csv":
+            self.csv = csv.DictWriter(self.file, fieldnames=CSV_FIELDS)
+            self.csv.writeheader()
+
+    def write(self, camera_id: int, source, index: int, timestamp: float, result: FrameResult) -> None:
+        row = {
+            "camera_id": camera_id,
+            "source": str(source),
+            "frame": index,
+            "timestamp": round(timestamp, 3),
+            "people": result.total_people,
+            "violations": result.total_serious_violations,
+            "boxes": result.detections.boxes.tolist(),
+            "pairs": result.pairs.tolist(),
+            "track_ids": result.track_ids,
+            "unique_people": result.unique_people,
+        }
+
+        with self.lock:
+            if self.output_format == "csv":
+                row["boxes"] = json.dumps(row["boxes"])
+                row["pairs"] = json.dumps(row["pairs"])
+                row["track_ids"] = json.dumps(row["track_ids"])
+                self.csv.writerow(row)
+            else:
+                self.file.write(json.dumps(row) + "\n")
+
+    def close(self) -> None:
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+def process_source(camera_id: int,
+                   source,
+                   pipeline: Pipeline,
+                   writer: ResultWriter,
+                   stats: dict,
+                   max_frames: int = None,
+                   history: HistoryStore = None,
+                   server: MonitorServer = None,
+                   ) -> None:
+    capture = cv2.VideoCapture(source)
+    if not capture.isOpened():
+        print(f"[ERROR] Cannot open {source}", file=sys.stderr)
+        return
+
+    index = 0
+    start = time.perf_counter()
+
+    # read every frame, as fast as the detection allows
+    while max_frames is None or index < max_frames:
+        (grabbed, frame) = capture.read()
+        if not grabbed:
+            break
+
+        timestamp = capture.get(cv2.CAP_PROP_POS_MSEC) / 1000
+        # the frames are only drawn for the streams
+        result = pipeline.process(frame, draw=server is not None)
+        pipeline.stats.frame()
+        writer.write(camera_id, source, index, timestamp, result)
+        if history is not None:
+            history.record(camera_id, result)
+        if server is not None:
+            server.publish(camera_id, result)
+
+        index += 1
+
+    capture.release()
+
+    skipped = pipeline.motion_gate.skipped if pipeline.motion_gate is not None else 0
+    stats[camera_id] = (index, time.perf_counter() - start, skipped)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("inputs", nargs="+", help="video files or stream URLs, 0 for a webcam")
+    parser.add_argument("-o", "--output", default="-", help="output file, - for stdout")
+    parser.add_argument("-f", "--format", choices=["jsonl", "csv"], help="output format (default: from the file name)")
+    parser.add_argument("--max-frames", type=int, help="stop every input after this many frames")
+    parser.add_argument("--gpu", action="store_true", default=False, help="use the CUDA backend")
+    parser.add_argument("--stats-dump", help="append per stage statistics as JSON lines to this file")
+    parser.add_argument("--network-size", type=lambda v: v if v == "auto" else int(v),
+        help="network input size (320, 416, 512, 608) or auto")
+    parser.add_argument("--record-detections", metavar="DIR",
+        help="record the detector candidates in DIR/cameraN for sodistec.apps.tune")
+    parser.add_argument("--record-min-conf", type=float, default=0.05,
+        help="lowest confidence recorded, the lowest MIN_CONF that can be tuned")
+    parser.add_argument("--history", metavar="PATH",
+        help="keep the statistics of every camera over time in this SQLite database")
+    parser.add_argument("--serve", metavar="[HOST:]PORT",
+        help="serve the metrics (/metrics) and the annotated feeds (/camera/N) over HTTP")
+    args = parser.parse_args(argv)
+
+    if args.network_size is not None:
+        config.NETWORK_SIZE = args.network_size
+
+    inputs = list(map(to_int, args.inputs))
+
+    # batch every input in one network when there is more than one
+    engine = None
+    if config.USE_SHARED_ENGINE and len(inputs) > 1:
+        engine = InferenceEngine(use_gpu=args.gpu).start()
+
+    writer = ResultWriter(args.output, args.format)
+    stats = {}
+
+    cameras_stats = [make_stats(camera_id) for camera_id in range(len(inputs))]
+    dumper = None
+    if args.stats_dump:
+        dumper = StatsDumper(cameras_stats, args.stats_dump).start()
+
+    history = None
+    if args.history:
+        history = HistoryStore(args.history).start()
+
+    server = None
+    if args.serve:
+        (host, _, port) = args.serve.rpartition(":")
+        server = MonitorServer(host or config.SERVER_HOST, int(port))
+        for (camera_id, camera_stats) in enumerate(cameras_stats):
+            server.register(camera_id, camera_stats.snapshot)
+        server.start()
+
+    (threads, pipelines) = ([], [])
+    start = time.perf_counter()
+    for (camera_id, source) in enumerate(inputs):
+        pipeline = Pipeline(camera_id, args.gpu, engine, cameras_stats[camera_id])
+        if args.record_detections:
+            pipeline.detection_log = DetectionLog(
+                os.path.join(args.record_detections, f"camera{camera_id + 1}"), args.record_min_conf, str(source),
+                pipeline.regions, pipeline.ground,
+            )
+
+        pipelines.append(pipeline)
+        t = threading.Thread(
+            target=process_source,
+            args=(camera_id, source, pipeline, writer, stats, args.max_frames, history, server),
+        )
+        t.start()
+        threads.append(t)
+
+    for t in threads:
+        t.join()
+
+    elapsed = time.perf_counter() - start
+    writer.close()
+
+    for pipeline in pipelines:
+        if pipeline.detection_log is not None:
+            pipeline.detection_log.close()
+
+    if engine is not None:
+        engine.stop()
+
+    if dumper is not None:
+        dumper.stop()
+        dumper.dump()
+
+    if history is not None:
+        history.stop()
+
+    if server is not None:
+        server.stop()
+
+    # report the throughput
+    for (camera_id, source) in enumerate(inputs):
+        if camera_id not in stats:
+            continue
+
+        (frames, seconds, skipped) = stats[camera_id]
+        print(f"[INFO] {source}: {frames} frames in {seconds:.2f}s ({frames / max(seconds, 1e-9):.2f} FPS), "
+              f"{skipped} inferences skipped", file=sys.stderr)
+
+    total = sum(frames for (frames, _, _) in stats.values())
+    print(f"[INFO] Total: {total} frames in {elapsed:.2f}s ({total / max(elapsed, 1e-9):.2f} FPS)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
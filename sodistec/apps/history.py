@@ -0,0 +1,56 @@
+"""
+Show the statistics kept in the history database per minute, hour or day
+
+Usage: python -m sodistec.apps.history history.sqlite3 --period day --days 30 [--camera 1] [--alerts]
+"""
+import argparse
+import json
+import time
+
+from sodistec.apps import config
+from sodistec.core.history import PERIODS, HistoryStore
+
+TIME_FORMATS = {"minute": "%Y-%m-%d %H:%M", "hour": "%Y-%m-%d %H:00", "day": "%Y-%m-%d"}
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("path", nargs="?", default=config.HISTORY_PATH, help="history database")
+    parser.add_argument("--period", choices=list(PERIODS), default="hour")
+    parser.add_argument("--days", type=float, default=1.0, help="show the last days")
+    parser.add_argument("--camera", type=int, help="camera number (from 1), every camera by default")
+    parser.add_argument("--alerts", action="store_true", default=False,
+        help="only the periods with at least THERESHOLD violation events")
+    parser.add_argument("--threshold", type=int, default=config.THERESHOLD)
+    parser.add_argument("--json", action="store_true", default=False, help="print JSON lines")
+    args = parser.parse_args(argv)
+
+    if not args.path:
+        parser.error("no database given and HISTORY_PATH is not set")
+
+    store = HistoryStore(args.path, threshold=args.threshold)
+    start = time.time() - args.days * 86400
+    camera_id = args.camera - 1 if args.camera is not None else None
+
+    if args.alerts:
+        rows = store.alerts(args.period, start, camera_id=camera_id)
+    else:
+        rows = store.rollup(args.period, start, camera_id=camera_id)
+
+    if args.json:
+        for row in rows:
+            print(json.dumps(row))
+        return
+
+    print(f"{'time':>16} {'camera':>6} {'people':>7} {'peak':>5} {'violators':>10} {'peak':>5} "
+          f"{'frames w/ viol.':>16} {'events':>7} {'fps':>6}")
+
+    for row in rows:
+        when = time.strftime(TIME_FORMATS[args.period], time.localtime(row["start"]))
+        print(f"{when:>16} {row['camera_id'] + 1:>6} {row['people']:>7.2f} {row['peak_people']:>5} "
+              f"{row['violators']:>10.2f} {row['peak_violators']:>5} {row['violation_frames']:>16.1%} "
+              f"{row['violation_events']:>7} {row['fps']:>6.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Sweep the detection settings over recorded detector candidates, without
+running the network again
+
+Record the candidates first:
+
+    python -m sodistec.apps.headless site.mp4 -o /dev/null --record-detections recorded
+
+Usage: python -m sodistec.apps.tune recorded/camera1 --min-distance 150 200 250 --min-radius 60 80
+
+The cameras calibrated on the ground plane are checked in metres,
+with --min-distance-metres instead.
+"""
+import argparse
+import json
+import sys
+
+from sodistec.apps import config
+from sodistec.core.replay import DetectionRecording, sweep
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("recordings", nargs="+", help="directories written by --record-detections")
+    parser.add_argument("--min-conf", type=float, nargs="+", default=[config.MIN_CONF])
+    parser.add_argument("--nms-thresh", type=float, nargs="+", default=[config.NMS_THRESH])
+    parser.add_argument("--min-distance", type=float, nargs="+", default=[config.MIN_DISTANCE])
+    parser.add_argument("--min-radius", type=float, nargs="+", default=[config.MIN_RADIUS])
+    parser.add_argument("--min-distance-metres", type=float, nargs="+", default=[config.MIN_DISTANCE_METRES],
+        help="for the calibrated cameras")
+    parser.add_argument("-o", "--output", help="also write the results as JSON lines to this file")
+    args = parser.parse_args(argv)
+
+    output = open(args.output, "w") if args.output else None
+
+    for path in args.recordings:
+        recording = DetectionRecording(path)
+        print(f"{path}: {len(recording)} frames of {recording.meta.get('source')}")
+
+        try:
+            results = sweep(recording, args.min_conf, args.nms_thresh, args.min_distance, args.min_radius,
+                            args.min_distance_metres)
+        except ValueError as e:
+            print(f"[ERROR] {path}: {e}", file=sys.stderr)
+            continue
+
+        if recording.ground is not None:
+            distance_header = f"{'METRES':>9} {'':>7}"
+        else:
+            distance_header = f"{'DISTANCE':>9} {'RADIUS':>7}"
+
+        print(f"{'MIN_CONF':>9} {'NMS':>5} {distance_header} {'people':>7} {'violators':>10} "
+              f"{'rate':>6} {'frames w/ viol.':>16} {'replay fps':>11}")
+
+        for (settings, summary) in results:
+            if recording.ground is not None:
+                distance = f"{settings['MIN_DISTANCE_METRES']:>9.2f} {'':>7}"
+            else:
+                distance = f"{settings['MIN_DISTANCE']:>9.0f} {settings['MIN_RADIUS']:>7.0f}"
+
+            print(f"{settings['MIN_CONF']:>9.2f} {settings['NMS_THRESH']:>5.2f} {distance} "
+                  f"{summary['people']:>7.2f} {summary['violators']:>10.2f} "
+                  f"{summary['violation_rate']:>6.1%} {summary['violation_frames']:>16.1%} {summary['fps']:>11.0f}")
+
+            if output is not None:
+                output.write(json.dumps({"recording": path, **settings, **summary}) + "\n")
+
+    if output is not None:
+        output.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+import io
+import os
+import queue
+import threading
+import time
+import wave
+from collections import deque
+
+from sodistec.apps import config
+from sodistec.contrib.mail import Mailer
+
+BUZZER_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "core", "buzzer.wav")
+
+
+class Buzzer:
+    """
+    The buzzer sound, read and decoded once: played from memory with
+    winsound (Windows) or simpleaudio (`pip install simpleaudio`), without
+    them playsound is used and reads the file again on every alert
+    """
+    def __init__(self, path: str = BUZZER_PATH) -> None:
+        self.path = path
+
+        with open(path, "rb") as f:
+            self.data = f.read()
+
+        # PCM samples and format for simpleaudio, None when
+        # the file is not a PCM wav
+        try:
+            with wave.open(io.BytesIO(self.data)) as w:
+                self.samples = w.readframes(w.getnframes())
+                self.format = (w.getnchannels(), w.getsampwidth(), w.getframerate())
+        except (wave.Error, EOFError):
+            (self.samples, self.format) = (None, None)
+
+    def play(self) -> None:
+        try:
+            import winsound
+        except ImportError:
+            winsound = None
+
+        if winsound is not None:
+            winsound.PlaySound(self.data, winsound.SND_MEMORY)
+            return
+
+        try:
+            import simpleaudio
+        except ImportError:
+            simpleaudio = None
+
+        if self.samples is None:
+            simpleaudio = None
+
+        if simpleaudio is not None:
+            simpleaudio.play_buffer(self.samples, *self.format).wait_done()
+        else:
+            # playsound only plays files
+            from playsound import playsound
+            playsound(self.path)
+
+
+class Alert:
+    __slots__ = ("camera_id", "violations", "people", "timestamp")
+
+    def __init__(self, camera_id: int, violations: int, people: int, timestamp: float) -> None:
+        self.camera_id = camera_id
+        self.violations = violations
+        self.people = people
+        self.timestamp = timestamp
+
+
+class AlertDispatcher:
+    """
+    Single worker for the alerts of every camera: debounced and rate limited
+    per camera, play the buzzer and send the email digests, notify() never
+    blocks the detection
+    """
+    def __init__(self,
+                 play_buzzer: bool = config.PLAY_BUZZER,
+                 send_mail: bool = config.SEND_MAIL,
+                 debounce: float = config.ALERT_DEBOUNCE,
+                 max_per_minute: int = config.ALERT_MAX_PER_MINUTE,
+                 digest_interval: float = config.MAIL_DIGEST_INTERVAL,
+                 mail_to: str = config.MAIL_TO,
+                 mailer: Mailer = None,
+                 ) -> None:
+
+        self.play_buzzer = play_buzzer
+        self.send_mail = send_mail and bool(mail_to)
+        self.debounce = debounce
+        self.max_per_minute = max_per_minute
+        self.digest_interval = digest_interval
+        self.mail_to = mail_to
+
+        self.buzzer = Buzzer() if play_buzzer else None
+        self.mailer = mailer if mailer is not None else (Mailer() if self.send_mail else None)
+
+        self.queue = queue.Queue(maxsize=100)
+
+        # Last alert time and the recent alerts of every camera
+        self.last_alert = {}
+        self.recent = {}
+
+        # Alerts waiting for the next email digest
+        self.digest = []
+        self.last_digest = time.monotonic()
+
+        # Number of alerts handled and dropped (debounce, rate limit, full queue)
+        self.sent = 0
+        self.dropped = 0
+
+        self.stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._update)
+        self._thread.daemon = True
+        self._thread.start()
+
+        return self
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self.stopped.set()
+
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+            # the worker sends what is left before it exits
+            if self._thread.is_alive():
+                print(f"[WARNING] Alerts still being sent after {timeout} s, left to the alert worker")
+                return
+
+        self._finish()
+
+    def notify(self, camera_id: int, violations: int, people: int = 0) -> bool:
+        """
+        Report the violations of a camera frame, return False when the
+        alert was dropped
+        """
+        now = time.monotonic()
+
+        if now - self.last_alert.get(camera_id, float("-inf")) < self.debounce:
+            self.dropped += 1
+            return False
+
+        self.last_alert[camera_id] = now
+
+        try:
+            self.queue.put_nowait(Alert(camera_id, violations, people, time.time()))
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+        return True
+
+    def _allowed(self, alert: Alert) -> bool:
+        # At most `max_per_minute` alerts of a camera in any minute
+        recent = self.recent.setdefault(alert.camera_id, deque())
+        now = time.monotonic()
+
+        while recent and now - recent[0] >= 60:
+            recent.popleft()
+
+        if len(recent) >= self.max_per_minute:
+            return False
+
+        recent.append(now)
+        return True
+
+    def _handle(self, alert: Alert, play: bool = True) -> None:
+        if not self._allowed(alert):
+            self.dropped += 1
+            return
+
+        self.sent += 1
+
+        if self.send_mail:
+            self.digest.append(alert)
+
+        if play and self.buzzer is not None:
+            try:
+                self.buzzer.play() # PLAY SOUND!!
+            except Exception as e:
+                print(f"[ERROR] Cannot play the buzzer: {e}")
+
+    def _flush_digest(self) -> None:
+        self.last_digest = time.monotonic()
+
+        if not self.digest or self.mailer is None:
+            return
+
+        (alerts, self.digest) = (self.digest, [])
+
+        lines = [
+            f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(a.timestamp))} - "
+            f"Camera {a.camera_id + 1}: {a.violations} pelanggar dari {a.people} orang"
+            for a in alerts
+        ]
+        body = "Pelanggaran Protokol Kesehatan!\n\n" + "\n".join(lines)
+
+        self.mailer.send(self.mail_to, body, f"Pelanggaran Protokol Kesehatan ({len(alerts)})")
+
+    def _update(self) -> None:
+        while not self.stopped.is_set():
+            timeout = max(0.1, self.last_digest + self.digest_interval - time.monotonic())
+
+            try:
+                self._handle(self.queue.get(timeout=min(timeout, 0.5)))
+            except queue.Empty:
+                pass
+
+            if time.monotonic() - self.last_digest >= self.digest_interval:
+                self._flush_digest()
+
+        self._finish()
+
+    def _finish(self) -> None:
+        # The alerts still queued go in the last digest, without the
+        # buzzer, which is sent before the connection is closed
+        while True:
+            try:
+                self._handle(self.queue.get_nowait(), play=False)
+            except queue.Empty:
+                break
+
+        self._flush_digest()
+
+        if self.mailer is not None:
+            self.mailer.close()
@@ -1,25 +1,89 @@
 import smtplib
+import socket
+from email.message import EmailMessage
+
+from sodistec.apps import config
+
 
 class Mailer:
     """
-    Sending email when violation accourd
+    Sending email when violation accourd, the connection is opened on the
+    first mail and reused for the next ones
     """
-    def __init__(self) -> None:
+    def __init__(self,
+                 host: str = config.MAIL_HOST,
+                 port: int = config.MAIL_PORT,
+                 email_address: str = config.MAIL_ADDRESS,
+                 password: str = config.MAIL_PASSWORD,
+                 use_ssl: bool = config.MAIL_USE_SSL,
+                 timeout: float = 10.0,
+                 ) -> None:
         # Set email for mail author
-        self.email_address = ""
-        self.password = ""
+        self.email_address = email_address
+        self.password = password
+
+        self.HOST = host
+        self.PORT = port
+        self.use_ssl = use_ssl
+        self.timeout = timeout
 
-        self.PORT = 465
-        self.server = smtplib.SMTP_SSL("smtp.gmail.com", self.PORT)
+        self.server = None
 
-    def send(self, to_mail: str):
+    def _connect(self) -> None:
+        if self.use_ssl:
+            self.server = smtplib.SMTP_SSL(self.HOST, self.PORT, timeout=self.timeout)
+        else:
+            self.server = smtplib.SMTP(self.HOST, self.PORT, timeout=self.timeout)
+
+        # Login to the mail provider, a connection
+        # not logged in is not kept for the next mail
+        if self.password:
+            try:
+                self.server.login(self.email_address, self.password)
+            except (smtplib.SMTPException, OSError):
+                self.close()
+                raise
+
+    def send(self, to_mail: str, body: str = "Pelanggaran Protokol Kesehatan!",
+             subject: str = "Pelanggaran Protokol Kesehatan") -> bool:
         # Send an email and return true if success,
         # otherwise false
+        message = EmailMessage()
+        message["From"] = self.email_address
+        message["To"] = to_mail
+        message["Subject"] = subject
+        message.set_content(body)
+
+        # Reconnect once if the server closed the connection meanwhile,
+        # the other errors (login, refused recipient...) are not retried,
+        # SMTPException being an OSError it is caught after them
+        for attempt in range(2):
+            try:
+                if self.server is None:
+                    self._connect()
 
-        # Login to the mail provider
-        self.server.login(self.email_address, self.password)
+                # Sending the email
+                self.server.send_message(message)
+                return True
+            except (smtplib.SMTPServerDisconnected, ConnectionError, socket.timeout) as e:
+                self.server = None
+                if attempt == 1:
+                    print(f"[ERROR] Cannot send email: {e}")
+            except smtplib.SMTPException as e:
+                print(f"[ERROR] Cannot send email: {e}")
+                return False
+            except OSError as e:
+                # e.g. the host can not be resolved
+                self.close()
+                print(f"[ERROR] Cannot send email: {e}")
+                return False
 
-        # Sending the email
-        self.server.sendmail(self.email_address, to_mail, "Pelanggaran Protokol Kesehatan!")
-        self.server.quit()
+        return False
 
+    def close(self) -> None:
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.server = None
@@ -1,45 +1,312 @@
+import os
 import threading
-from multiprocessing import Process, Pool
+import time
+from collections import deque
 
 try:
     from cv2 import cv2
 except ImportError:
     import cv2
 
+from sodistec.apps import config
+
+# Frame policies, which frame is given to the consumer
+LATEST = "latest"
+DROP_OLDEST = "drop-oldest"
+
+# Decode modes, retrieve every grabbed frame or only
+# the ones a consumer is waiting for
+DECODE_ALL = "all"
+DECODE_ON_DEMAND = "on-demand"
+
+# Capture properties this OpenCV build does not have, warned about once
+_missing_properties = set()
+
+
+def capture_property(name: str):
+    """
+    cv2.<name>, None when this OpenCV build does not have it, e.g. the
+    timeouts and thread count of the pinned 4.5.4
+    """
+    value = getattr(cv2, name, None)
+    if value is None and name not in _missing_properties:
+        _missing_properties.add(name)
+        print(f"[WARNING] {name} is not available in OpenCV {cv2.__version__}, ignored")
+
+    return value
+
+
+class Frame:
+    """
+    A captured frame with its number and capture time
+    """
+    __slots__ = ("sequence", "timestamp", "image")
+
+    def __init__(self, sequence: int, timestamp: float, image) -> None:
+        self.sequence = sequence
+        self.timestamp = timestamp
+        self.image = image
+
+
 class CaptureThread:
-    def __init__(self, input_name) -> None:
+    """
+    Read a video feed in a background thread into a small ring of frames,
+    reconnect (with exponential backoff) when a stream is lost
+    """
+    def __init__(self,
+                 input_name,
+                 policy: str = config.CAPTURE_POLICY,
+                 buffer_size: int = config.CAPTURE_BUFFER,
+                 reconnect_delay: float = config.CAPTURE_RECONNECT_DELAY,
+                 max_reconnect_delay: float = config.CAPTURE_RECONNECT_MAX_DELAY,
+                 open_timeout: float = config.CAPTURE_OPEN_TIMEOUT,
+                 decode: str = config.CAPTURE_DECODE,
+                 threads: int = config.CAPTURE_THREADS,
+                 hw_acceleration: bool = config.CAPTURE_HW_ACCELERATION,
+                 backend_buffer: int = config.CAPTURE_BACKEND_BUFFER,
+                 size: tuple = config.CAPTURE_SIZE,
+                 realtime: bool = False,
+                 ) -> None:
+
+        if policy not in (LATEST, DROP_OLDEST):
+            raise ValueError(f"Unknown capture policy: {policy}")
+        if decode not in (DECODE_ALL, DECODE_ON_DEMAND):
+            raise ValueError(f"Unknown decode mode: {decode}")
+
+        self.input_name = input_name
+        self.policy = policy
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.open_timeout = open_timeout
+
+        # every frame is needed in order with the drop-oldest policy
+        self.on_demand = decode == DECODE_ON_DEMAND and policy == LATEST
+
+        # OpenCV / FFmpeg decoder options
+        self.threads = threads
+        self.hw_acceleration = hw_acceleration
+        self.backend_buffer = backend_buffer
+        self.size = size
 
-        self.capture = cv2.VideoCapture(input_name)
-        self.capture.set(cv2.CAP_PROP_BUFFERSIZE, 3)
+        # Read a video file at its frame rate, as a live camera
+        self.realtime = realtime
+        self.fps = 25.0
 
-        (self.grabed, self.frame) = self.capture.read()
+        # A local file ends, a stream (or webcam) is reconnected
+        self.is_file = isinstance(input_name, str) and os.path.isfile(input_name)
 
-        self.stopped = False
+        self.capture = None
+        self.frames = deque(maxlen=max(1, buffer_size))
+        self.condition = threading.Condition()
+
+        # Number of the last captured and the last consumed frame
+        self.sequence = 0
+        self.last_read = 0
+
+        # Frames grabbed from the stream and frames never retrieved
+        # (converted to an image) since nobody was waiting for them
+        self.grabbed = 0
+        self.skipped = 0
+
+        # Consumers waiting, time of the last request and mean time
+        # between two requests, to retrieve the frame before it is asked
+        self.waiting = 0
+        self.last_request = 0.0
+        self.request_period = 0.0
+
+        self.connected = False
+        self.ended = False
+
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def stopped(self) -> bool:
+        return self._stop_event.is_set()
+
+    @property
+    def timestamp(self) -> float:
+        with self.condition:
+            return self.frames[-1].timestamp if self.frames else time.perf_counter()
 
     def start(self):
         # Create and start threading
-        t = threading.Thread(target=self._update)
-        t.daemon = True
-        t.start()
-
-        # Or process?
-        # TODO: try using multiprocessing
-        #  p = Pool()
-        #  p.imap(self._update, self.frame)
-        
+        self._thread = threading.Thread(target=self._update)
+        self._thread.daemon = True
+        self._thread.start()
+
         return self
 
-    def _stop(self) -> None:
-        self.stopped = True
+    def stop(self, timeout: float = 2.0) -> None:
+        self._stop_event.set()
 
-    def _update(self):
-        while True:
+        with self.condition:
+            self.condition.notify_all()
 
-            if self.stopped:
-                break
-            (self.grabed, self.frame) = self.capture.read()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
 
-    def read(self):
-        return self.frame
+    release = stop
+
+    def _open_params(self) -> list:
+        # Options given to the backend when opening the feed
+        options = []
+
+        if isinstance(self.input_name, str) and not self.is_file and self.open_timeout > 0:
+            # a stream not answering does not hold the thread forever
+            timeout = int(self.open_timeout * 1000)
+            options += [("CAP_PROP_OPEN_TIMEOUT_MSEC", timeout), ("CAP_PROP_READ_TIMEOUT_MSEC", timeout)]
+
+        if self.threads > 0:
+            options += [("CAP_PROP_N_THREADS", self.threads)]
+
+        if self.hw_acceleration:
+            options += [("CAP_PROP_HW_ACCELERATION", capture_property("VIDEO_ACCELERATION_ANY"))]
+
+        params = []
+        for (name, value) in options:
+            prop = capture_property(name)
+            if prop is not None and value is not None:
+                params += [prop, value]
+
+        return params
 
+    def _open(self) -> bool:
+        params = self._open_params()
+        if params:
+            self.capture = cv2.VideoCapture(self.input_name, cv2.CAP_ANY, params)
+        else:
+            self.capture = cv2.VideoCapture(self.input_name)
 
+        self.capture.set(cv2.CAP_PROP_BUFFERSIZE, self.backend_buffer)
+
+        # ask the camera for a smaller resolution, only cameras
+        # with several modes (e.g. webcams) follow it
+        if self.size is not None:
+            self.capture.set(cv2.CAP_PROP_FRAME_WIDTH, self.size[0])
+            self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT, self.size[1])
+
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS) or 25.0
+
+        return self.capture.isOpened()
+
+    def _close(self) -> None:
+        self.connected = False
+
+        if self.capture is not None:
+            self.capture.release()
+            self.capture = None
+
+    def _put(self, image) -> None:
+        with self.condition:
+            self.sequence += 1
+            self.frames.append(Frame(self.sequence, time.perf_counter(), image))
+            self.condition.notify_all()
+
+    def _end(self) -> None:
+        with self.condition:
+            self.ended = True
+            self.condition.notify_all()
+
+    def _wanted(self) -> bool:
+        # a frame is retrieved when a consumer waits for one, or when the
+        # next request is expected before the next frame is grabbed
+        if not self.on_demand or self.waiting > 0:
+            return True
+
+        return time.perf_counter() + 1 / self.fps >= self.last_request + self.request_period
+
+    def _update(self) -> None:
+        delay = self.reconnect_delay
+        (started, frames) = (None, 0)
+
+        while not self.stopped:
+            if not self.connected:
+                self.connected = self._open()
+
+                if not self.connected:
+                    if self.is_file:
+                        print(f"[ERROR] Cannot open {self.input_name}")
+                        self._end()
+                        break
+
+                    print(f"[WARNING] Cannot open {self.input_name}, retrying in {delay:.1f}s")
+                    self._close()
+                    self._stop_event.wait(delay)
+                    delay = min(delay * 2, self.max_reconnect_delay)
+                    continue
+
+                (started, frames) = (time.perf_counter(), 0)
+
+            # keep the stream drained, the frame is only
+            # decoded into an image when somebody needs it
+            grabbed = self.capture.grab()
+
+            if not grabbed:
+                # end of the video file
+                if self.is_file:
+                    self._end()
+                    break
+
+                print(f"[WARNING] Lost {self.input_name}, reconnecting in {delay:.1f}s")
+                self._close()
+                self._stop_event.wait(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+                continue
+
+            delay = self.reconnect_delay
+            self.grabbed += 1
+            frames += 1
+
+            if self._wanted():
+                (retrieved, image) = self.capture.retrieve()
+                if retrieved:
+                    self._put(image)
+            else:
+                self.skipped += 1
+
+            if self.realtime and self.is_file:
+                self._stop_event.wait(max(0.0, started + frames / self.fps - time.perf_counter()))
+
+        self._close()
+
+    def _available(self) -> bool:
+        return bool(self.frames) and self.frames[-1].sequence > self.last_read
+
+    def next(self, timeout: float = None):
+        """
+        Block until a frame not read yet is available and return it, return
+        None on timeout or when the capture is stopped or ended
+        """
+        with self.condition:
+            now = time.perf_counter()
+            if self.last_request:
+                self.request_period = 0.8 * self.request_period + 0.2 * (now - self.last_request)
+            self.last_request = now
+
+            self.waiting += 1
+            try:
+                ready = self.condition.wait_for(
+                    lambda: self._available() or self.stopped or self.ended, timeout
+                )
+            finally:
+                self.waiting -= 1
+
+            if not ready or not self._available():
+                return None
+
+            if self.policy == LATEST:
+                frame = self.frames[-1]
+            else:
+                # oldest frame not read yet
+                while self.frames[0].sequence <= self.last_read:
+                    self.frames.popleft()
+                frame = self.frames.popleft()
+
+            self.last_read = frame.sequence
+            return frame
+
+    def read(self):
+        # Latest image without waiting, None if nothing was captured yet
+        with self.condition:
+            return self.frames[-1].image if self.frames else None
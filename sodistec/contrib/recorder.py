@@ -0,0 +1,317 @@
+import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+
+try:
+    from cv2 import cv2
+except ImportError:
+    import cv2
+
+from sodistec.apps import config
+from sodistec.core.stats import percentiles
+
+# Extension of the clips
+CLIP_EXTENSION = ".mp4"
+
+# Name of the clips written by the recorder, camera1-20240131-235959-123.mp4,
+# only these files count in the disk quota and are deleted to make room
+CLIP_NAME = re.compile(r"camera\d+-\d{8}-\d{6}-\d{3}" + re.escape(CLIP_EXTENSION))
+
+
+class _Clip:
+    __slots__ = ("camera_id", "frames", "started", "until", "submitted")
+
+    def __init__(self, camera_id: int, frames: list, started: float, until: float) -> None:
+        self.camera_id = camera_id
+        self.frames = frames
+        self.started = started
+        self.until = until
+        self.submitted = None
+
+
+class _CameraState:
+    __slots__ = ("ring", "clip", "last_frame", "clips", "dropped_clips", "dropped_frames")
+
+    def __init__(self, size: int) -> None:
+        # JPEG frames of the last seconds and the clip being recorded
+        self.ring = deque(maxlen=size)
+        self.clip = None
+        self.last_frame = float("-inf")
+
+        self.clips = 0
+        self.dropped_clips = 0
+        self.dropped_frames = 0
+
+
+class ClipRecorder:
+    """
+    Save a clip of the annotated frames around every violation: each camera
+    keeps the last seconds as JPEG in memory, the clips are written by
+    background writers, add() never waits for the disk
+    """
+    def __init__(self,
+                 directory: str = config.RECORD_DIR,
+                 pre_seconds: float = config.RECORD_PRE_SECONDS,
+                 post_seconds: float = config.RECORD_POST_SECONDS,
+                 max_seconds: float = config.RECORD_MAX_SECONDS,
+                 fps: float = config.RECORD_FPS,
+                 quality: int = config.RECORD_JPEG_QUALITY,
+                 max_writers: int = config.RECORD_MAX_WRITERS,
+                 max_pending: int = config.RECORD_MAX_PENDING,
+                 quota_mb: float = config.RECORD_QUOTA_MB,
+                 codec: str = config.RECORD_CODEC,
+                 ) -> None:
+
+        self.directory = directory
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.max_seconds = max_seconds
+        self.fps = fps
+        self.quality = quality
+        self.max_writers = max(1, max_writers)
+        self.quota = quota_mb * 1024 * 1024
+        self.codec = codec
+
+        self.cameras = {}
+        self.queue = queue.Queue(maxsize=max(1, max_pending))
+        self.lock = threading.Lock()
+
+        # Size of the clips on disk, known clips oldest first
+        self.usage = 0
+        self.files = deque()
+        self.deleted = 0
+
+        # Seconds from the end of a clip to its file closed,
+        # and seconds to compress a frame
+        self.write_seconds = deque(maxlen=100)
+        self.encode_seconds = deque(maxlen=100)
+
+        self._threads = []
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._scan()
+
+        for _ in range(self.max_writers):
+            t = threading.Thread(target=self._update)
+            t.daemon = True
+            t.start()
+            self._threads.append(t)
+
+        return self
+
+    def stop(self, timeout: float = 10.0) -> None:
+        # save the clips being recorded, then let the writers finish
+        for camera_id in list(self.cameras):
+            state = self.cameras[camera_id]
+            if state.clip is not None:
+                self._submit(state, state.clip)
+
+        for _ in self._threads:
+            self.queue.put(None)
+
+        deadline = time.monotonic() + timeout
+        for t in self._threads:
+            t.join(max(0.0, deadline - time.monotonic()))
+
+    def _scan(self) -> None:
+        # Clips left by a previous run, they count in the quota,
+        # the other files of the directory are left alone
+        entries = [
+            entry for entry in os.scandir(self.directory)
+            if entry.is_file() and CLIP_NAME.fullmatch(entry.name)
+        ]
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+
+        self.files = deque((entry.path, entry.stat().st_size) for entry in entries)
+        self.usage = sum(size for (_, size) in self.files)
+
+    def _state(self, camera_id: int) -> _CameraState:
+        state = self.cameras.get(camera_id)
+        if state is None:
+            state = self.cameras.setdefault(camera_id, _CameraState(int(self.pre_seconds * self.fps) + 1))
+        return state
+
+    def add(self, camera_id: int, frame, violation: bool, timestamp: float = None) -> None:
+        """
+        Keep an annotated frame of the camera, start (or extend) a clip when
+        there is a violation, called from the detection loop
+        """
+        now = time.time() if timestamp is None else timestamp
+        state = self._state(camera_id)
+        clip = state.clip
+        started = False
+
+        if violation:
+            if clip is None:
+                # the clip starts with the frames of the last seconds
+                clip = _Clip(camera_id, list(state.ring), now, now)
+                state.ring.clear()
+                state.clip = clip
+                started = True
+            clip.until = min(now + self.post_seconds, clip.started + self.max_seconds)
+
+        # frames are kept at the recording frame rate only,
+        # except the one starting a clip
+        if now - state.last_frame < 1 / self.fps and not started:
+            return
+        state.last_frame = now
+
+        start = time.perf_counter()
+        (encoded, jpeg) = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        self.encode_seconds.append(time.perf_counter() - start)
+
+        if not encoded:
+            return
+
+        if clip is None:
+            state.ring.append((now, jpeg))
+
+            # only the last pre_seconds are kept
+            while state.ring and now - state.ring[0][0] > self.pre_seconds:
+                state.ring.popleft()
+            return
+
+        clip.frames.append((now, jpeg))
+        if now >= clip.until:
+            self._submit(state, clip)
+
+    def _submit(self, state: _CameraState, clip: _Clip) -> None:
+        state.clip = None
+        clip.submitted = time.perf_counter()
+
+        try:
+            self.queue.put_nowait(clip)
+        except queue.Full:
+            # every writer is busy and the waiting list is full
+            with self.lock:
+                state.dropped_clips += 1
+                state.dropped_frames += len(clip.frames)
+            print(f"[WARNING] Camera {clip.camera_id + 1}: clip dropped, the recorder is behind")
+
+    def _make_room(self, size: int) -> bool:
+        # Delete the oldest clips until `size` more bytes fit in the quota
+        if size > self.quota:
+            return False
+
+        while self.files and self.usage + size > self.quota:
+            (path, file_size) = self.files.popleft()
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            self.usage -= file_size
+            self.deleted += 1
+
+        return self.usage + size <= self.quota
+
+    def _write(self, clip: _Clip) -> None:
+        state = self.cameras[clip.camera_id]
+
+        # the video is about as large as its JPEG frames, the room is
+        # reserved until the real size is known so the other writers
+        # do not count on it
+        estimate = sum(len(jpeg) for (_, jpeg) in clip.frames)
+        with self.lock:
+            fits = bool(clip.frames) and self._make_room(estimate)
+            if fits:
+                self.usage += estimate
+
+        if not fits:
+            with self.lock:
+                state.dropped_clips += 1
+                state.dropped_frames += len(clip.frames)
+            if clip.frames:
+                print(f"[WARNING] Camera {clip.camera_id + 1}: clip dropped, over the disk quota")
+            return
+
+        try:
+            size = self._encode(clip)
+        except Exception:
+            # no partial video left out of the quota
+            with self.lock:
+                self.usage -= estimate
+            try:
+                os.remove(self._path(clip))
+            except OSError:
+                pass
+            raise
+
+        with self.lock:
+            if size is None:
+                self.usage -= estimate
+                state.dropped_clips += 1
+                state.dropped_frames += len(clip.frames)
+                return
+
+            # the real size, a video larger than its estimate
+            # deletes older clips to stay under the quota
+            self.usage += size - estimate
+            self._make_room(0)
+            self.files.append((self._path(clip), size))
+            state.clips += 1
+            self.write_seconds.append(time.perf_counter() - clip.submitted)
+
+    def _path(self, clip: _Clip) -> str:
+        name = time.strftime("%Y%m%d-%H%M%S", time.localtime(clip.started)) \
+            + f"-{int(clip.started * 1000) % 1000:03d}"
+        return os.path.join(self.directory, f"camera{clip.camera_id + 1}-{name}{CLIP_EXTENSION}")
+
+    def _encode(self, clip: _Clip) -> int:
+        # Write the video of a clip, return its size, None when
+        # the video can not be written
+        path = self._path(clip)
+
+        # frame rate of the frames really kept
+        duration = clip.frames[-1][0] - clip.frames[0][0]
+        fps = (len(clip.frames) - 1) / duration if duration > 0 else self.fps
+
+        first = cv2.imdecode(clip.frames[0][1], cv2.IMREAD_COLOR)
+        (h, w) = first.shape[:2]
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*self.codec), fps, (w, h))
+
+        if not writer.isOpened():
+            print(f"[ERROR] Cannot write {path}")
+            return None
+
+        try:
+            writer.write(first)
+            for (_, jpeg) in clip.frames[1:]:
+                writer.write(cv2.imdecode(jpeg, cv2.IMREAD_COLOR))
+        finally:
+            writer.release()
+
+        return os.path.getsize(path)
+
+    def _update(self) -> None:
+        while True:
+            clip = self.queue.get()
+            if clip is None:
+                break
+
+            try:
+                self._write(clip)
+            except Exception as e:
+                print(f"[ERROR] Cannot write the clip of camera {clip.camera_id + 1}: {e}")
+
+    def snapshot(self, camera_id: int = None) -> dict:
+        """
+        Clips written and dropped (of a camera or of every camera), write
+        and compression latency in milliseconds, disk usage in MB
+        """
+        with self.lock:
+            states = [self.cameras[camera_id]] if camera_id in self.cameras else \
+                list(self.cameras.values()) if camera_id is None else []
+
+            return {
+                "clips": sum(state.clips for state in states),
+                "dropped_clips": sum(state.dropped_clips for state in states),
+                "dropped_frames": sum(state.dropped_frames for state in states),
+                "write": percentiles(list(self.write_seconds)),
+                "encode": percentiles(list(self.encode_seconds)),
+                "usage_mb": round(self.usage / 1024 / 1024, 1),
+                "deleted": self.deleted,
+            }
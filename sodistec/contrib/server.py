@@ -0,0 +1,361 @@
+import asyncio
+import socket
+import threading
+import time
+
+try:
+    from cv2 import cv2
+except ImportError:
+    import cv2
+
+from sodistec.apps import config
+
+BOUNDARY = b"frame"
+
+# Bytes the system may queue for a stream client
+SEND_BUFFER = 64 * 1024
+
+PAGE = """<!DOCTYPE html>
+<html><head><title>Sodistec</title></head>
+<body style="background: #000; margin: 0">
+{images}
+</body></html>
+"""
+
+
+class _Feed:
+    """
+    Newest annotated frame and counts of a camera, the frame is encoded
+    once per stream tick (only while someone watches) for every client
+    """
+    def __init__(self, camera_id: int, snapshot) -> None:
+        self.camera_id = camera_id
+        self.snapshot = snapshot
+
+        # (sequence, frame), set by the camera thread
+        self.latest = (0, None)
+        self.people = 0
+        self.violations = 0
+
+        # Last encoded frame (alone and as a multipart part), its
+        # number and the sequence of the frame it was encoded from
+        self.jpeg = None
+        self.part = None
+        self.index = 0
+        self.encoded = 0
+        self.condition = None
+
+        self.clients = 0
+        self.sent = 0
+        self.skipped = 0
+
+
+def _parse_camera(path: str, prefix: str, suffix: str = ""):
+    # "/camera/2" -> 1, None when not a camera path
+    if not path.startswith(prefix) or not path.endswith(suffix):
+        return None
+    try:
+        return int(path[len(prefix):len(path) - len(suffix)]) - 1
+    except ValueError:
+        return None
+
+
+class MonitorServer:
+    """
+    Small HTTP server for watching a site without the GUI: Prometheus
+    metrics of every camera on /metrics and the annotated feeds as MJPEG
+    on /camera/N, run by an asyncio loop in a background thread. A frame
+    is encoded once for every client, a slow client skips frames and
+    publish() never waits for the clients
+    """
+    def __init__(self,
+                 host: str = config.SERVER_HOST,
+                 port: int = config.SERVER_PORT,
+                 fps: float = config.STREAM_FPS,
+                 quality: int = config.STREAM_JPEG_QUALITY,
+                 max_clients: int = config.STREAM_MAX_CLIENTS,
+                 client_timeout: float = 10.0,
+                 ) -> None:
+
+        self.host = host
+        self.port = port
+        self.fps = fps
+        self.quality = quality
+        self.max_clients = max_clients
+        self.client_timeout = client_timeout
+
+        self.feeds = {}
+        self.loop = None
+        self.server = None
+        self.started = threading.Event()
+
+        self.encodes = 0
+        self.encode_seconds = 0.0
+
+        self._thread = None
+
+    def register(self, camera_id: int, snapshot=None) -> None:
+        """
+        Add a camera, `snapshot` returns its statistics
+        (e.g. CameraStats.snapshot) for the metrics
+        """
+        feed = self.feeds[camera_id] = _Feed(camera_id, snapshot)
+
+        # a camera added while serving gets its encoder right away
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self._add_encoder, feed)
+
+    def _add_encoder(self, feed: _Feed) -> None:
+        feed.condition = asyncio.Condition()
+        self.loop.create_task(self._encode(feed))
+
+    def publish(self, camera_id: int, result) -> None:
+        """
+        Newest result of a camera (FrameResult or WorkerResult), called
+        from the detection loop, only keeps a reference to the frame
+        """
+        feed = self.feeds.get(camera_id)
+        if feed is None:
+            return
+
+        feed.people = result.total_people
+        feed.violations = result.total_serious_violations
+        if result.frame is not None:
+            feed.latest = (feed.latest[0] + 1, result.frame)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+        self.started.wait(5.0)
+        return self
+
+    def stop(self) -> None:
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        if self._thread is not None:
+            self._thread.join(5.0)
+
+    def _run(self) -> None:
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+        try:
+            self.server = self.loop.run_until_complete(
+                asyncio.start_server(self._handle, self.host, self.port)
+            )
+        except OSError as e:
+            print(f"[ERROR] Cannot serve on {self.host}:{self.port}: {e}")
+            self.started.set()
+            return
+
+        # the port actually used (when asked for port 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        print(f"[INFO] Serving the metrics and the feeds on http://{self.host}:{self.port}/")
+
+        for feed in list(self.feeds.values()):
+            self._add_encoder(feed)
+
+        self.started.set()
+
+        try:
+            self.loop.run_forever()
+        finally:
+            # close the streams and the encoders
+            self.server.close()
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self.loop.close()
+
+    async def _encode(self, feed: _Feed) -> None:
+        # Encode the newest frame of the camera at the stream frame rate,
+        # off the loop thread (cv2 releases the GIL while encoding)
+        period = 1 / self.fps
+        params = [cv2.IMWRITE_JPEG_QUALITY, self.quality]
+        next_tick = self.loop.time()
+
+        while True:
+            next_tick = max(next_tick + period, self.loop.time())
+            await asyncio.sleep(next_tick - self.loop.time())
+
+            (sequence, frame) = feed.latest
+            if feed.clients == 0 or frame is None or sequence == feed.encoded:
+                continue
+
+            start = time.perf_counter()
+            (encoded, jpeg) = await self.loop.run_in_executor(None, cv2.imencode, ".jpg", frame, params)
+            self.encode_seconds += time.perf_counter() - start
+            self.encodes += 1
+
+            if not encoded:
+                continue
+
+            jpeg = jpeg.tobytes()
+            feed.part = (
+                b"--" + BOUNDARY + b"\r\nContent-Type: image/jpeg\r\n"
+                + f"Content-Length: {len(jpeg)}\r\n\r\n".encode() + jpeg + b"\r\n"
+            )
+            feed.jpeg = jpeg
+            feed.encoded = sequence
+            feed.index += 1
+
+            async with feed.condition:
+                feed.condition.notify_all()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.client_timeout)
+            (method, path) = request.split(b" ", 2)[:2]
+            path = path.decode("latin-1").split("?")[0]
+
+            if method != b"GET":
+                await self._respond(writer, 405, "text/plain", b"Method Not Allowed\n")
+            elif path == "/metrics":
+                body = self.metrics().encode()
+                await self._respond(writer, 200, "text/plain; version=0.0.4", body)
+            elif path == "/":
+                images = "\n".join(
+                    f'<img src="/camera/{camera_id + 1}" style="max-width: 50%">' for camera_id in self.feeds
+                )
+                await self._respond(writer, 200, "text/html", PAGE.format(images=images).encode())
+            elif _parse_camera(path, "/camera/", ".jpg") in self.feeds:
+                feed = self.feeds[_parse_camera(path, "/camera/", ".jpg")]
+                await self._snapshot(writer, feed)
+            elif _parse_camera(path, "/camera/") in self.feeds:
+                await self._stream(writer, self.feeds[_parse_camera(path, "/camera/")])
+            else:
+                await self._respond(writer, 404, "text/plain", b"Not Found\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError,
+                ConnectionError, ValueError):
+            pass
+        except asyncio.CancelledError:
+            # the server is stopping
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: int, content_type: str, body: bytes) -> None:
+        reason = {200: "OK", 404: "Not Found", 405: "Method Not Allowed", 503: "Service Unavailable"}[status]
+        writer.write(
+            f"HTTP/1.0 {status} {reason}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\nCache-Control: no-cache\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+
+    async def _snapshot(self, writer: asyncio.StreamWriter, feed: _Feed) -> None:
+        # One JPEG of the newest frame, the one of the stream when
+        # it is up to date, otherwise encoded for this request only
+        (sequence, frame) = feed.latest
+        if frame is None:
+            await self._respond(writer, 503, "text/plain", b"No frame yet\n")
+            return
+
+        jpeg = feed.jpeg
+        if sequence != feed.encoded or jpeg is None:
+            (_, jpeg) = await self.loop.run_in_executor(
+                None, cv2.imencode, ".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality]
+            )
+            jpeg = jpeg.tobytes()
+        await self._respond(writer, 200, "image/jpeg", jpeg)
+
+    async def _stream(self, writer: asyncio.StreamWriter, feed: _Feed) -> None:
+        if feed.condition is None:
+            # the camera was registered a moment ago
+            await self._respond(writer, 503, "text/plain", b"Not ready\n")
+            return
+
+        if self.max_clients > 0 and feed.clients >= self.max_clients:
+            await self._respond(writer, 503, "text/plain", b"Too many clients\n")
+            return
+
+        writer.write(
+            b"HTTP/1.0 200 OK\r\nCache-Control: no-cache\r\nConnection: close\r\n"
+            b"Content-Type: multipart/x-mixed-replace; boundary=" + BOUNDARY + b"\r\n\r\n"
+        )
+
+        # keep about one frame queued for the client, the next frames
+        # are skipped until it is sent instead of piling up for a slow client
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUFFER)
+        writer.transport.set_write_buffer_limits(high=0)
+
+        feed.clients += 1
+        last = feed.index
+        try:
+            while True:
+                async with feed.condition:
+                    await feed.condition.wait_for(lambda: feed.index != last)
+
+                # the frames encoded while the client was
+                # still receiving the previous one are skipped
+                if last:
+                    feed.skipped += feed.index - last - 1
+                last = feed.index
+
+                writer.write(feed.part)
+                feed.sent += 1
+
+                # a client not reading at all is dropped
+                await asyncio.wait_for(writer.drain(), self.client_timeout)
+        finally:
+            feed.clients -= 1
+
+    def metrics(self) -> str:
+        """
+        Prometheus text format of the counts, frame rate and
+        stage latencies of every camera, and of the streams
+        """
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str, samples: list) -> None:
+            lines.append(f"# HELP sodistec_{name} {help_text}")
+            lines.append(f"# TYPE sodistec_{name} {kind}")
+            for (labels, value) in samples:
+                label_text = ",".join(f'{key}="{label}"' for (key, label) in labels.items())
+                lines.append(f"sodistec_{name}{{{label_text}}} {value}")
+
+        feeds = list(self.feeds.values())
+        snapshots = {feed.camera_id: feed.snapshot() if feed.snapshot is not None else {} for feed in feeds}
+
+        def camera(feed):
+            return {"camera": str(feed.camera_id + 1)}
+
+        metric("people", "gauge", "People in the last processed frame",
+               [(camera(feed), feed.people) for feed in feeds])
+        metric("violations", "gauge", "People violating the distance in the last processed frame",
+               [(camera(feed), feed.violations) for feed in feeds])
+        metric("fps", "gauge", "Processed frames per second",
+               [(camera(feed), snapshots[feed.camera_id].get("fps", 0.0)) for feed in feeds])
+        metric("frames_total", "counter", "Processed frames",
+               [(camera(feed), snapshots[feed.camera_id].get("frames", 0)) for feed in feeds])
+        metric("dropped_frames_total", "counter", "Captured frames never processed",
+               [(camera(feed), snapshots[feed.camera_id].get("dropped", 0)) for feed in feeds])
+
+        stages = []
+        for feed in feeds:
+            for (stage, latency) in snapshots[feed.camera_id].get("stages", {}).items():
+                for (quantile, key) in (("0.5", "p50"), ("0.95", "p95")):
+                    labels = {**camera(feed), "stage": stage, "quantile": quantile}
+                    stages.append((labels, round(latency[key] / 1000, 6)))
+        metric("stage_latency_seconds", "summary", "Latency of the detection stages", stages)
+
+        metric("stream_clients", "gauge", "Clients watching the MJPEG stream",
+               [(camera(feed), feed.clients) for feed in feeds])
+        metric("stream_sent_frames_total", "counter", "Frames sent to the stream clients",
+               [(camera(feed), feed.sent) for feed in feeds])
+        metric("stream_skipped_frames_total", "counter", "Frames skipped by slow stream clients",
+               [(camera(feed), feed.skipped) for feed in feeds])
+
+        lines.append("# HELP sodistec_stream_encoded_frames_total Frames encoded for the streams")
+        lines.append("# TYPE sodistec_stream_encoded_frames_total counter")
+        lines.append(f"sodistec_stream_encoded_frames_total {self.encodes}")
+        lines.append("# HELP sodistec_stream_encode_seconds_total Time spent encoding the streams")
+        lines.append("# TYPE sodistec_stream_encode_seconds_total counter")
+        lines.append(f"sodistec_stream_encode_seconds_total {round(self.encode_seconds, 6)}")
+
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,227 @@
+import functools
+import os
+
+import numpy as np
+
+try:
+    from cv2 import cv2
+except ImportError:
+    import cv2
+
+from sodistec.apps import config
+from sodistec.contrib.yolo import yolo
+
+# Backends tried by the "auto" mode, fastest first, "cuda"
+# only when the GPU is enabled
+BACKENDS = ("cuda", "openvino", "onnxruntime", "opencv")
+PRECISIONS = ("fp32", "fp16", "int8")
+
+# Network input used for the warm-up runs when the model has no fixed size
+WARMUP_SIZE = 416
+
+
+class BackendError(RuntimeError):
+    pass
+
+
+@functools.lru_cache(maxsize=None)
+def _read_darknet(config_path: str, weight_path: str) -> tuple:
+    # The model files are read from disk once, the other
+    # networks are parsed from memory
+    return (np.fromfile(config_path, dtype=np.uint8), np.fromfile(weight_path, dtype=np.uint8))
+
+
+def onnx_model_path(precision: str) -> str:
+    # yolov4-tiny.onnx, yolov4-tiny.fp16.onnx or yolov4-tiny.int8.onnx
+    if precision == "fp32":
+        return yolo.YOLO4_MINI_ONNX_PATH
+
+    (root, ext) = os.path.splitext(yolo.YOLO4_MINI_ONNX_PATH)
+    return f"{root}.{precision}{ext}"
+
+
+class OpenCVBackend:
+    """
+    YOLO darknet network run by OpenCV dnn, on its own CPU code, through
+    OpenVINO (Inference Engine) or on CUDA
+    """
+    TARGETS = {
+        ("opencv", "fp32"): ("DNN_BACKEND_OPENCV", "DNN_TARGET_CPU"),
+        ("opencv", "fp16"): ("DNN_BACKEND_OPENCV", "DNN_TARGET_CPU_FP16"),
+        ("opencv", "int8"): ("DNN_BACKEND_OPENCV", "DNN_TARGET_CPU"),
+        ("openvino", "fp32"): ("DNN_BACKEND_INFERENCE_ENGINE", "DNN_TARGET_CPU"),
+        ("cuda", "fp32"): ("DNN_BACKEND_CUDA", "DNN_TARGET_CUDA"),
+        ("cuda", "fp16"): ("DNN_BACKEND_CUDA", "DNN_TARGET_CUDA_FP16"),
+    }
+
+    def __init__(self, name: str = "opencv", precision: str = "fp32") -> None:
+        if (name, precision) not in self.TARGETS:
+            raise BackendError(f"{precision} is not supported by {name}")
+
+        (backend, target) = (getattr(cv2.dnn, n, None) for n in self.TARGETS[(name, precision)])
+
+        # the targets OpenCV would silently replace by its default CPU code
+        if backend is None or target is None or target not in cv2.dnn.getAvailableTargets(backend):
+            raise BackendError(f"{name} ({precision}) is not available in this OpenCV build")
+
+        if name == "cuda" and cv2.cuda.getCudaEnabledDeviceCount() == 0:
+            raise BackendError("no CUDA device found")
+
+        self.name = name
+        self.precision = precision
+        self.input_size = None
+
+        self.model = cv2.dnn.readNetFromDarknet(
+            *_read_darknet(yolo.YOLO4_MINI_CONFIG_PATH, yolo.YOLO4_MINI_WEIGHT_PATH)
+        )
+        self.layer = list(self.model.getUnconnectedOutLayersNames())
+
+        self.model.setPreferableBackend(backend)
+        self.model.setPreferableTarget(target)
+
+        if precision == "int8":
+            self._quantize()
+
+    def _quantize(self) -> None:
+        # Calibrate the 8 bits network on gray letterboxed inputs, the
+        # accuracy loss should be checked with benchmarks.backends
+        calibration = np.full((1, 3, WARMUP_SIZE, WARMUP_SIZE), 0.5, dtype=np.float32)
+        calibration[:, :, 60:-60, :] = np.random.RandomState(0).rand(3, WARMUP_SIZE - 120, WARMUP_SIZE)
+
+        self.model = self.model.quantize([calibration], cv2.CV_32F, cv2.CV_32F)
+
+    def forward(self, blob) -> list:
+        self.model.setInput(blob)
+        return self.model.forward(self.layer)
+
+
+class OnnxRuntimeBackend:
+    """
+    yolov4-tiny exported to ONNX run by an ONNX Runtime CPU session, the
+    outputs must keep the darknet layout: (batch, rows, 85) rows of
+    (centerX, centerY, width, height, objectness, class scores...)
+    """
+    def __init__(self, name: str = "onnxruntime", precision: str = "fp32") -> None:
+        try:
+            import onnxruntime
+        except ImportError:
+            raise BackendError("onnxruntime is not installed")
+
+        path = onnx_model_path(precision)
+        if not os.path.exists(path):
+            raise BackendError(f"{path} not found")
+
+        self.name = name
+        self.precision = precision
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.input_type = np.float16 if model_input.type == "tensor(float16)" else np.float32
+
+        # exported models often have a fixed batch and input size
+        (batch, _, height, _) = model_input.shape
+        self.batch_size = batch if isinstance(batch, int) else None
+        self.input_size = height if isinstance(height, int) else None
+
+        # the raw YOLO heads of some exports can not be decoded, the
+        # sizes only known when running are checked by the warm-up
+        for output in self.session.get_outputs():
+            rows = output.shape[-1] if output.shape else None
+            if isinstance(rows, int) and rows != 5 + len(config.LABELS):
+                raise BackendError(
+                    f"{path} output {output.name} is {output.shape}, not the (rows, 85) darknet layout, "
+                    f"export it with python -m sodistec.apps.export"
+                )
+
+    def _run(self, blob) -> list:
+        outputs = self.session.run(None, {self.input_name: blob.astype(self.input_type, copy=False)})
+        return [np.asarray(output, dtype=np.float32) for output in outputs]
+
+    def forward(self, blob) -> list:
+        if self.batch_size is None or len(blob) == self.batch_size:
+            return self._run(blob)
+
+        # one image at a time, then stack the outputs back into a batch
+        runs = [self._run(blob[i:i + 1]) for i in range(len(blob))]
+        return [np.concatenate(outputs) for outputs in zip(*runs)]
+
+
+def create_backend(name: str, precision: str = "fp32"):
+    if name == "onnxruntime":
+        return OnnxRuntimeBackend(name, precision)
+    if name in ("opencv", "openvino", "cuda"):
+        return OpenCVBackend(name, precision)
+
+    raise BackendError(f"Unknown inference backend {name!r}")
+
+
+def warmup(backend, runs: int = config.WARMUP_RUNS) -> None:
+    # The first forward passes allocate the network, run them now and
+    # check the outputs while at it
+    size = backend.input_size or WARMUP_SIZE
+    blob = np.full((1, 3, size, size), 0.5, dtype=np.float32)
+
+    for _ in range(max(1, runs)):
+        outputs = backend.forward(blob)
+
+    for output in outputs:
+        if output.shape[-1] != 5 + len(config.LABELS) or not np.isfinite(output).all():
+            raise BackendError(f"unexpected output {output.shape} from {backend.name}")
+
+
+def describe(backend) -> str:
+    return f"{backend.name} ({backend.precision})"
+
+
+def load_backend(name: str = config.INFERENCE_BACKEND,
+                 precision: str = config.INFERENCE_PRECISION,
+                 use_gpu: bool = config.USE_GPU,
+                 runs: int = config.WARMUP_RUNS,
+                 ):
+    """
+    Load the network on the requested backend, "auto" for the fastest one
+    available, fall back to the other precisions and backends (OpenCV on
+    CPU in the end) when it is not available
+    """
+    if name == "auto":
+        names = [n for n in BACKENDS if use_gpu or n != "cuda"]
+    else:
+        names = [name, "opencv"] if name != "opencv" else [name]
+
+    for candidate in names:
+        for candidate_precision in dict.fromkeys([precision, "fp32"]):
+            try:
+                backend = create_backend(candidate, candidate_precision)
+                warmup(backend, runs)
+            except Exception as e:
+                level = "INFO" if name == "auto" else "WARNING"
+                print(f"[{level}] {candidate} ({candidate_precision}) backend not used: {e}")
+                continue
+
+            print(f"[INFO] Inference backend: {describe(backend)}")
+            return backend
+
+    raise BackendError("No inference backend available")
+
+
+def probe(precisions: tuple = PRECISIONS) -> dict:
+    """
+    Try every backend and precision, return the loaded backends or
+    the reason they are not available
+    """
+    available = {}
+    for name in BACKENDS:
+        for precision in precisions:
+            try:
+                backend = create_backend(name, precision)
+                warmup(backend, 1)
+                available[(name, precision)] = backend
+            except Exception as e:
+                available[(name, precision)] = e
+
+    return available
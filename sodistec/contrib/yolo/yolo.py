@@ -9,3 +9,6 @@ YOLO_COCO_PATH = os.path.join(THIS_PATH, 'coco.names')
 
 YOLO4_MINI_WEIGHT_PATH = os.path.join(THIS_PATH, "yolov4-tiny.weights")
 YOLO4_MINI_CONFIG_PATH = os.path.join(THIS_PATH, 'yolov4-tiny.cfg')
+
+# yolov4-tiny exported to ONNX, for the onnxruntime backend
+YOLO4_MINI_ONNX_PATH = os.path.join(THIS_PATH, "yolov4-tiny.onnx")
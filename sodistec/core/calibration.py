@@ -0,0 +1,86 @@
+import numpy as np
+
+try:
+    from cv2 import cv2
+except ImportError:
+    import cv2
+
+from sodistec.core.detections import Detections
+
+
+def check_calibration(image_points, ground_points) -> None:
+    if len(image_points) < 4 or len(image_points) != len(ground_points):
+        raise ValueError(
+            f"Ground calibration needs at least 4 points in the frame and as many on the floor, "
+            f"got {len(image_points)} and {len(ground_points)}"
+        )
+
+
+class GroundPlane:
+    """
+    Ground plane calibration of a camera: the homography from points
+    on the floor in the frame (frame_size coordinates) to their position
+    on the floor in metres, e.g. the corners of a floor tile
+
+    The floor position of every pixel is computed once, so the feet of
+    the people are put on the floor with a single lookup per frame.
+    """
+    def __init__(self, frame_size: tuple, image_points: list, ground_points: list) -> None:
+        check_calibration(image_points, ground_points)
+
+        self.frame_size = tuple(frame_size)
+        self.image_points = [tuple(point) for point in image_points]
+        self.ground_points = [tuple(point) for point in ground_points]
+
+        (self.homography, _) = cv2.findHomography(
+            np.asarray(image_points, dtype=np.float64), np.asarray(ground_points, dtype=np.float64)
+        )
+        if self.homography is None:
+            raise ValueError("Ground calibration points are degenerate (three of them on a line?)")
+
+        # the homography is known up to its sign, the
+        # calibration points are in front of the camera
+        (x, y) = image_points[0]
+        self.sign = np.sign(self.homography[2] @ (x, y, 1))
+
+        self.map = self._ground_map()
+
+    def settings(self) -> dict:
+        # the arguments building the same calibration, as JSON
+        return {
+            "frame_size": list(self.frame_size),
+            "image_points": [list(point) for point in self.image_points],
+            "ground_points": [list(point) for point in self.ground_points],
+        }
+
+    def _ground_map(self):
+        # (height, width, 2) floor position in metres of every pixel, NaN
+        # above the horizon, where the homography goes behind the camera
+        (w, h) = self.frame_size
+        (x, y) = np.meshgrid(np.arange(w, dtype=np.float64), np.arange(h, dtype=np.float64))
+        H = self.homography
+
+        scale = H[2, 0] * x + H[2, 1] * y + H[2, 2]
+        scale[scale * self.sign <= 0] = np.nan
+
+        ground = np.empty((h, w, 2), dtype=np.float32)
+        ground[:, :, 0] = (H[0, 0] * x + H[0, 1] * y + H[0, 2]) / scale
+        ground[:, :, 1] = (H[1, 0] * x + H[1, 1] * y + H[1, 2]) / scale
+
+        return ground
+
+    def project(self, points):
+        """Floor position in metres of (x, y) frame points, exact"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 1, 2)
+        return cv2.perspectiveTransform(points, self.homography).reshape(-1, 2)
+
+    def positions(self, detections: Detections):
+        """
+        Floor position in metres of the feet (bottom center of the box)
+        of every person, NaN for the ones above the horizon
+        """
+        (w, h) = self.frame_size
+        x = np.clip(detections.centroids[:, 0], 0, w - 1)
+        y = np.clip(detections.boxes[:, 3], 0, h - 1)
+
+        return self.map[y, x]
@@ -0,0 +1,88 @@
+import numpy as np
+
+try:
+    from cv2 import cv2
+except ImportError:
+    import cv2
+
+from sodistec.core.detections import Detections
+
+# Known reference values used to estimate the person "distance"
+# to the camera (used as depth proxy by the violation check)
+KNOW_DISTANCE = 13.0
+KNOW_WIDTH = 5.0
+
+
+def estimate_distances(x, width):
+    # focal length of the box, used as distance to the camera
+    return (width * KNOW_DISTANCE + x) / KNOW_WIDTH
+
+
+def decode_outputs(layer_outputs,
+                   width: int,
+                   height: int,
+                   person_index: int = 0,
+                   min_conf: float = 0.2,
+                   offset: tuple = (0, 0),
+                   ):
+    """
+    Decode raw YOLO layer outputs into candidate Detections in one pass
+
+    The outputs are scaled by (width, height) and shifted back by offset,
+    the padding of a letterboxed input.
+    """
+    # stack every output layer, each row is
+    # (centerX, centerY, width, height, objectness, class scores...)
+    detections = np.concatenate(
+        [np.asarray(output).reshape(-1, output.shape[-1]) for output in layer_outputs]
+    )
+
+    # cheap pre-filter on the person score, only the survivors
+    # need the (more expensive) argmax over every class
+    detections = detections[detections[:, 5 + person_index] > min_conf]
+    scores = detections[:, 5:]
+    detections = detections[np.argmax(scores, axis=1) == person_index]
+
+    confidences = detections[:, 5 + person_index]
+
+    # scale the bounding box coordinates back relative to the size of the
+    # image, YOLO returns the center (x, y)-coordinates of the bounding box
+    # followed by the boxes' width and height
+    box = (
+        detections[:, 0:4] * np.array([width, height, width, height])
+        - np.array([offset[0], offset[1], 0, 0])
+    ).astype(np.int32)
+    centroids = box[:, 0:2]
+    (w, h) = (box[:, 2], box[:, 3])
+
+    # use the center (x, y)-coordinates to derive the top
+    # and and left corner of the bounding box
+    x = (box[:, 0] - w / 2).astype(np.int32)
+    y = (box[:, 1] - h / 2).astype(np.int32)
+
+    distances = estimate_distances(x, w)
+
+    boxes = np.stack([x, y, x + w, y + h], axis=1)
+
+    return Detections(boxes, centroids, confidences, distances)
+
+
+def suppress_indices(candidates: Detections, min_conf: float, nms_thresh: float):
+    # rows of the candidates kept by the non-maxima suppression
+    if not len(candidates):
+        return np.empty(0, dtype=int)
+
+    idxs = cv2.dnn.NMSBoxes(candidates.xywh.tolist(), candidates.confidences.tolist(), min_conf, nms_thresh)
+    return np.asarray(idxs, dtype=int).reshape(-1)
+
+
+def suppress(candidates: Detections, min_conf: float, nms_thresh: float) -> Detections:
+    """
+    Non-maxima suppression of the candidates, drop the weak and the
+    overlapping boxes
+    """
+    if not len(candidates):
+        return candidates
+
+    # keep the rows of the remaining people, if any
+    return candidates[suppress_indices(candidates, min_conf, nms_thresh)]
@@ -1,12 +1,4 @@
-from threading import Thread
 import time
-import math
-
-import numpy as np
-
-import imutils
-
-from playsound import playsound
 
 try:
     from cv2 import cv2
@@ -15,17 +7,38 @@ except ImportError:
 
 from PyQt5.QtCore import QThread, pyqtSignal
 
-from scipy.spatial import distance as dist
-
 from sodistec.apps import config
-from sodistec.contrib.yolo import yolo
+from sodistec.contrib.alert import AlertDispatcher
 from sodistec.contrib.multicapture import CaptureThread
+from sodistec.contrib.recorder import ClipRecorder
+from sodistec.contrib.server import MonitorServer
+from sodistec.core.display import LatestFrame
+from sodistec.core.engine import InferenceEngine
+from sodistec.core.history import HistoryStore
+from sodistec.core.pipeline import Pipeline
+from sodistec.core.scheduler import CameraScheduler
+from sodistec.core.stats import RemoteStats, make_stats
+from sodistec.core.workers import CameraProcess
+
+def _snapshot(camera) -> dict:
+    # Statistics of a camera with the frame rate given by the scheduler
+    snapshot = camera.stats.snapshot()
+    if camera.scheduler is not None:
+        snapshot["scheduled_fps"] = round(camera.scheduler.rate(camera.camera_id), 2)
+    if camera.recorder is not None:
+        snapshot["recorder"] = camera.recorder.snapshot(camera.camera_id)
+    if camera.history is not None:
+        snapshot["history"] = camera.history.snapshot(camera.camera_id)
+    return snapshot
+
 
 class DetectPerson(QThread):
-    change_pixmap_signal = pyqtSignal(np.ndarray, int)
     total_serious_violations_signal = pyqtSignal(int, int)
     total_people_signal = pyqtSignal(int, int)
+    unique_people_signal = pyqtSignal(int, int)
+    results_signal = pyqtSignal(object, int)
     safe_distance_signal = pyqtSignal(int)
+    stats_signal = pyqtSignal(dict, int)
 
     KNOW_DISTANCE = 13.0
     KNOW_HEIGHT = 9.5 
@@ -37,24 +50,46 @@ class DetectPerson(QThread):
                  detect: str = "person", 
                  use_gpu: bool = config.USE_GPU,
                  use_threading: bool = config.USE_THREADING,
+                 engine: InferenceEngine = None,
+                 alerts: AlertDispatcher = None,
+                 scheduler: CameraScheduler = None,
+                 recorder: ClipRecorder = None,
+                 history: HistoryStore = None,
+                 server: MonitorServer = None,
                  parent = None,
                 ) -> None:
         super(DetectPerson, self).__init__(parent)
 
         self.detect = detect
-        self.model = cv2.dnn.readNetFromDarknet(
-            yolo.YOLO4_MINI_CONFIG_PATH, yolo.YOLO4_MINI_WEIGHT_PATH
-        )
-
         self.camera_id = camera_id
-
-        layer = self.model.getLayerNames()
-        self.layer = [layer[i - 1] for i in self.model.getUnconnectedOutLayers()]
-
-        if use_gpu:
-            self._use_gpu()
-
-        self._set_video_capture(video_input, use_threading)
+        self.alerts = alerts
+        self.scheduler = scheduler
+        self.recorder = recorder
+        self.history = history
+        self.server = server
+        self.use_gpu = use_gpu
+        self.engine = engine
+
+        # Qt free detection pipeline, the thread only feeds it with frames
+        # and emits the results to the GUI, created by the thread itself
+        # so the cameras load in parallel and the window shows up at once
+        self.stats = make_stats(camera_id)
+        self.pipeline = None
+
+        # Newest annotated frame, painted by the GUI at its own pace
+        self.display = LatestFrame(self.stats)
+
+        if server is not None:
+            server.register(camera_id, lambda: _snapshot(self))
+
+        self.running = False
+        self.video_capture = None
+        self.video_input = video_input
+        self.use_threading = use_threading
+
+        # the capture thread opens the stream in the background
+        if use_threading:
+            self._set_video_capture(video_input, use_threading)
 
     def _set_video_capture(self, video_input, use_threading) -> None:
         print("[INFO] Setup video feed...")
@@ -64,164 +99,200 @@ class DetectPerson(QThread):
             self.video_capture = cv2.VideoCapture(video_input)
             self.video_capture.set(cv2.CAP_PROP_BUFFERSIZE, 3)
 
-    def _use_gpu(self) -> None:
-        print("[INFO] Searching for compatible NVIDIA GPU...")
-        self.model.setPreferableBackend(cv2.dnn.DNN_BACKEND_CUDA)
-        self.model.setPreferableTarget(cv2.dnn.DNN_TARGET_CUDA)
+    def stop(self) -> None:
+        # Stop the detection loop and release the video feed
+        self.running = False
 
-    def _play_buzzer(self) -> None:
-        playsound("./sodistec/core/buzzer.wav")
+        if self.scheduler is not None:
+            self.scheduler.unregister(self.camera_id)
 
-    def _detect_people(self, frame, person_index: int = 0) -> list:
-        # Credit to: https://github.com/saimj7/Social-Distancing-Detection-in-Real-Time
-        # grab the dimensions of the frame and  initialize the list of
-        # results
-        (H, W) = frame.shape[:2]
-        results = []
-
-        # construct a blob from the input frame and then perform a forward
-        # pass of the YOLO object detector, giving us our bounding boxes
-        # and associated probabilities
-        blob = cv2.dnn.blobFromImage(frame, 1 / 255.0, (416, 416),
-            swapRB=True, crop=False)
-        self.model.setInput(blob)
-        layerOutputs = self.model.forward(self.layer)
-
-        # initialize our lists of detected bounding boxes, centroids, and
-        # confidences, respectively
-        boxes = []
-        centroids = []
-        confidences = []
-        distances = []
-
-        for output in layerOutputs:
-            for detection in output:
-                scores = detection[5:]
-                class_id = np.argmax(scores)
-                confidence = scores[class_id]
-
-                # confidence is met
-                if class_id == person_index and confidence > config.MIN_CONF:
-                    # scale the bounding box coordinates back relative to
-                    # the size of the image, keeping in mind that YOLO
-                    # actually returns the center (x, y)-coordinates of
-                    # the bounding box followed by the boxes' width and
-                    # height
-                    box = detection[0:4] * np.array([W, H, W, H])
-                    (centerX, centerY, width, height) = box.astype("int")
-
-                    # use the center (x, y)-coordinates to derive the top
-                    # and and left corner of the bounding box
-                    x = int(centerX - (width / 2))
-                    y = int(centerY - (height / 2))
-
-                    focal_length = (width * self.KNOW_DISTANCE + x) / self.KNOW_WIDTH
-
-                    #  angel = math.tan(x/y)
-                    #  distance = (height * width) * width * math.sin(angel)
-
-                    #  #  print(width * height, distance, end="\r")
-                    #  print(angel, distance, end="\r")
-
-                    # update our list of bounding box coordinates,
-                    # centroids, and confidences
-                    boxes.append([x, y, int(width), int(height)])
-                    centroids.append((centerX, centerY))
-                    confidences.append(float(confidence))
-                    distances.append(focal_length)
-
-        # apply non-maxima suppression to suppress weak, overlapping
-        # bounding boxes
-        idxs = cv2.dnn.NMSBoxes(boxes, confidences, config.MIN_CONF, config.NMS_THRESH)
-
-        # Emit signal to the Qt (GUI)
-        self.total_people_signal.emit(len(idxs), self.camera_id)
-
-        # ensure at least one detection exists
-        if len(idxs) > 0:
-            # loop over the indexes we are keeping
-            for i in idxs.flatten():
-                # extract the bounding box coordinates
-                (x, y) = (boxes[i][0], boxes[i][1])
-                (w, h) = (boxes[i][2], boxes[i][3])
-
-                # update our results list to consist of the person
-                # prediction probability, bounding box coordinates,
-                # and the centroid
-                results.append((confidences[i], (x, y, x + w, y + h), centroids[i], distances[i]))
-
-        return results
+        if isinstance(self.video_capture, CaptureThread):
+            self.video_capture.stop()
+        elif self.video_capture is not None:
+            self.video_capture.release()
 
     def run(self) -> None:
         # Credit to: https://github.com/saimj7/Social-Distancing-Detection-in-Real-Time
-        while True:
-            if config.USE_THREADING:
-                frame = self.video_capture.read()
-                time.sleep(0.01)
+        self.running = True
 
-                if frame is None:
+        try:
+            self.display.status = "Memuat model..."
+            self.pipeline = Pipeline(self.camera_id, self.use_gpu, self.engine, self.stats)
+        except Exception as e:
+            print(f"[ERROR] Camera {self.camera_id + 1}: {e}")
+            self.display.status = "Gagal memuat model"
+            return
+
+        self.display.status = "Menghubungkan kamera..."
+        if self.video_capture is None:
+            self._set_video_capture(self.video_input, self.use_threading)
+
+        if self.scheduler is not None:
+            self.scheduler.register(self.camera_id)
+
+        last_stats = time.perf_counter()
+
+        while self.running:
+            (sequence, age) = (None, None)
+
+            # wait for the next frame slot given by the scheduler
+            if self.scheduler is not None:
+                with self.stats.stage("schedule"):
+                    if not self.scheduler.wait(self.camera_id):
+                        break
+
+            if config.USE_THREADING:
+                # wait for a frame not processed yet
+                with self.stats.stage("capture"):
+                    captured = self.video_capture.next(timeout=1.0)
+
+                if captured is None:
+                    # the video file is over or the capture was stopped
+                    if self.video_capture.ended or self.video_capture.stopped:
+                        break
+                    if not self.video_capture.connected:
+                        self.display.status = "Menghubungkan kamera..."
                     continue
+
+                (sequence, frame) = (captured.sequence, captured.image)
+                age = time.perf_counter() - captured.timestamp
             else:
-                (grabbed, frame) = self.video_capture.read()
+                with self.stats.stage("capture"):
+                    (grabbed, frame) = self.video_capture.read()
                 # if the frame was not grabbed, then we have reached the end of the stream
                 if not grabbed:
                     break
 
-            # resize the frame and then detect people (and only people) in it
-            #  frame = imutils.resize(frame, width=640)
-            frame  = cv2.resize(frame, (960, 540), cv2.INTER_LINEAR)
-            results = self._detect_people(frame, person_index=config.LABELS.index("person"))
+            self.display.status = None
+            result = self.pipeline.process(frame)
+            self.stats.frame(sequence, age)
+
+            if self.scheduler is not None:
+                self.scheduler.report(self.camera_id, result)
+
+            if self.history is not None:
+                self.history.record(self.camera_id, result)
+
+            # Emit the statistics to the GUI about once per second
+            if self.stats.enabled and time.perf_counter() - last_stats >= 1:
+                last_stats = time.perf_counter()
+                self.stats_signal.emit(_snapshot(self), self.camera_id)
+
+            if self.alerts is not None and len(result.pairs):
+                self.alerts.notify(self.camera_id, result.total_serious_violations, result.total_people)
 
-            # initialize the set of indexes that violate the max/min social distance limits
-            serious = set()
-            #  abnormal = set()
+            # Emit signal to the Qt (GUI)
+            self.total_people_signal.emit(result.total_people, self.camera_id)
+            if result.unique_people is not None:
+                self.unique_people_signal.emit(result.unique_people, self.camera_id)
+            self.total_serious_violations_signal.emit(result.total_serious_violations, self.camera_id)
+            self.results_signal.emit(result.without_frame(), self.camera_id)
 
-            # ensure there are *at least* two people detections (required in
-            # order to compute our pairwise distance maps)
-            if len(results) >= 2:
-                # extract all centroids from the results and compute the
-                # Euclidean distances between all pairs of the centroids
-                centroids = np.array([r[2] for r in results])
-                distances = np.array([r[3] for r in results])
+            if self.recorder is not None:
+                with self.stats.stage("record"):
+                    self.recorder.add(self.camera_id, result.frame, len(result.pairs) > 0)
 
-                data = dist.cdist(centroids, centroids, metric="euclidean")
+            if self.server is not None:
+                self.server.publish(self.camera_id, result)
 
-                # loop over the upper triangular of the distance matrix
-                for i in range(0, data.shape[0]):
-                    for j in range(i + 1, data.shape[1]):
-                        jarak = dist.euclidean(distances[i], distances[j])
+            self.display.put(result.frame)
+
+
+class ProcessDetectPerson(QThread):
+    """
+    Same signals as DetectPerson, but the capture and the detection
+    of the camera run in a separate process
+    """
+    total_serious_violations_signal = pyqtSignal(int, int)
+    total_people_signal = pyqtSignal(int, int)
+    unique_people_signal = pyqtSignal(int, int)
+    results_signal = pyqtSignal(object, int)
+    stats_signal = pyqtSignal(dict, int)
+
+    def __init__(self,
+                 video_input,
+                 camera_id: int,
+                 use_gpu: bool = config.USE_GPU,
+                 alerts: AlertDispatcher = None,
+                 scheduler: CameraScheduler = None,
+                 recorder: ClipRecorder = None,
+                 history: HistoryStore = None,
+                 server: MonitorServer = None,
+                 parent = None,
+                ) -> None:
+        super(ProcessDetectPerson, self).__init__(parent)
+
+        self.camera_id = camera_id
+        self.alerts = alerts
+        self.scheduler = scheduler
+        self.recorder = recorder
+        self.history = history
+        self.server = server
+        self.stats = RemoteStats(camera_id) if config.ENABLE_STATS else make_stats(camera_id)
+        self.display = LatestFrame(self.stats)
+
+        if server is not None:
+            server.register(camera_id, lambda: _snapshot(self))
+
+        print("[INFO] Setup video feed...")
+        self.worker = CameraProcess(video_input, camera_id, use_gpu)
+        self.running = False
+
+    def stop(self) -> None:
+        self.running = False
+        self.wait(2000)
+        self.worker.stop()
+
+        if self.scheduler is not None:
+            self.scheduler.unregister(self.camera_id)
+
+    def run(self) -> None:
+        self.running = True
+        self.worker.start()
+
+        if self.scheduler is not None:
+            self.scheduler.register(self.camera_id)
+            self.worker.rate.value = self.scheduler.rate(self.camera_id)
+
+        while self.running:
+            result = self.worker.next(timeout=0.5)
+
+            if result is None:
+                if self.worker.ended:
+                    break
+                continue
 
-                        # check to see if the distance between any two
-                        # centroid pairs is less than the configured number of pixels
+            self.display.status = None
 
-                        #  if data[i, j] < config.MIN_DISTANCE: #and jarak < config.MIN_RADIUS or data[i, j] < 0:
-                        if data[i, j] < config.MIN_DISTANCE and (jarak < config.MIN_RADIUS or data[i, j] < 0):
+            # the camera process paces itself at the rate of the scheduler
+            if self.scheduler is not None:
+                self.scheduler.report(self.camera_id, result)
+                self.worker.rate.value = self.scheduler.rate(self.camera_id)
 
-                            if config.PLAY_BUZZER:
-                                Thread(target=self._play_buzzer).start() # PLAY SOUND!!
+            if self.history is not None:
+                self.history.record(self.camera_id, result)
 
-                            serious.add(i)
-                            serious.add(j)
+            if self.alerts is not None and len(result.pairs):
+                self.alerts.notify(self.camera_id, result.total_serious_violations, result.total_people)
 
-            # loop over the results 
-            for (i, (_, bbox, centroid, distance)) in enumerate(results):
-                # extract the bounding box and centroid coordinates, then
-                # initialize the color of the annotation
-                (startX, startY, endX, endY) = bbox
-                (cX, cY) = centroid
-                color = (0, 255, 0)
+            if result.stats is not None and self.stats.enabled:
+                self.stats.update(result.stats)
+                self.stats_signal.emit(_snapshot(self), self.camera_id)
 
-                # if the index pair exists within the violation/abnormal sets, then update the color
-                if i in serious:
-                    color = (0, 0, 255)
-                #  elif i in abnormal:
-                #      color = (0, 255, 255) #orange = (0, 165, 255)
+            # Emit signal to the Qt (GUI)
+            self.total_people_signal.emit(result.total_people, self.camera_id)
+            if result.unique_people is not None:
+                self.unique_people_signal.emit(result.unique_people, self.camera_id)
+            self.total_serious_violations_signal.emit(result.total_serious_violations, self.camera_id)
+            self.results_signal.emit(result.without_frame(), self.camera_id)
 
-                # draw (1) a bounding box around the person and (2) the
-                # centroid coordinates of the person,
-                cv2.rectangle(frame, (startX, startY), (endX, endY), color, 2)
-                cv2.circle(frame, (cX, cY), 5, color, 2)
+            if self.server is not None:
+                self.server.publish(self.camera_id, result)
 
-            self.total_serious_violations_signal.emit(len(serious), self.camera_id)
-            self.change_pixmap_signal.emit(frame, self.camera_id)
+            if result.frame is not None:
+                # frames not sent back by the camera process are missing in the clips
+                if self.recorder is not None:
+                    with self.stats.stage("record"):
+                        self.recorder.add(self.camera_id, result.frame, len(result.pairs) > 0)
 
+                self.display.put(result.frame)
@@ -0,0 +1,70 @@
+import numpy as np
+
+# Track id of the detections not followed by a tracker
+NO_TRACK = -1
+
+
+class Detections:
+    """
+    People found in a frame, one row per person in parallel arrays:
+    boxes as (startX, startY, endX, endY), centroids as (centerX, centerY),
+    confidences, distances (the depth estimate of the violation check),
+    violation flags and track ids (NO_TRACK when not tracking)
+    """
+    __slots__ = ("boxes", "centroids", "confidences", "distances", "violations", "track_ids")
+
+    def __init__(self, boxes, centroids, confidences, distances, violations = None, track_ids = None) -> None:
+        self.boxes = np.asarray(boxes, dtype=np.int32).reshape(-1, 4)
+        self.centroids = np.asarray(centroids, dtype=np.int32).reshape(-1, 2)
+        self.confidences = np.asarray(confidences, dtype=np.float32).reshape(-1)
+        self.distances = np.asarray(distances, dtype=np.float32).reshape(-1)
+
+        count = len(self.boxes)
+        self.violations = np.zeros(count, dtype=bool) if violations is None \
+            else np.asarray(violations, dtype=bool).reshape(-1)
+        self.track_ids = np.full(count, NO_TRACK, dtype=np.int32) if track_ids is None \
+            else np.asarray(track_ids, dtype=np.int32).reshape(-1)
+
+    @classmethod
+    def empty(cls) -> "Detections":
+        return cls(np.empty((0, 4)), np.empty((0, 2)), (), ())
+
+    @classmethod
+    def concatenate(cls, items: list) -> "Detections":
+        # the rows of every item, in order
+        if not items:
+            return cls.empty()
+
+        joined = Detections.__new__(Detections)
+        for name in cls.__slots__:
+            setattr(joined, name, np.concatenate([getattr(item, name) for item in items]))
+        return joined
+
+    def __len__(self) -> int:
+        return len(self.boxes)
+
+    def __getitem__(self, index) -> "Detections":
+        # the rows selected by an index array or a mask, the
+        # arrays already have their types, no need to convert them
+        selected = Detections.__new__(Detections)
+        for name in self.__slots__:
+            setattr(selected, name, getattr(self, name)[index])
+        return selected
+
+    def __getstate__(self) -> tuple:
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state: tuple) -> None:
+        for (name, value) in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    @property
+    def xywh(self):
+        # boxes as (x, y, width, height)
+        boxes = self.boxes.copy()
+        boxes[:, 2:4] -= boxes[:, 0:2]
+        return boxes
+
+    @property
+    def total_violations(self) -> int:
+        return int(np.count_nonzero(self.violations))
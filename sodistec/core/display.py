@@ -0,0 +1,144 @@
+import threading
+
+import numpy as np
+
+try:
+    from cv2 import cv2
+except ImportError:
+    import cv2
+
+from PyQt5.QtCore import QSize, Qt
+from PyQt5.QtGui import QImage, QPainter
+from PyQt5.QtWidgets import QSizePolicy, QWidget
+
+from sodistec.core.stats import NullStats
+
+# Qt reads opencv (BGR) frames as they are since Qt 5.14,
+# older versions need a conversion to RGB first
+_BGR888 = getattr(QImage, "Format_BGR888", None)
+
+# Default size of a camera feed
+DISPLAY_SIZE = (960, 540)
+
+
+def prepare_image(frame, size: tuple = None) -> QImage:
+    """
+    Scale an opencv frame to fit in size (keeping the aspect ratio) and
+    wrap it in a QImage, the pixels are not copied when no scaling is needed
+    """
+    (h, w) = frame.shape[:2]
+
+    if size is not None:
+        scale = min(size[0] / w, size[1] / h)
+        if scale > 0 and abs(scale - 1) > 0.01:
+            frame = cv2.resize(frame, (max(1, int(w * scale)), max(1, int(h * scale))),
+                interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+
+    if _BGR888 is None:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        image_format = QImage.Format_RGB888
+    else:
+        frame = np.ascontiguousarray(frame)
+        image_format = _BGR888
+
+    (h, w) = frame.shape[:2]
+    image = QImage(frame.data, w, h, frame.strides[0], image_format)
+
+    # the QImage does not own the pixels, keep the array alive with it
+    image.ndarray = frame
+
+    return image
+
+
+class LatestFrame:
+    """
+    Newest frame of a camera waiting to be painted, filled by the camera
+    thread, a frame not painted yet is replaced (and counted as stale)
+    """
+    def __init__(self, stats = None) -> None:
+        self.stats = stats if stats is not None else NullStats()
+        self.lock = threading.Lock()
+
+        self.image = None
+
+        # size of the widget showing the frames, set by the GUI
+        self.size = DISPLAY_SIZE
+
+        # frames replaced before being painted
+        self.stale = 0
+
+        # shown instead of (or over) the frame while not None,
+        # e.g. while connecting to the camera
+        self.status = "Menghubungkan kamera..."
+
+    def put(self, frame) -> None:
+        # Called from the camera thread, scaling and wrapping
+        # the frame stay off the GUI thread
+        with self.stats.stage("display"):
+            image = prepare_image(frame, self.size)
+
+        with self.lock:
+            if self.image is not None:
+                self.stale += 1
+                self.stats.count("stale")
+            self.image = image
+
+    def take(self):
+        # The newest frame if any, called from the GUI thread
+        with self.lock:
+            (image, self.image) = (self.image, None)
+        return image
+
+
+class VideoWidget(QWidget):
+    """
+    Paint the newest frame of a camera as it is, refresh() is called
+    by the GUI at the display refresh rate
+    """
+    def __init__(self, buffer: LatestFrame, parent = None) -> None:
+        super(VideoWidget, self).__init__(parent)
+
+        self.buffer = buffer
+        self.image = None
+        self.status = None
+
+        # every pixel is painted, no need to clear the background
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        self.setMinimumSize(320, 180)
+
+    def sizeHint(self) -> QSize:
+        return QSize(*DISPLAY_SIZE)
+
+    def resizeEvent(self, event) -> None:
+        self.buffer.size = (self.width(), self.height())
+        super().resizeEvent(event)
+
+    def refresh(self) -> None:
+        image = self.buffer.take()
+        status = self.buffer.status
+
+        if image is None and status == self.status:
+            return
+
+        if image is not None:
+            self.image = image
+        self.status = status
+        self.update()
+
+    def paintEvent(self, event) -> None:
+        with self.buffer.stats.stage("render"):
+            painter = QPainter(self)
+            painter.fillRect(self.rect(), Qt.black)
+
+            if self.image is not None:
+                # centered, the frame is already scaled to fit the widget
+                x = (self.width() - self.image.width()) // 2
+                y = (self.height() - self.image.height()) // 2
+                painter.drawImage(x, y, self.image)
+
+            if self.status is not None:
+                painter.setPen(Qt.white)
+                painter.drawText(self.rect(), Qt.AlignCenter, self.status)
+
+            painter.end()
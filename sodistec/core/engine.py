@@ -0,0 +1,178 @@
+import threading
+import time
+
+try:
+    from cv2 import cv2
+except ImportError:
+    import cv2
+
+from sodistec.apps import config
+from sodistec.contrib.yolo.backend import load_backend
+
+
+def forward_batch(backend, images: list) -> list:
+    """
+    Run network inputs of the same size in a single forward pass,
+    return the layer outputs of every image
+    """
+    blob = cv2.dnn.blobFromImages(images, 1 / 255.0, swapRB=True, crop=False)
+    layerOutputs = backend.forward(blob)
+
+    # a batch of one gives (rows, 85) per layer, otherwise
+    # (batch, rows, 85), split it back for every image
+    layerOutputs = [output.reshape(len(images), -1, output.shape[-1]) for output in layerOutputs]
+
+    return [[output[index] for output in layerOutputs] for index in range(len(images))]
+
+
+class _Request:
+    def __init__(self, frames: list) -> None:
+        self.frames = frames
+        self.outputs = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class InferenceEngine:
+    """
+    One YOLO network shared by every camera, the latest frame of each
+    camera (or its crops) is batched together and run in a single forward
+    pass, the frames are network inputs (letterboxed) of the same size
+    """
+    def __init__(self,
+                 batch_size: int = config.BATCH_SIZE,
+                 max_wait: float = config.BATCH_MAX_WAIT,
+                 use_gpu: bool = config.USE_GPU,
+                 ) -> None:
+
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.use_gpu = use_gpu
+
+        # The network is loaded by the engine thread, so
+        # the start-up does not wait for it
+        self.backend = None
+        self.error = None
+        self.ready = threading.Event()
+
+        # Pending request, one per camera
+        self._pending = {}
+        self._condition = threading.Condition()
+
+        self.stopped = False
+
+    def start(self):
+        t = threading.Thread(target=self._update)
+        t.daemon = True
+        t.start()
+
+        return self
+
+    def _fail_pending(self, error: Exception) -> None:
+        # release every camera still waiting for a result
+        for request in self._pending.values():
+            request.error = error
+            request.done.set()
+        self._pending.clear()
+
+    def stop(self) -> None:
+        with self._condition:
+            self.stopped = True
+            self._fail_pending(RuntimeError("Inference engine stopped"))
+            self._condition.notify_all()
+
+    def wait_ready(self, timeout: float = None):
+        """Wait for the network to be loaded and return its backend"""
+        self.ready.wait(timeout)
+
+        if self.error is not None:
+            raise self.error
+
+        return self.backend
+
+    def infer(self, camera_id: int, frame) -> list:
+        """Queue a frame and block until its layer outputs are ready"""
+        return self.infer_many(camera_id, [frame])[0]
+
+    def infer_many(self, camera_id: int, frames: list) -> list:
+        """
+        Queue the frames of a camera (e.g. its tiles), run in the same
+        batch, and block until the layer outputs of every one are ready
+        """
+        request = _Request(frames)
+
+        with self._condition:
+            if self.error is not None:
+                raise self.error
+            if self.stopped:
+                raise RuntimeError("Inference engine stopped")
+
+            self._pending[camera_id] = request
+            self._condition.notify_all()
+
+        request.done.wait()
+
+        if request.error is not None:
+            raise request.error
+
+        return request.outputs
+
+    def _next_batch(self) -> list:
+        with self._condition:
+            while not self._pending and not self.stopped:
+                self._condition.wait()
+
+            # give the other cameras a chance to join the batch
+            deadline = time.monotonic() + self.max_wait
+            while len(self._pending) < self.batch_size and not self.stopped:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+            # only the frames with the same input size as the oldest
+            # one go together, the others wait for the next batch, the
+            # frames of a camera are never split, even over the batch size
+            shape = next(iter(self._pending.values())).frames[0].shape if self._pending else None
+            (camera_ids, frames) = ([], 0)
+            for (camera_id, request) in self._pending.items():
+                if request.frames[0].shape != shape:
+                    continue
+                if camera_ids and frames + len(request.frames) > self.batch_size:
+                    break
+                camera_ids.append(camera_id)
+                frames += len(request.frames)
+
+            return [self._pending.pop(camera_id) for camera_id in camera_ids]
+
+    def _update(self) -> None:
+        try:
+            self.backend = load_backend(use_gpu=self.use_gpu)
+        except Exception as e:
+            print(f"[ERROR] Cannot load the network: {e}")
+            with self._condition:
+                self.error = e
+                self._fail_pending(e)
+            return
+        finally:
+            self.ready.set()
+
+        while not self.stopped:
+            batch = self._next_batch()
+            if not batch:
+                continue
+
+            try:
+                outputs = forward_batch(self.backend, [frame for r in batch for frame in r.frames])
+
+                # back to the frames of every camera
+                start = 0
+                for request in batch:
+                    request.outputs = outputs[start:start + len(request.frames)]
+                    start += len(request.frames)
+            except Exception as e:
+                for request in batch:
+                    request.error = e
+
+            for request in batch:
+                request.done.set()
@@ -1,21 +1,23 @@
-import numpy as np
-
-try:
-    from cv import cv2
-except ImportError:
-    import cv2
-
-from PyQt5.QtGui import QFont, QImage, QPixmap
-from PyQt5.QtCore import Qt, pyqtSlot
+from PyQt5.QtGui import QFont
+from PyQt5.QtCore import QTimer, pyqtSlot
 from PyQt5.QtWidgets import (
     QGridLayout, QGroupBox, QHBoxLayout, QLabel, QLineEdit,
     QPushButton, QWidget, QVBoxLayout
 )
 
 from sodistec.apps import config
+from sodistec.contrib.alert import AlertDispatcher
+from sodistec.contrib.recorder import ClipRecorder
+from sodistec.contrib.server import MonitorServer
 from sodistec.contrib.temperature import TemperatureReader 
 from sodistec.contrib.dialog import SetCamera
-from sodistec.core.detection import DetectPerson
+from sodistec.core.detection import DetectPerson, ProcessDetectPerson
+from sodistec.core.display import VideoWidget
+from sodistec.core.engine import InferenceEngine
+from sodistec.core.history import HistoryStore
+from sodistec.core.mosaic import Mosaic, MosaicWidget
+from sodistec.core.scheduler import CameraScheduler
+from sodistec.core.stats import StatsDumper
 
 
 class WindowApp(QWidget):
@@ -37,6 +39,8 @@ class WindowApp(QWidget):
         # Statistic buffer
         self.people_counter = {}
         self.violation_counter = {}
+        self.performance_counter = {}
+        self.unique_counter = {}
 
         self.grid = QGridLayout(self)
         self.grid.setRowMinimumHeight(0, self.WIDGET_HEIGHT)
@@ -62,6 +66,8 @@ class WindowApp(QWidget):
 
         self.people_counter[index] = QLabel("Total Orang: 0")
         self.violation_counter[index] = QLabel("Total Pelanggar: 0")
+        self.performance_counter[index] = QLabel("FPS: 0")
+        self.unique_counter[index] = QLabel("Orang Unik: 0")
 
         group_box.setLayout(layout)
         group_box.setTitle(f"Informasi Camera {index + 1}")
@@ -70,6 +76,12 @@ class WindowApp(QWidget):
         layout.addWidget(self.people_counter[index])
         layout.addWidget(self.violation_counter[index])
 
+        if config.DETECT_INTERVAL > 1:
+            layout.addWidget(self.unique_counter[index])
+
+        if config.ENABLE_STATS:
+            layout.addWidget(self.performance_counter[index])
+
         return group_box
 
     def _add_video_feed(self, index: int):
@@ -77,9 +89,7 @@ class WindowApp(QWidget):
         layout = QVBoxLayout()
         font = QFont('Arial', 13)
 
-        self.display_feed[f"display_{index}"] = QLabel(self)
-        self.display_feed[f"display_{index}"].resize(1280, 720)
-        self.display_feed[f"display_{index}"].setAlignment(Qt.AlignCenter)
+        self.display_feed[f"display_{index}"] = VideoWidget(self.cameras[f"camera_{index}"].display, self)
 
         group_box.setLayout(layout)
         group_box.setFont(font)
@@ -91,17 +101,106 @@ class WindowApp(QWidget):
 
         return group_box
 
+    def _wall_group(self):
+        # Every camera in one canvas, MAX_ROW x MAX_COL per page
+        group_box = QGroupBox()
+        layout = QVBoxLayout()
+
+        self.display_feed["wall"] = MosaicWidget(self.mosaic, self)
+        layout.addWidget(self.display_feed["wall"])
+        layout.setStretch(0, 1)
+
+        if self.mosaic.pages > 1:
+            buttons = QHBoxLayout()
+            previous_page = QPushButton("Halaman Sebelumnya")
+            next_page = QPushButton("Halaman Berikutnya")
+            previous_page.clicked.connect(self.display_feed["wall"].previous_page)
+            next_page.clicked.connect(self.display_feed["wall"].next_page)
+            buttons.addWidget(previous_page)
+            buttons.addWidget(next_page)
+            layout.addLayout(buttons)
+
+        group_box.setLayout(layout)
+        group_box.setFont(QFont('Arial', 13))
+        group_box.setTitle("Semua Kamera")
+
+        return group_box
+
     def _feed_group(self):
         group_box = QGroupBox()
-        layout = QHBoxLayout()
+        layout = QGridLayout()
+
+        # Video wall of every camera instead of one widget per camera
+        self.mosaic = None
+        if config.VIDEO_WALL:
+            self.mosaic = Mosaic(len(config.CAMERAS_URL))
+
+        # One network shared by every camera
+        self.engine = None
+        if config.USE_SHARED_ENGINE and config.INFERENCE_MODE == "thread":
+            self.engine = InferenceEngine().start()
+
+        # One alert worker (buzzer and email) for every camera
+        self.alerts = None
+        if config.PLAY_BUZZER or config.SEND_MAIL:
+            self.alerts = AlertDispatcher().start()
+
+        # Clips of the violations, written in the background
+        self.recorder = None
+        if config.RECORD_CLIPS:
+            self.recorder = ClipRecorder().start()
+
+        # People and violations of every camera over time
+        self.history = None
+        if config.HISTORY_PATH:
+            self.history = HistoryStore().start()
+
+        # Metrics and feeds over HTTP
+        self.server = None
+        if config.SERVER_PORT:
+            self.server = MonitorServer()
+
+        # Frame rate budget shared by the cameras by their activity
+        self.scheduler = None
+        if config.SCHEDULER_FPS_BUDGET > 0:
+            self.scheduler = CameraScheduler()
 
         for index, camera in enumerate(config.CAMERAS_URL):
-            self.cameras[f"camera_{index}"] = DetectPerson(camera, index)
-            self.cameras[f"camera_{index}"].change_pixmap_signal.connect(self._update_image)
+            if config.INFERENCE_MODE == "process":
+                self.cameras[f"camera_{index}"] = ProcessDetectPerson(
+                    camera, index, alerts=self.alerts, scheduler=self.scheduler, recorder=self.recorder,
+                    history=self.history, server=self.server,
+                )
+            else:
+                self.cameras[f"camera_{index}"] = DetectPerson(
+                    camera, index, engine=self.engine, alerts=self.alerts, scheduler=self.scheduler,
+                    recorder=self.recorder, history=self.history, server=self.server,
+                )
+
             self.cameras[f"camera_{index}"].total_people_signal.connect(self._update_total_person)
+            self.cameras[f"camera_{index}"].unique_people_signal.connect(self._update_unique_person)
             self.cameras[f"camera_{index}"].total_serious_violations_signal.connect(self._update_total_serious_violations)
+            self.cameras[f"camera_{index}"].stats_signal.connect(self._update_stats)
+
+            if self.mosaic is not None:
+                # the camera writes its frames straight into the wall
+                camera = self.cameras[f"camera_{index}"]
+                camera.display = self.mosaic.tile(index, camera.stats)
+            else:
+                layout.addWidget(self._add_video_feed(index), index // config.MAX_COL, index % config.MAX_COL)
+
+        if self.mosaic is not None:
+            layout.addWidget(self._wall_group(), 0, 0)
+
+        if self.server is not None:
+            self.server.start()
 
-            layout.addWidget(self._add_video_feed(index))
+        # Machine readable statistics dump
+        self.stats_dumper = None
+        if config.ENABLE_STATS and config.STATS_DUMP_PATH:
+            self.stats_dumper = StatsDumper(
+                [camera.stats for camera in self.cameras.values()]
+            ).start()
 
         group_box.setLayout(layout)
         return group_box
@@ -161,6 +260,58 @@ class WindowApp(QWidget):
         for index, camera in enumerate(config.CAMERAS_URL):
             self.cameras[f"camera_{index}"].start()
 
+        # Repaint the feeds at the screen refresh rate at most, only
+        # the newest frame of every camera is painted
+        refresh_rate = self.screen().refreshRate() or 60.0
+        if config.DISPLAY_MAX_FPS > 0:
+            refresh_rate = min(refresh_rate, config.DISPLAY_MAX_FPS)
+
+        # the wall is repainted at a fixed rate whatever the cameras
+        if self.mosaic is not None:
+            refresh_rate = min(refresh_rate, config.WALL_REFRESH_FPS)
+
+        self.display_timer = QTimer(self)
+        self.display_timer.timeout.connect(self._refresh_feeds)
+        self.display_timer.start(int(1000 / refresh_rate))
+
+        self.page_timer = None
+        if self.mosaic is not None and self.mosaic.pages > 1 and config.WALL_PAGE_SECONDS > 0:
+            self.page_timer = QTimer(self)
+            self.page_timer.timeout.connect(self.display_feed["wall"].next_page)
+            self.page_timer.start(int(config.WALL_PAGE_SECONDS * 1000))
+
+    def closeEvent(self, event) -> None:
+        self.display_timer.stop()
+        if self.page_timer is not None:
+            self.page_timer.stop()
+
+        # Stop every camera and release its video feed
+        for camera in self.cameras.values():
+            camera.stop()
+
+        for camera in self.cameras.values():
+            camera.wait(2000)
+
+        if self.engine is not None:
+            self.engine.stop()
+
+        if self.alerts is not None:
+            self.alerts.stop()
+
+        if self.recorder is not None:
+            self.recorder.stop()
+
+        if self.history is not None:
+            self.history.stop()
+
+        if self.server is not None:
+            self.server.stop()
+
+        if self.stats_dumper is not None:
+            self.stats_dumper.stop()
+
+        super().closeEvent(event)
+
     @pyqtSlot(str)
     def _update_temperature(self, temp) -> None:
         self.temperature.setText(temp)
@@ -171,22 +322,71 @@ class WindowApp(QWidget):
 
     @pyqtSlot(int, int)
     def _update_total_person(self, total_people, camera_id) -> None:
+        # the wall shows the counts in the caption of the tiles
+        if self.mosaic is not None:
+            self.mosaic.tiles[camera_id].people = total_people
+            return
         self.people_counter[camera_id].setText(f'Total Orang: {total_people}')
 
+    @pyqtSlot(int, int)
+    def _update_unique_person(self, unique_people, camera_id) -> None:
+        if camera_id in self.unique_counter:
+            self.unique_counter[camera_id].setText(f'Orang Unik: {unique_people}')
+
     @pyqtSlot(int, int)
     def _update_total_serious_violations(self, total_serious_violations, camera_id) -> None:
+        if self.mosaic is not None:
+            self.mosaic.tiles[camera_id].violations = total_serious_violations
+            return
         self.violation_counter[camera_id].setText(f'Total Pelanggar: {total_serious_violations}')
 
-    @pyqtSlot(np.ndarray, int)
-    def _update_image(self, cv_img, camera_id) -> None:
-        qt_image = self.convert_cv_qt(cv_img)
-        self.display_feed[f"display_{camera_id}"].setPixmap(qt_image)
+    @pyqtSlot(dict, int)
+    def _update_stats(self, stats, camera_id) -> None:
+        if self.mosaic is not None:
+            self.mosaic.tiles[camera_id].fps = stats["fps"]
+            return
 
-    def convert_cv_qt(self, cv_img):
-        """Convert from an opencv image to QPixmap"""
-        rgb_image = cv2.cvtColor(cv_img, cv2.COLOR_BGR2RGB)
-        h, w, ch = rgb_image.shape
-        convert_to_Qt_format = QImage(rgb_image.data, w, h, ch * w, QImage.Format_RGB888)
-        p = convert_to_Qt_format.scaled(960, 540)
-        return QPixmap.fromImage(p)
+        forward = stats["stages"].get("forward", {"p50": 0, "p95": 0})
+        fps = f'FPS: {stats["fps"]:.1f}'
+        if "scheduled_fps" in stats:
+            fps += f' / {stats["scheduled_fps"]:.1f}'
+
+        text = [
+            fps,
+            f'Inferensi p50/p95: {forward["p50"]:.0f}/{forward["p95"]:.0f} ms',
+            f'Frame Hilang: {stats["dropped"]}',
+        ]
+
+        skipped = stats.get("counters", {}).get("skipped")
+        if skipped is not None:
+            text.append(f'Inferensi Dilewati: {skipped}')
+
+        self.performance_counter[camera_id].setText(" | ".join(text))
+        self.performance_counter[camera_id].setToolTip("\n".join(
+            f'{name}: p50 {value["p50"]:.1f} ms, p95 {value["p95"]:.1f} ms'
+            for (name, value) in stats["stages"].items()
+        ) + f'\nUmur frame p50: {stats["frame_age"]["p50"]:.0f} ms'
+          + f'\nFrame tidak ditampilkan: {stats.get("counters", {}).get("stale", 0)}'
+          + (f'\nFPS dari penjadwal: {stats["scheduled_fps"]:.1f}' if "scheduled_fps" in stats else '')
+          + self._recorder_text(stats.get("recorder"))
+          + self._history_text(stats.get("history")))
+
+    @staticmethod
+    def _recorder_text(recorder) -> str:
+        if recorder is None:
+            return ''
+        return (f'\nKlip tersimpan: {recorder["clips"]}, dibuang: {recorder["dropped_clips"]} '
+                f'({recorder["dropped_frames"]} frame)'
+                f'\nPenulisan klip p50/p95: {recorder["write"]["p50"]:.0f}/{recorder["write"]["p95"]:.0f} ms')
+
+    @staticmethod
+    def _history_text(history) -> str:
+        if history is None:
+            return ''
+        period = {"minute": "menit", "hour": "jam", "day": "hari"}[config.HISTORY_ALERT_PERIOD]
+        return f'\nPelanggaran {period} ini: {history["events"]} / {history["threshold"]}'
 
+    @pyqtSlot()
+    def _refresh_feeds(self) -> None:
+        for display in self.display_feed.values():
+            display.refresh()
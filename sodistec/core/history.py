@@ -0,0 +1,381 @@
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from sodistec.apps import config
+from sodistec.core.stats import percentiles
+
+# Length (in seconds) of the roll-up periods
+PERIODS = {"minute": 60, "hour": 3600, "day": 86400}
+
+# Aggregates of a camera over an interval, the sums are over the frames
+COLUMNS = (
+    "camera_id", "start", "seconds", "frames", "people", "peak_people",
+    "violators", "peak_violators", "violation_frames", "violation_events",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS {table} (
+    camera_id INTEGER NOT NULL,
+    start INTEGER NOT NULL,
+    seconds REAL NOT NULL,
+    frames INTEGER NOT NULL,
+    people INTEGER NOT NULL,
+    peak_people INTEGER NOT NULL,
+    violators INTEGER NOT NULL,
+    peak_violators INTEGER NOT NULL,
+    violation_frames INTEGER NOT NULL,
+    violation_events INTEGER NOT NULL,
+    PRIMARY KEY (start, camera_id)
+) WITHOUT ROWID
+"""
+
+# Intervals as recorded, and their hourly totals kept up to date on every
+# flush so the long roll-ups never read the intervals
+INTERVALS_TABLE = "intervals"
+HOURLY_TABLE = "hourly"
+
+# Both tables add the rows to what is already there, an interval written
+# again (e.g. after a restart within the same HISTORY_INTERVAL) completes
+# its row instead of replacing it, and is counted once in the hourly totals
+UPSERT = """
+INSERT INTO {table} ({columns})
+VALUES (?, {start}, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (start, camera_id) DO UPDATE SET
+    seconds = seconds + excluded.seconds,
+    frames = frames + excluded.frames,
+    people = people + excluded.people,
+    peak_people = max(peak_people, excluded.peak_people),
+    violators = violators + excluded.violators,
+    peak_violators = max(peak_violators, excluded.peak_violators),
+    violation_frames = violation_frames + excluded.violation_frames,
+    violation_events = violation_events + excluded.violation_events
+"""
+
+UPSERT_INTERVAL = UPSERT.format(table=INTERVALS_TABLE, columns=", ".join(COLUMNS), start="?")
+UPSERT_HOURLY = UPSERT.format(table=HOURLY_TABLE, columns=", ".join(COLUMNS), start="? / 3600 * 3600")
+
+
+class _Interval:
+    __slots__ = (
+        "start", "first", "last", "frames", "people", "peak_people",
+        "violators", "peak_violators", "violation_frames", "violation_events",
+    )
+
+    def __init__(self, start: int, now: float) -> None:
+        self.start = start
+        self.first = now
+        self.last = now
+        self.frames = 0
+        self.people = 0
+        self.peak_people = 0
+        self.violators = 0
+        self.peak_violators = 0
+        self.violation_frames = 0
+        self.violation_events = 0
+
+
+class _CameraState:
+    __slots__ = ("interval", "violating", "alert_start", "alert_events")
+
+    def __init__(self) -> None:
+        self.interval = None
+        self.violating = False
+
+        # violation events in the current alert period
+        self.alert_start = None
+        self.alert_events = 0
+
+
+def _local_offset() -> int:
+    # Seconds east of UTC, the days start at the local midnight
+    return time.localtime().tm_gmtoff
+
+
+class HistoryStore:
+    """
+    Per camera statistics over time in a SQLite database: the frames are
+    aggregated in memory over intervals (people, peak occupancy, violation
+    events, FPS), the finished intervals are written in batches by a
+    background thread, record() never waits for the disk
+    """
+    def __init__(self,
+                 path: str = config.HISTORY_PATH,
+                 interval: float = config.HISTORY_INTERVAL,
+                 flush_interval: float = config.HISTORY_FLUSH_INTERVAL,
+                 keep_days: float = config.HISTORY_KEEP_DAYS,
+                 threshold: int = config.THERESHOLD,
+                 alert_period: str = config.HISTORY_ALERT_PERIOD,
+                 max_pending: int = 100_000,
+                 on_threshold=None,
+                 ) -> None:
+
+        self.path = path
+        self.interval = max(1, int(interval))
+        self.flush_interval = flush_interval
+        self.keep_days = keep_days
+        self.threshold = threshold
+        self.alert_period = alert_period
+        self.on_threshold = on_threshold
+
+        self.cameras = {}
+        self.pending = deque(maxlen=max_pending)
+        self.lock = threading.Lock()
+
+        self.written = 0
+        self.dropped = 0
+        self.flush_seconds = deque(maxlen=100)
+        self.last_cleanup = 0.0
+
+        self.stopped = threading.Event()
+        self._thread = None
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=30.0)
+        # readers (the history view) do not block the writer
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        for table in (INTERVALS_TABLE, HOURLY_TABLE):
+            connection.execute(SCHEMA.format(table=table))
+        return connection
+
+    def start(self):
+        # the database is created (or checked) before the cameras start
+        self._connect().close()
+
+        self._thread = threading.Thread(target=self._update)
+        self._thread.daemon = True
+        self._thread.start()
+
+        return self
+
+    def stop(self, timeout: float = 10.0) -> None:
+        # the intervals in progress are written too
+        self.stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def record(self, camera_id: int, result, timestamp: float = None) -> None:
+        """
+        Account a processed frame (FrameResult or WorkerResult) of the
+        camera, called from the detection loop
+        """
+        now = time.time() if timestamp is None else timestamp
+        people = result.total_people
+        violators = result.total_serious_violations
+        start = int(now) // self.interval * self.interval
+        alert = False
+
+        with self.lock:
+            state = self.cameras.get(camera_id)
+            if state is None:
+                state = self.cameras[camera_id] = _CameraState()
+
+            interval = state.interval
+            if interval is None or interval.start != start:
+                if interval is not None:
+                    self._close(camera_id, interval, now)
+                interval = state.interval = _Interval(start, now)
+
+            interval.last = now
+            interval.frames += 1
+            interval.people += people
+            interval.violators += violators
+            if people > interval.peak_people:
+                interval.peak_people = people
+            if violators > interval.peak_violators:
+                interval.peak_violators = violators
+
+            violating = violators > 0
+            if violating:
+                interval.violation_frames += 1
+                if not state.violating:
+                    interval.violation_events += 1
+                    alert = self._count_event(state, now)
+            state.violating = violating
+
+        if alert:
+            print(f"[WARNING] Camera {camera_id + 1}: {self.threshold} violations this {self.alert_period}")
+            if self.on_threshold is not None:
+                self.on_threshold(camera_id, self.threshold)
+
+    def _count_event(self, state: _CameraState, now: float) -> bool:
+        # Count a violation event in the alert period, True when the events
+        # of the camera reach the threshold (once per period)
+        offset = _local_offset() if self.alert_period == "day" else 0
+        alert_start = int(now + offset) // PERIODS[self.alert_period]
+        if alert_start != state.alert_start:
+            (state.alert_start, state.alert_events) = (alert_start, 0)
+
+        state.alert_events += 1
+        return self.threshold > 0 and state.alert_events == self.threshold
+
+    def _close(self, camera_id: int, interval: _Interval, end: float) -> None:
+        # A finished interval waits for the next flush, the oldest
+        # ones are dropped when the database can not keep up
+        if len(self.pending) == self.pending.maxlen:
+            self.dropped += 1
+
+        # up to the first frame of the next interval, or to the last frame
+        seconds = min(max(end - interval.first, 0.0), self.interval)
+        self.pending.append((
+            camera_id, interval.start, seconds, interval.frames, interval.people, interval.peak_people,
+            interval.violators, interval.peak_violators, interval.violation_frames, interval.violation_events,
+        ))
+
+    def _take(self, close_all: bool = False) -> list:
+        # Pending rows, with the intervals of the cameras
+        # that stopped sending frames
+        now = time.time()
+        with self.lock:
+            for (camera_id, state) in self.cameras.items():
+                interval = state.interval
+                if interval is None:
+                    continue
+                if close_all or now >= interval.start + 2 * self.interval:
+                    self._close(camera_id, interval, interval.last)
+                    state.interval = None
+
+            rows = list(self.pending)
+            self.pending.clear()
+        return rows
+
+    def write(self, rows: list, connection: sqlite3.Connection = None) -> None:
+        # Write interval rows in one transaction
+        own = connection is None
+        if own:
+            connection = self._connect()
+
+        try:
+            with connection:
+                connection.executemany(UPSERT_INTERVAL, rows)
+                connection.executemany(UPSERT_HOURLY, rows)
+        finally:
+            if own:
+                connection.close()
+
+    def _cleanup(self, connection: sqlite3.Connection) -> None:
+        # Delete the intervals older than keep_days, the hourly totals stay
+        if self.keep_days <= 0 or time.time() - self.last_cleanup < 3600:
+            return
+        self.last_cleanup = time.time()
+
+        with connection:
+            connection.execute(
+                f"DELETE FROM {INTERVALS_TABLE} WHERE start < ?",
+                (int(time.time() - self.keep_days * 86400),),
+            )
+
+    def flush(self, connection: sqlite3.Connection = None, close_all: bool = False) -> None:
+        rows = self._take(close_all)
+        if not rows:
+            return
+
+        start = time.perf_counter()
+        self.write(rows, connection)
+        self.flush_seconds.append(time.perf_counter() - start)
+        self.written += len(rows)
+
+    def _update(self) -> None:
+        connection = self._connect()
+
+        while True:
+            stopped = self.stopped.wait(self.flush_interval)
+            try:
+                self.flush(connection, close_all=stopped)
+                self._cleanup(connection)
+            except sqlite3.Error as e:
+                print(f"[ERROR] Cannot write the statistics history: {e}")
+
+            if stopped:
+                break
+
+        connection.close()
+
+    def rollup(self,
+               period: str = "hour",
+               start: float = None,
+               end: float = None,
+               camera_id: int = None,
+               min_events: int = None,
+               ) -> list:
+        """
+        Statistics per camera and per minute, hour or day (local days) between
+        two timestamps, oldest first, only the buckets with at least
+        `min_events` violation events when given
+        """
+        size = PERIODS[period]
+        # the hourly totals serve the hours and the days
+        table = HOURLY_TABLE if size % 3600 == 0 and self.interval <= 3600 else INTERVALS_TABLE
+        params = {
+            "size": size,
+            "offset": _local_offset() if period == "day" else 0,
+            "start": int(start) if start is not None else 0,
+            "end": int(end) if end is not None else 2 ** 62,
+            "camera_id": camera_id,
+            "min_events": min_events,
+        }
+
+        # a bucket starting before `start` is counted whole
+        if table == HOURLY_TABLE:
+            params["start"] = params["start"] // 3600 * 3600
+
+        query = f"""
+            SELECT camera_id, (start + :offset) / :size * :size - :offset AS bucket, SUM(seconds),
+                   SUM(frames), SUM(people), MAX(peak_people), SUM(violators), MAX(peak_violators),
+                   SUM(violation_frames), SUM(violation_events)
+            FROM {table}
+            WHERE start >= :start AND start < :end
+            {"AND camera_id = :camera_id" if camera_id is not None else ""}
+            GROUP BY camera_id, bucket
+            {"HAVING SUM(violation_events) >= :min_events" if min_events is not None else ""}
+            ORDER BY bucket, camera_id
+        """
+
+        connection = self._connect()
+        try:
+            rows = connection.execute(query, params).fetchall()
+        finally:
+            connection.close()
+
+        return [
+            {
+                "camera_id": camera, "start": bucket,
+                "frames": frames,
+                "people": round(people / frames, 2) if frames else 0.0,
+                "peak_people": peak_people,
+                "violators": round(violators / frames, 2) if frames else 0.0,
+                "peak_violators": peak_violators,
+                "violation_frames": round(violation_frames / frames, 4) if frames else 0.0,
+                "violation_events": events,
+                "fps": round(frames / seconds, 2) if seconds > 0 else 0.0,
+            }
+            for (camera, bucket, seconds, frames, people, peak_people, violators, peak_violators,
+                 violation_frames, events) in rows
+        ]
+
+    def alerts(self, period: str = None, start: float = None, end: float = None,
+               camera_id: int = None, threshold: int = None) -> list:
+        # Periods of the cameras with at least `threshold` violation events
+        period = period or self.alert_period
+        threshold = self.threshold if threshold is None else threshold
+        return self.rollup(period, start, end, camera_id, min_events=threshold)
+
+    def snapshot(self, camera_id: int = None) -> dict:
+        """
+        Intervals written and dropped, flush latency in milliseconds and the
+        violation events of the camera in the current alert period
+        """
+        with self.lock:
+            state = self.cameras.get(camera_id)
+
+            return {
+                "written": self.written,
+                "dropped": self.dropped,
+                "pending": len(self.pending),
+                "flush": percentiles(list(self.flush_seconds)),
+                "events": state.alert_events if state is not None else 0,
+                "threshold": self.threshold,
+            }
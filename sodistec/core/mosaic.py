@@ -0,0 +1,233 @@
+import math
+import threading
+
+import numpy as np
+
+try:
+    from cv2 import cv2
+except ImportError:
+    import cv2
+
+from PyQt5.QtCore import QRect, QSize, Qt
+from PyQt5.QtGui import QColor, QImage, QPainter
+from PyQt5.QtWidgets import QSizePolicy, QWidget
+
+from sodistec.apps import config
+from sodistec.core.stats import NullStats
+
+# Default size of the wall
+WALL_SIZE = (1920, 1080)
+
+# Height of the caption bar of a tile
+CAPTION_HEIGHT = 22
+
+
+class MosaicTile:
+    """
+    Display buffer of a camera in the wall, same interface as LatestFrame
+    for the camera threads: put() writes the frame into the wall canvas
+    """
+    def __init__(self, mosaic, camera_id: int, stats = None) -> None:
+        self.mosaic = mosaic
+        self.camera_id = camera_id
+        self.stats = stats if stats is not None else NullStats()
+
+        # shown over the tile while not None, e.g. while connecting
+        self.status = "Menghubungkan kamera..."
+
+        # caption of the tile, set by the GUI
+        self.people = 0
+        self.violations = 0
+        self.fps = None
+
+    def put(self, frame) -> None:
+        # Called from the camera thread, nothing to do while
+        # the camera is not on the page shown
+        if not self.mosaic.visible(self.camera_id):
+            return
+
+        with self.stats.stage("display"):
+            self.mosaic.put(self.camera_id, frame)
+
+
+class Mosaic:
+    """
+    One preallocated canvas for every camera: pages of MAX_ROW x MAX_COL
+    tiles, the camera threads scale their frames straight into their tile
+    and the GUI paints the whole canvas as one image, its cost does not
+    grow with the cameras
+    """
+    def __init__(self,
+                 cameras: int,
+                 rows: int = config.MAX_ROW,
+                 cols: int = config.MAX_COL,
+                 size: tuple = WALL_SIZE,
+                 ) -> None:
+
+        self.cameras = cameras
+        self.rows = max(1, rows)
+        self.cols = max(1, cols)
+        self.per_page = self.rows * self.cols
+        self.page = 0
+
+        self.tiles = [MosaicTile(self, camera_id) for camera_id in range(cameras)]
+        self.lock = threading.Lock()
+
+        # something changed since the last paint
+        self.dirty = True
+
+        self.canvas = None
+        self.image = None
+        self.resize(size)
+
+    @property
+    def pages(self) -> int:
+        return max(1, math.ceil(self.cameras / self.per_page))
+
+    def tile(self, camera_id: int, stats = None) -> MosaicTile:
+        tile = self.tiles[camera_id]
+        if stats is not None:
+            tile.stats = stats
+        return tile
+
+    def resize(self, size: tuple) -> None:
+        # A new canvas for the new size, the tiles are filled again by
+        # the next frames (a frame being written goes to the old one)
+        (w, h) = (max(1, size[0]), max(1, size[1]))
+
+        with self.lock:
+            if self.canvas is not None and self.canvas.shape[:2] == (h, w):
+                return
+
+            # BGRA pixels, Qt paints them as they are (RGB32)
+            # where a BGR image is converted on every paint
+            self.canvas = np.zeros((h, w, 4), dtype=np.uint8)
+            self.canvas[:, :, 3] = 255
+            self.image = QImage(self.canvas.data, w, h, self.canvas.strides[0], QImage.Format_RGB32)
+            self.dirty = True
+
+    def set_page(self, page: int) -> None:
+        with self.lock:
+            self.page = page % self.pages
+            self.canvas[:, :, :3] = 0
+            self.dirty = True
+
+    def visible(self, camera_id: int) -> bool:
+        return camera_id // self.per_page == self.page
+
+    def rect(self, camera_id: int) -> tuple:
+        # (x, y, w, h) of the tile of a camera on its page
+        slot = camera_id % self.per_page
+        (row, col) = divmod(slot, self.cols)
+        (h, w) = self.canvas.shape[:2]
+        (tile_w, tile_h) = (w // self.cols, h // self.rows)
+        return (col * tile_w, row * tile_h, tile_w, tile_h)
+
+    def put(self, camera_id: int, frame) -> None:
+        # Scale the frame into its tile, keeping its aspect ratio
+        with self.lock:
+            if not self.visible(camera_id):
+                return
+
+            (x, y, tile_w, tile_h) = self.rect(camera_id)
+            (h, w) = frame.shape[:2]
+            scale = min(tile_w / w, (tile_h - CAPTION_HEIGHT) / h)
+            (out_w, out_h) = (max(1, int(w * scale)), max(1, int(h * scale)))
+
+            # centered under the caption bar
+            x += (tile_w - out_w) // 2
+            y += CAPTION_HEIGHT + (tile_h - CAPTION_HEIGHT - out_h) // 2
+            view = self.canvas[y:y + out_h, x:x + out_w]
+
+            interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+            tile = cv2.resize(frame, (out_w, out_h), interpolation=interpolation)
+            cv2.cvtColor(tile, cv2.COLOR_BGR2BGRA, dst=view)
+
+            self.dirty = True
+
+
+class MosaicWidget(QWidget):
+    """
+    Paint the wall canvas as one image with the caption and status of
+    every tile, refresh() is called by the GUI at a fixed rate
+    """
+    def __init__(self, mosaic: Mosaic, parent = None) -> None:
+        super(MosaicWidget, self).__init__(parent)
+
+        self.mosaic = mosaic
+        self.captions = None
+
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        self.setMinimumSize(320, 180)
+
+    def sizeHint(self) -> QSize:
+        return QSize(*WALL_SIZE)
+
+    def resizeEvent(self, event) -> None:
+        self.mosaic.resize((self.width(), self.height()))
+        super().resizeEvent(event)
+
+    def _captions(self) -> list:
+        return [
+            (tile.people, tile.violations, tile.fps, tile.status)
+            for tile in self.mosaic.tiles if self.mosaic.visible(tile.camera_id)
+        ]
+
+    def refresh(self) -> None:
+        # repaint only when a tile or a caption changed
+        captions = self._captions()
+        if not self.mosaic.dirty and captions == self.captions:
+            return
+
+        self.mosaic.dirty = False
+        self.captions = captions
+        self.update()
+
+    def next_page(self) -> None:
+        self.mosaic.set_page(self.mosaic.page + 1)
+        self.refresh()
+
+    def previous_page(self) -> None:
+        self.mosaic.set_page(self.mosaic.page - 1)
+        self.refresh()
+
+    def mousePressEvent(self, event) -> None:
+        if event.button() == Qt.RightButton:
+            self.previous_page()
+        else:
+            self.next_page()
+
+    def paintEvent(self, event) -> None:
+        mosaic = self.mosaic
+        painter = QPainter(self)
+
+        # the canvas has the size of the widget, no scaling
+        painter.drawImage(0, 0, mosaic.image)
+
+        caption_color = QColor(0, 0, 0, 160)
+        for tile in mosaic.tiles:
+            if not mosaic.visible(tile.camera_id):
+                continue
+
+            (x, y, w, h) = mosaic.rect(tile.camera_id)
+            caption = QRect(x, y, w, CAPTION_HEIGHT)
+            painter.fillRect(caption, caption_color)
+
+            text = f"Camera {tile.camera_id + 1}   Orang: {tile.people}   Pelanggar: {tile.violations}"
+            if tile.fps is not None:
+                text += f"   FPS: {tile.fps:.1f}"
+
+            painter.setPen(Qt.red if tile.violations else Qt.white)
+            painter.drawText(caption.adjusted(6, 0, -6, 0), Qt.AlignVCenter | Qt.AlignLeft, text)
+
+            if tile.status is not None:
+                painter.setPen(Qt.white)
+                painter.drawText(QRect(x, y, w, h), Qt.AlignCenter, tile.status)
+
+        if mosaic.pages > 1:
+            painter.setPen(Qt.white)
+            painter.drawText(self.rect().adjusted(0, 0, -8, -4), Qt.AlignRight | Qt.AlignBottom,
+                             f"Halaman {mosaic.page + 1}/{mosaic.pages}")
+
+        painter.end()
@@ -0,0 +1,64 @@
+import time
+
+import numpy as np
+
+try:
+    from cv2 import cv2
+except ImportError:
+    import cv2
+
+from sodistec.apps import config
+
+
+class MotionGate:
+    """
+    Cheap change detector in front of the detection, compare a small blurred
+    gray version of the frame with the one of the last detection
+    """
+    def __init__(self,
+                 threshold: float = config.MOTION_THRESHOLD,
+                 pixel_threshold: int = config.MOTION_PIXEL_THRESHOLD,
+                 max_skip: float = config.MOTION_MAX_SKIP,
+                 size: tuple = (160, 90),
+                 ) -> None:
+
+        self.threshold = threshold
+        self.pixel_threshold = pixel_threshold
+        self.max_skip = max_skip
+        self.size = size
+
+        self.reference = None
+        self.last_refresh = 0.0
+
+        # Number of frames checked and skipped
+        self.checked = 0
+        self.skipped = 0
+
+    def _small(self, frame):
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def changed(self, frame) -> bool:
+        """
+        True when the detection has to run on this frame, the scene changed
+        or the last detection is older than `max_skip` seconds
+        """
+        small = self._small(frame)
+        now = time.monotonic()
+        self.checked += 1
+
+        if self.reference is None or now - self.last_refresh >= self.max_skip:
+            changed = True
+        else:
+            # fraction of the pixels that changed since the last detection
+            diff = cv2.absdiff(small, self.reference)
+            changed = np.count_nonzero(diff > self.pixel_threshold) / diff.size >= self.threshold
+
+        if changed:
+            self.reference = small
+            self.last_refresh = now
+        else:
+            self.skipped += 1
+
+        return changed
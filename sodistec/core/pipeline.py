@@ -0,0 +1,401 @@
+import math
+import time
+
+import numpy as np
+
+try:
+    from cv2 import cv2
+except ImportError:
+    import cv2
+
+from sodistec.apps import config
+from sodistec.core.calibration import GroundPlane
+from sodistec.contrib.yolo.backend import load_backend
+from sodistec.core.decode import decode_outputs, suppress
+from sodistec.core.detections import Detections
+from sodistec.core.engine import InferenceEngine, forward_batch
+from sodistec.core.motion import MotionGate
+from sodistec.core.preprocess import NETWORK_SIZES, check_network_size, letterbox
+from sodistec.core.regions import DetectRegions
+from sodistec.core.stats import CameraStats, NullStats
+from sodistec.core.tracker import CentroidTracker
+from sodistec.core.violation import find_violations, flag_violations
+
+# Frame size used for detection and display
+FRAME_SIZE = (960, 540)
+
+
+class FrameResult:
+    """
+    Detection result of a single frame
+    """
+    def __init__(self, frame, detections: Detections, pairs, unique_people: int = None,
+                 keyframe: bool = True, skipped: bool = False, motion: float = None) -> None:
+        self.frame = frame
+        self.detections = detections
+        self.pairs = pairs
+
+        # Only when tracking, the number of different people seen so far
+        self.unique_people = unique_people
+
+        # False when the results were tracked, not detected, and True
+        # when they were reused from the last frame (static scene)
+        self.keyframe = keyframe
+        self.skipped = skipped
+
+        # Motion of the scene from 0 (static) to 1, None when
+        # neither the motion gate nor the tracker is used
+        self.motion = motion
+
+    @property
+    def track_ids(self) -> list:
+        # The id of every person, None when not tracking
+        if self.unique_people is None:
+            return None
+        return self.detections.track_ids.tolist()
+
+    @property
+    def total_people(self) -> int:
+        return len(self.detections)
+
+    @property
+    def total_serious_violations(self) -> int:
+        return self.detections.total_violations
+
+    def without_frame(self) -> "FrameResult":
+        # Same result without the pixels, for the consumers of the numbers
+        return FrameResult(None, self.detections, self.pairs, self.unique_people,
+                           self.keyframe, self.skipped, self.motion)
+
+
+class Pipeline:
+    """
+    Qt free detection pipeline, detect people in a frame, check the
+    social distance violations and draw the annotations
+    """
+    def __init__(self,
+                 camera_id: int = 0,
+                 use_gpu: bool = config.USE_GPU,
+                 engine: InferenceEngine = None,
+                 stats: CameraStats = None,
+                 ) -> None:
+
+        self.camera_id = camera_id
+
+        # Per stage timing, records nothing unless enabled
+        self.stats = stats if stats is not None else NullStats(camera_id)
+        self.person_index = config.LABELS.index("person")
+
+        # Network input size of this camera, the auto mode starts with
+        # the largest one and goes down until the detection is fast enough
+        network_size = config.camera_setting(camera_id, "NETWORK_SIZE")
+        check_network_size(network_size)
+
+        self.auto_size = network_size == "auto"
+        self.network_size = NETWORK_SIZES[-1] if self.auto_size else network_size
+        self.detect_seconds = None
+        self.size_warmup = True
+
+        # Regions of interest and tiles of this camera, disabled
+        # by default: the whole frame in a single network input
+        self.regions = DetectRegions(
+            FRAME_SIZE,
+            config.camera_setting(camera_id, "DETECT_ROIS"),
+            config.camera_setting(camera_id, "DETECT_TILES"),
+            config.camera_setting(camera_id, "DETECT_TILE_OVERLAP"),
+        )
+
+        # Use the shared inference engine if any,
+        # otherwise load a network for this camera
+        self.engine = engine
+
+        if self.engine is None:
+            self.backend = load_backend(use_gpu=use_gpu)
+
+        # the violation check imports scipy on its first call, run it
+        # now, with the network, rather than on the first frame
+        find_violations([(0, 0), (1, 1)], [0, 0], 2, 1)
+
+        # models exported with a fixed input size only run at that size
+        backend = self.engine.wait_ready() if self.engine is not None else self.backend
+        input_size = backend.input_size
+        if input_size is not None:
+            (self.auto_size, self.network_size) = (False, input_size)
+
+        # Distance in metres on the floor when the camera is calibrated
+        self.ground = None
+        ground_points = config.camera_setting(camera_id, "GROUND_POINTS")
+        if ground_points:
+            self.ground = GroundPlane(FRAME_SIZE, ground_points, config.camera_setting(camera_id, "GROUND_METRES"))
+            self.min_distance_metres = config.camera_setting(camera_id, "MIN_DISTANCE_METRES")
+
+        # Detect on keyframes only and track the people in between
+        self.tracker = None
+        self.interval = max(1, config.DETECT_INTERVAL)
+        self.since_detection = None
+
+        if self.interval > 1:
+            self.tracker = CentroidTracker()
+
+        # Skip the detection on static frames
+        self.motion_gate = MotionGate() if config.MOTION_GATE else None
+        self.last_detections = Detections.empty()
+
+        # Record the candidates of every detection (see sodistec.core.replay)
+        # and the number of the frame being processed
+        self.detection_log = None
+        self.frame_index = -1
+
+    def blob(self, image):
+        # construct a blob from the letterboxed frame, already
+        # at the network input size
+        return cv2.dnn.blobFromImage(image, 1 / 255.0, swapRB=True, crop=False)
+
+    def forward(self, blob) -> list:
+        # perform a forward pass of the YOLO object detector, giving
+        # us our bounding boxes and associated probabilities
+        return self.backend.forward(blob)
+
+    def suppress(self, candidates: Detections) -> Detections:
+        # apply non-maxima suppression to suppress weak, overlapping
+        # bounding boxes
+        return suppress(candidates, config.MIN_CONF, config.NMS_THRESH)
+
+    def detect_people(self, frame, person_index: int = 0, output_size: tuple = None) -> Detections:
+        """
+        Detect the people in a frame, at any resolution, the boxes are
+        given in output_size (width, height) coordinates if set, otherwise
+        in the frame coordinates
+        """
+        if self.regions.enabled:
+            return self.detect_regions(frame, person_index, output_size)
+
+        # Credit to: https://github.com/saimj7/Social-Distancing-Detection-in-Real-Time
+        # a single resize from the source frame to the network input
+        with self.stats.stage("letterbox"):
+            (image, box) = letterbox(frame, self.network_size)
+
+        if self.engine is not None:
+            with self.stats.stage("forward"):
+                layerOutputs = self.engine.infer(self.camera_id, image)
+        else:
+            with self.stats.stage("blob"):
+                blob = self.blob(image)
+            with self.stats.stage("forward"):
+                layerOutputs = self.forward(blob)
+
+        # decode every output layer at once into candidate boxes,
+        # centroids, confidences and distances
+        with self.stats.stage("decode"):
+            (width, height, offset) = box.mapping(output_size)
+
+            # the weaker candidates are recorded too, the NMS still
+            # drops them with the MIN_CONF threshold
+            min_conf = config.MIN_CONF
+            if self.detection_log is not None:
+                min_conf = min(min_conf, self.detection_log.min_conf)
+
+            candidates = decode_outputs(layerOutputs, width, height, person_index, min_conf, offset)
+
+        if self.detection_log is not None:
+            self.detection_log.append(self.frame_index, candidates)
+
+        with self.stats.stage("nms"):
+            return self.suppress(candidates)
+
+    def detect_regions(self, frame, person_index: int = 0, output_size: tuple = None) -> Detections:
+        """
+        Detect the people in the crops of the regions of interest and
+        their tiles, batched in one forward pass, same boxes as
+        detect_people
+        """
+        (h, w) = frame.shape[:2]
+        (out_w, out_h) = output_size if output_size is not None else (w, h)
+        (kx, ky) = (out_w / w, out_h / h)
+        crops = self.regions.crops((w, h))
+
+        with self.stats.stage("letterbox"):
+            inputs = [letterbox(frame[y0:y1, x0:x1], self.network_size) for (x0, y0, x1, y1) in crops]
+            images = [image for (image, _) in inputs]
+
+        with self.stats.stage("forward"):
+            if self.engine is not None:
+                outputs = self.engine.infer_many(self.camera_id, images)
+            else:
+                outputs = forward_batch(self.backend, images)
+
+        with self.stats.stage("decode"):
+            min_conf = config.MIN_CONF
+            if self.detection_log is not None:
+                min_conf = min(min_conf, self.detection_log.min_conf)
+
+            candidates = []
+            for ((x0, y0, x1, y1), (_, box), layerOutputs) in zip(crops, inputs, outputs):
+                # the crop in output coordinates, then moved to its place
+                (width, height, (pad_x, pad_y)) = box.mapping(((x1 - x0) * kx, (y1 - y0) * ky))
+                offset = (pad_x - x0 * kx, pad_y - y0 * ky)
+                candidates.append(decode_outputs(layerOutputs, width, height, person_index, min_conf, offset))
+
+            crop_index = np.repeat(np.arange(len(crops)), [len(c) for c in candidates])
+            candidates = Detections.concatenate(candidates)
+
+        if self.detection_log is not None:
+            self.detection_log.append(self.frame_index, candidates, crop_index)
+
+        with self.stats.stage("nms"):
+            return self.regions.merge(candidates, crop_index, config.MIN_CONF, config.NMS_THRESH, (out_w, out_h))
+
+    def check_violations(self, detections: Detections):
+        """
+        Flag the people violating the max/min social distance limits,
+        return the violating (i, j) pairs
+        """
+        if self.ground is not None:
+            return flag_violations(detections, self.min_distance_metres, None, self.ground)
+        return flag_violations(detections, config.MIN_DISTANCE, config.MIN_RADIUS)
+
+    def _adapt_interval(self, detect_seconds: float) -> None:
+        # Detect more often when people move fast, less often when the
+        # scene is calm or when the detector can not keep up anyway
+        interval = self.interval
+
+        if self.tracker.motion > config.TRACK_FAST_MOTION:
+            interval -= 1
+        elif self.tracker.motion < config.TRACK_SLOW_MOTION:
+            interval += 1
+
+        if config.TARGET_FPS > 0:
+            interval = max(interval, math.ceil(detect_seconds * config.TARGET_FPS))
+
+        self.interval = min(max(interval, 1), config.DETECT_INTERVAL_MAX)
+
+    def _adapt_network_size(self, detect_seconds: float) -> None:
+        # Largest network input size detecting at TARGET_FPS, the time
+        # of the other sizes is estimated from the input area
+        if self.size_warmup:
+            # the first forward pass of a size allocates the network
+            self.size_warmup = False
+            return
+
+        if self.detect_seconds is None:
+            self.detect_seconds = detect_seconds
+        else:
+            self.detect_seconds = 0.8 * self.detect_seconds + 0.2 * detect_seconds
+
+        if config.TARGET_FPS <= 0:
+            return
+
+        budget = 1 / config.TARGET_FPS
+        index = NETWORK_SIZES.index(self.network_size)
+
+        if self.detect_seconds > budget and index > 0:
+            size = NETWORK_SIZES[index - 1]
+        elif index + 1 < len(NETWORK_SIZES) and \
+                self.detect_seconds * (NETWORK_SIZES[index + 1] / self.network_size) ** 2 < 0.8 * budget:
+            size = NETWORK_SIZES[index + 1]
+        else:
+            return
+
+        self.network_size = size
+        self.detect_seconds = None
+        self.size_warmup = True
+
+    def track(self, frame, detections: Detections = None) -> Detections:
+        """
+        Update the tracker, with the detections on a keyframe, otherwise
+        move the previous boxes, the detections carry their track ids
+        """
+        if detections is not None:
+            self.tracker.update(frame, detections)
+            return detections
+        return self.tracker.predict(frame)
+
+    def draw(self, frame, detections: Detections, tracked: bool = False) -> None:
+        # plain lists, cheaper to unpack than numpy rows
+        rows = zip(detections.boxes.tolist(), detections.centroids.tolist(),
+                   detections.violations.tolist(), detections.track_ids.tolist())
+
+        # loop over the detections
+        for ((startX, startY, endX, endY), (cX, cY), violation, track_id) in rows:
+            # red for the people violating the social distance
+            color = (0, 0, 255) if violation else (0, 255, 0)
+
+            # draw (1) a bounding box around the person and (2) the
+            # centroid coordinates of the person,
+            cv2.rectangle(frame, (startX, startY), (endX, endY), color, 2)
+            cv2.circle(frame, (cX, cY), 5, color, 2)
+
+            if tracked:
+                cv2.putText(frame, str(track_id), (startX, startY - 5),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+
+    def motion(self, skipped: bool):
+        # Scene motion from the motion gate (changed or not) or from the
+        # people followed by the tracker, None when neither is used
+        if self.motion_gate is not None:
+            return 0.0 if skipped else 1.0
+        if self.tracker is not None:
+            return min(1.0, self.tracker.motion / config.TRACK_FAST_MOTION)
+        return None
+
+    def _locate(self, frame, source) -> tuple:
+        # Detect the people on keyframes, track them on the other frames,
+        # return the detections and if it was a keyframe
+        keyframe = self.tracker is None or self.since_detection is None \
+            or self.since_detection + 1 >= self.interval
+
+        if keyframe:
+            # detect on the source frame, boxes in frame coordinates
+            start = time.perf_counter()
+            detections = self.detect_people(source, self.person_index, frame.shape[1::-1])
+            detect_seconds = time.perf_counter() - start
+            self.since_detection = 0
+
+            if self.auto_size:
+                self._adapt_network_size(detect_seconds)
+        else:
+            detections = None
+            self.since_detection += 1
+
+        if self.tracker is not None:
+            with self.stats.stage("track"):
+                detections = self.track(frame, detections)
+
+            if keyframe and config.DETECT_INTERVAL_ADAPTIVE:
+                self._adapt_interval(detect_seconds)
+
+        return (detections, keyframe)
+
+    def process(self, frame, draw: bool = True, out = None) -> FrameResult:
+        # Credit to: https://github.com/saimj7/Social-Distancing-Detection-in-Real-Time
+        # resize the frame for the display (into `out` if given, e.g. a
+        # shared memory buffer), the detection resizes the source frame itself
+        self.frame_index += 1
+        source = frame
+        with self.stats.stage("resize"):
+            frame = cv2.resize(frame, FRAME_SIZE, dst=out, interpolation=cv2.INTER_LINEAR)
+
+        # reuse the last results while the scene does not change
+        skipped = False
+        if self.motion_gate is not None:
+            with self.stats.stage("motion"):
+                skipped = not self.motion_gate.changed(frame)
+
+        if skipped:
+            self.stats.count("skipped")
+            detections = self.last_detections
+            keyframe = False
+        else:
+            (detections, keyframe) = self._locate(frame, source)
+            self.last_detections = detections
+
+        unique_people = self.tracker.unique_people if self.tracker is not None else None
+
+        with self.stats.stage("violation"):
+            pairs = self.check_violations(detections)
+
+        if draw:
+            with self.stats.stage("draw"):
+                self.draw(frame, detections, self.tracker is not None)
+
+        return FrameResult(frame, detections, pairs, unique_people, keyframe, skipped, self.motion(skipped))
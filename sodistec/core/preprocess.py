@@ -0,0 +1,66 @@
+try:
+    from cv2 import cv2
+except ImportError:
+    import cv2
+
+# Network input sizes, from the fastest to the most accurate
+NETWORK_SIZES = (320, 416, 512, 608)
+
+# Gray padding around the letterboxed frame, as darknet does
+LETTERBOX_COLOR = 127
+
+
+class Letterbox:
+    """
+    Where the source frame lies in the square network input
+    """
+    __slots__ = ("size", "scale", "pad_x", "pad_y", "width", "height")
+
+    def __init__(self, size: int, scale: float, pad_x: int, pad_y: int, width: int, height: int) -> None:
+        self.size = size
+        self.scale = scale
+        self.pad_x = pad_x
+        self.pad_y = pad_y
+
+        # source frame size
+        self.width = width
+        self.height = height
+
+    def mapping(self, output_size: tuple = None) -> tuple:
+        """
+        Return the (width, height, offset) to decode the network outputs
+        into output_size (width, height) coordinates, the source frame
+        coordinates when not given
+        """
+        (width, height) = output_size if output_size is not None else (self.width, self.height)
+        (kx, ky) = (width / self.width / self.scale, height / self.height / self.scale)
+
+        return (self.size * kx, self.size * ky, (self.pad_x * kx, self.pad_y * ky))
+
+
+def letterbox(frame, size: int, color: int = LETTERBOX_COLOR) -> tuple:
+    """
+    Resize a frame straight to the size x size network input keeping its
+    aspect ratio and pad the rest, return the image and its Letterbox
+    """
+    (h, w) = frame.shape[:2]
+    scale = min(size / w, size / h)
+    (new_w, new_h) = (max(1, round(w * scale)), max(1, round(h * scale)))
+
+    image = frame
+    if (new_w, new_h) != (w, h):
+        image = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+
+    pad_x = (size - new_w) // 2
+    pad_y = (size - new_h) // 2
+
+    if (new_w, new_h) != (size, size):
+        image = cv2.copyMakeBorder(image, pad_y, size - new_h - pad_y, pad_x, size - new_w - pad_x,
+            cv2.BORDER_CONSTANT, value=(color, color, color))
+
+    return (image, Letterbox(size, scale, pad_x, pad_y, w, h))
+
+
+def check_network_size(size) -> None:
+    if size != "auto" and (not isinstance(size, int) or size <= 0 or size % 32):
+        raise ValueError(f"Network size must be a multiple of 32 or 'auto', got {size!r}")
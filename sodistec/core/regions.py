@@ -0,0 +1,168 @@
+import numpy as np
+
+try:
+    from cv2 import cv2
+except ImportError:
+    import cv2
+
+from sodistec.core.decode import estimate_distances, suppress_indices
+from sodistec.core.detections import Detections
+
+# Two boxes found in different crops are the same person when this much
+# of the smaller one lies in the other, e.g. the half of a person cut
+# by a tile border and the whole person found in the next tile
+MERGE_OVERLAP = 0.6
+
+
+def check_regions(rois, tiles, overlap) -> None:
+    for polygon in rois:
+        if len(polygon) < 3:
+            raise ValueError(f"A region of interest needs at least 3 points, got {polygon!r}")
+
+    if len(tiles) != 2 or any(not isinstance(n, int) or n < 1 for n in tiles):
+        raise ValueError(f"Tiles must be (rows, cols) of at least 1, got {tiles!r}")
+
+    if not 0 <= overlap < 1:
+        raise ValueError(f"Tile overlap must be in [0, 1), got {overlap!r}")
+
+
+def split(start: float, length: float, count: int, overlap: float) -> list:
+    # (start, end) of count parts of a length, each one
+    # overlapping the next one by a fraction of its size
+    size = length / (count - (count - 1) * overlap)
+    step = size * (1 - overlap)
+    return [(start + i * step, start + i * step + size) for i in range(count)]
+
+
+class DetectRegions:
+    """
+    Where a camera looks for people: polygon regions of interest (in
+    frame_size coordinates, the whole frame when there are none), each
+    one cut in overlapping rows x cols tiles, only the crops of the source
+    frame go to the network, at its full input size each
+    """
+    def __init__(self, frame_size: tuple, rois: list = (), tiles: tuple = (1, 1), overlap: float = 0.2) -> None:
+        check_regions(rois, tiles, overlap)
+
+        self.frame_size = tuple(frame_size)
+        self.rois = [np.asarray(polygon, dtype=np.int32).reshape(-1, 2) for polygon in rois]
+        self.tiles = tuple(tiles)
+        self.overlap = overlap
+
+        # people standing in a region, the whole frame when there are none
+        self.mask = None
+        if self.rois:
+            self.mask = np.zeros(self.frame_size[::-1], dtype=np.uint8)
+            cv2.fillPoly(self.mask, self.rois, 1)
+
+        self._crops = {}
+
+    def settings(self) -> dict:
+        # the arguments building the same regions, as JSON
+        return {
+            "frame_size": list(self.frame_size),
+            "rois": [polygon.tolist() for polygon in self.rois],
+            "tiles": list(self.tiles),
+            "overlap": self.overlap,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        # False when the whole frame is detected at once
+        return bool(self.rois) or self.tiles != (1, 1)
+
+    def crops(self, source_size: tuple) -> list:
+        """
+        (startX, startY, endX, endY) of every crop in the source frame
+        coordinates, computed once per source size
+        """
+        if source_size in self._crops:
+            return self._crops[source_size]
+
+        (w, h) = source_size
+        (kx, ky) = (w / self.frame_size[0], h / self.frame_size[1])
+
+        rects = [cv2.boundingRect(polygon) for polygon in self.rois] or [(0, 0, *self.frame_size)]
+
+        crops = []
+        for (x, y, rect_w, rect_h) in rects:
+            (rows, cols) = self.tiles
+            for (y0, y1) in split(y * ky, rect_h * ky, rows, self.overlap):
+                for (x0, x1) in split(x * kx, rect_w * kx, cols, self.overlap):
+                    crop = (max(0, round(x0)), max(0, round(y0)), min(w, round(x1)), min(h, round(y1)))
+                    if crop[2] > crop[0] and crop[3] > crop[1]:
+                        crops.append(crop)
+
+        self._crops[source_size] = crops
+        return crops
+
+    def inside(self, detections: Detections, output_size: tuple):
+        # Mask of the people whose feet (bottom center of
+        # the box) stand in a region of interest
+        if self.mask is None:
+            return np.ones(len(detections), dtype=bool)
+
+        (kx, ky) = (self.frame_size[0] / output_size[0], self.frame_size[1] / output_size[1])
+        x = np.clip(detections.centroids[:, 0] * kx, 0, self.frame_size[0] - 1).astype(int)
+        y = np.clip(detections.boxes[:, 3] * ky, 0, self.frame_size[1] - 1).astype(int)
+
+        return self.mask[y, x].astype(bool)
+
+    def merge(self, candidates: Detections, crops, min_conf: float, nms_thresh: float,
+              output_size: tuple) -> Detections:
+        """
+        Non-maxima suppression of the candidates of every crop, crops
+        giving the crop of every candidate, then across the crops, where
+        the parts of a person cut by a crop border are joined instead of
+        dropped, keep the people standing in a region
+        """
+        crops = np.asarray(crops)
+        keep = np.concatenate([
+            np.flatnonzero(crops == crop)[suppress_indices(candidates[crops == crop], min_conf, nms_thresh)]
+            for crop in np.unique(crops)
+        ] or [np.empty(0, dtype=int)])
+
+        # the most confident first
+        keep = keep[np.argsort(-candidates.confidences[keep], kind="stable")]
+        (candidates, crops) = (candidates[keep], crops[keep])
+
+        if len(np.unique(crops)) > 1:
+            candidates = self._join(candidates, crops)
+
+        return candidates[self.inside(candidates, output_size)]
+
+    @staticmethod
+    def _join(candidates: Detections, crops) -> Detections:
+        # Greedy, from the most confident box, every box of another crop
+        # mostly inside it is the same person, the box becomes their union
+        boxes = candidates.boxes.copy()
+        areas = np.maximum(boxes[:, 2] - boxes[:, 0], 1) * np.maximum(boxes[:, 3] - boxes[:, 1], 1)
+        joined = np.zeros(len(boxes), dtype=bool)
+
+        for i in range(len(boxes)):
+            if joined[i]:
+                continue
+
+            iw = np.minimum(boxes[i, 2], boxes[:, 2]) - np.maximum(boxes[i, 0], boxes[:, 0])
+            ih = np.minimum(boxes[i, 3], boxes[:, 3]) - np.maximum(boxes[i, 1], boxes[:, 1])
+            overlap = np.clip(iw, 0, None) * np.clip(ih, 0, None) / np.minimum(areas[i], areas)
+
+            same = (overlap > MERGE_OVERLAP) & (crops != crops[i]) & ~joined
+            same[:i + 1] = False
+            if not same.any():
+                continue
+
+            boxes[i, 0:2] = np.minimum(boxes[i, 0:2], boxes[same, 0:2].min(axis=0))
+            boxes[i, 2:4] = np.maximum(boxes[i, 2:4], boxes[same, 2:4].max(axis=0))
+            areas[i] = (boxes[i, 2] - boxes[i, 0]) * (boxes[i, 3] - boxes[i, 1])
+            joined |= same
+
+        if not joined.any():
+            return candidates
+
+        kept = ~joined
+        boxes = boxes[kept]
+        (x, w) = (boxes[:, 0], boxes[:, 2] - boxes[:, 0])
+        centroids = (boxes[:, 0:2] + boxes[:, 2:4]) // 2
+
+        return Detections(boxes, centroids, candidates.confidences[kept], estimate_distances(x, w))
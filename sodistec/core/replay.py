@@ -0,0 +1,228 @@
+import itertools
+import json
+import os
+import time
+
+import numpy as np
+
+from sodistec.apps import config
+from sodistec.core.calibration import GroundPlane
+from sodistec.core.decode import suppress
+from sodistec.core.detections import Detections
+from sodistec.core.regions import DetectRegions
+from sodistec.core.violation import find_violations, flag_violations
+
+# One detector candidate (before NMS) on disk, coordinates of the frame
+# the pipeline draws on, and the crop (region or tile) it was found in
+CANDIDATE_DTYPE = np.dtype([
+    ("box", np.int32, 4),
+    ("centroid", np.int32, 2),
+    ("confidence", np.float32),
+    ("distance", np.float32),
+    ("crop", np.int32),
+])
+
+# Recordings of version 1, without the crops
+CANDIDATE_DTYPE_V1 = np.dtype([
+    ("box", np.int32, 4),
+    ("centroid", np.int32, 2),
+    ("confidence", np.float32),
+    ("distance", np.float32),
+])
+
+# Frame number and end of its candidates in the candidate file
+FRAME_DTYPE = np.dtype([("frame", np.int64), ("end", np.int64)])
+
+CANDIDATES_FILE = "candidates.bin"
+FRAMES_FILE = "frames.bin"
+META_FILE = "meta.json"
+
+
+class DetectionLog:
+    """
+    Append the detector candidates (before NMS) of every detected frame
+    to a directory, read back with DetectionRecording, with the regions
+    of the camera (if enabled) to replay their merge and its ground plane
+    calibration (if any) to replay the distance in metres
+    """
+    def __init__(self, path: str, min_conf: float = 0.05, source: str = None,
+                 regions: DetectRegions = None, ground: GroundPlane = None) -> None:
+        self.path = path
+        self.min_conf = min_conf
+        self.source = source
+        self.regions = regions if regions is not None and regions.enabled else None
+        self.ground = ground
+
+        os.makedirs(path, exist_ok=True)
+        self.candidates = open(os.path.join(path, CANDIDATES_FILE), "wb")
+        self.frames = open(os.path.join(path, FRAMES_FILE), "wb")
+
+        self.frame_count = 0
+        self.candidate_count = 0
+
+    def append(self, frame: int, candidates: Detections, crops = None) -> None:
+        rows = np.empty(len(candidates), dtype=CANDIDATE_DTYPE)
+        rows["box"] = candidates.boxes
+        rows["centroid"] = candidates.centroids
+        rows["confidence"] = candidates.confidences
+        rows["distance"] = candidates.distances
+        rows["crop"] = crops if crops is not None else 0
+        rows.tofile(self.candidates)
+
+        self.candidate_count += len(rows)
+        self.frame_count += 1
+        np.array([(frame, self.candidate_count)], dtype=FRAME_DTYPE).tofile(self.frames)
+
+    def close(self) -> None:
+        self.candidates.close()
+        self.frames.close()
+
+        meta = {
+            "version": 2,
+            "source": self.source,
+            "min_conf": self.min_conf,
+            "regions": self.regions.settings() if self.regions is not None else None,
+            "ground": self.ground.settings() if self.ground is not None else None,
+            "frames": self.frame_count,
+            "candidates": self.candidate_count,
+        }
+        with open(os.path.join(self.path, META_FILE), "w") as f:
+            json.dump(meta, f, indent=2)
+
+
+def _memmap(path: str, dtype):
+    # an empty file can not be memory mapped
+    if os.path.getsize(path) == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
+
+
+class DetectionRecording:
+    """
+    Candidates recorded by DetectionLog, memory mapped
+    """
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+        with open(os.path.join(path, META_FILE)) as f:
+            self.meta = json.load(f)
+
+        self.min_conf = self.meta["min_conf"]
+
+        # the regions of interest and tiles of the camera, if any
+        regions = self.meta.get("regions")
+        self.regions = DetectRegions(**regions) if regions else None
+
+        # the ground plane calibration of the camera, if any
+        ground = self.meta.get("ground")
+        self.ground = GroundPlane(**ground) if ground else None
+
+        dtype = CANDIDATE_DTYPE_V1 if self.meta["version"] == 1 else CANDIDATE_DTYPE
+        self.candidates = _memmap(os.path.join(path, CANDIDATES_FILE), dtype)
+        self.frames = _memmap(os.path.join(path, FRAMES_FILE), FRAME_DTYPE)
+
+        ends = np.asarray(self.frames["end"])
+        self.starts = np.concatenate([[0], ends[:-1]]).tolist()
+        self.ends = ends.tolist()
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def frame(self, index: int) -> Detections:
+        rows = self.candidates[self.starts[index]:self.ends[index]]
+        return Detections(rows["box"], rows["centroid"], rows["confidence"], rows["distance"])
+
+    def crops(self, index: int):
+        # the crop of every candidate of a frame
+        if "crop" not in self.candidates.dtype.names:
+            return np.zeros(self.ends[index] - self.starts[index], dtype=np.int32)
+        return np.asarray(self.candidates["crop"][self.starts[index]:self.ends[index]])
+
+
+def _summary(people: list, violators: list, pairs: list) -> dict:
+    people = np.asarray(people)
+    violators = np.asarray(violators)
+    total = int(people.sum())
+
+    return {
+        "frames": len(people),
+        "people": round(float(people.mean()), 3) if len(people) else 0.0,
+        "violators": round(float(violators.mean()), 3) if len(violators) else 0.0,
+        "violation_rate": round(float(violators.sum()) / total, 4) if total else 0.0,
+        "violation_frames": round(float(np.mean(violators > 0)), 4) if len(violators) else 0.0,
+        "pairs": round(float(np.mean(pairs)), 3) if len(pairs) else 0.0,
+    }
+
+
+def sweep(recording: DetectionRecording,
+          min_conf: list,
+          nms_thresh: list,
+          min_distance: list,
+          min_radius: list,
+          min_distance_metres: list = (config.MIN_DISTANCE_METRES,),
+          ) -> list:
+    """
+    Replay the NMS and the violation check of the pipeline for every
+    combination of the settings, return (settings, summary) pairs: mean
+    people, violators and violating pairs per frame, share of the people
+    in violation and share of the frames with a violation
+
+    A calibrated camera is checked in metres, with min_distance_metres
+    instead of min_distance and min_radius.
+    """
+    for value in min_conf:
+        if value < recording.min_conf:
+            raise ValueError(f"MIN_CONF {value} is under the recorded minimum {recording.min_conf}")
+
+    # the violation check loads scipy on its first call, not while timed
+    find_violations([(0, 0), (1, 1)], [0, 0], 2, 1)
+
+    frames = [recording.frame(i) for i in range(len(recording))]
+    crops = [recording.crops(i) for i in range(len(recording))]
+    (regions, ground) = (recording.regions, recording.ground)
+    results = []
+
+    def merge(candidates, candidate_crops, conf, nms):
+        # as the pipeline does: plain NMS, or per crop, across the
+        # crops and only the people in a region of interest
+        mask = candidates.confidences > conf
+        if regions is None:
+            return suppress(candidates[mask], conf, nms)
+        return regions.merge(candidates[mask], candidate_crops[mask], conf, nms, regions.frame_size)
+
+    if ground is not None:
+        distances = [{"MIN_DISTANCE_METRES": metres} for metres in min_distance_metres]
+    else:
+        distances = [
+            {"MIN_DISTANCE": distance, "MIN_RADIUS": radius}
+            for (distance, radius) in itertools.product(min_distance, min_radius)
+        ]
+
+    for (conf, nms) in itertools.product(min_conf, nms_thresh):
+        # the NMS does not depend on the distance settings, run it once
+        start = time.perf_counter()
+        kept = [merge(candidates, frame_crops, conf, nms) for (candidates, frame_crops) in zip(frames, crops)]
+        nms_seconds = time.perf_counter() - start
+
+        for distance in distances:
+            start = time.perf_counter()
+            (people, violators, pairs) = ([], [], [])
+
+            for detections in kept:
+                if ground is not None:
+                    frame_pairs = flag_violations(detections, distance["MIN_DISTANCE_METRES"], None, ground)
+                else:
+                    frame_pairs = flag_violations(detections, distance["MIN_DISTANCE"], distance["MIN_RADIUS"])
+                people.append(len(detections))
+                violators.append(detections.total_violations)
+                pairs.append(len(frame_pairs))
+
+            seconds = nms_seconds / len(distances) + time.perf_counter() - start
+
+            summary = _summary(people, violators, pairs)
+            summary["fps"] = round(len(kept) / seconds, 1) if seconds > 0 else 0.0
+
+            settings = {"MIN_CONF": conf, "NMS_THRESH": nms, **distance}
+            results.append((settings, summary))
+
+    return results
@@ -0,0 +1,143 @@
+import threading
+import time
+
+from sodistec.apps import config
+
+
+class _Camera:
+    __slots__ = ("camera_id", "min_fps", "activity", "rate", "next_slot")
+
+    def __init__(self, camera_id: int, min_fps: float) -> None:
+        self.camera_id = camera_id
+        self.min_fps = min_fps
+        self.activity = 0.0
+        self.rate = min_fps
+        self.next_slot = 0.0
+
+
+class CameraScheduler:
+    """
+    Share a global frame rate budget between the cameras by their recent
+    activity (people, violations and motion), every camera keeps at least
+    its minimum frame rate and none goes over TARGET_FPS
+    """
+    def __init__(self,
+                 budget: float = config.SCHEDULER_FPS_BUDGET,
+                 max_fps: float = config.TARGET_FPS,
+                 violation_weight: float = config.SCHEDULER_VIOLATION_WEIGHT,
+                 motion_weight: float = config.SCHEDULER_MOTION_WEIGHT,
+                 update_interval: float = 1.0,
+                 ) -> None:
+
+        self.budget = budget
+        self.max_fps = max_fps if max_fps > 0 else float("inf")
+        self.violation_weight = violation_weight
+        self.motion_weight = motion_weight
+        self.update_interval = update_interval
+
+        self.cameras = {}
+        self.condition = threading.Condition()
+        self.last_update = 0.0
+        self.over_budget = False
+
+    def register(self, camera_id: int) -> None:
+        min_fps = config.camera_setting(camera_id, "CAMERA_MIN_FPS")
+
+        with self.condition:
+            self.cameras[camera_id] = _Camera(camera_id, min_fps)
+            self._allocate()
+
+    def unregister(self, camera_id: int) -> None:
+        # the camera budget goes to the other ones, a camera
+        # waiting for its next slot is released
+        with self.condition:
+            self.cameras.pop(camera_id, None)
+            self._allocate()
+            self.condition.notify_all()
+
+    def report(self, camera_id: int, result) -> None:
+        """
+        Account the activity of a processed frame, the rates of
+        every camera are updated once per update_interval
+        """
+        motion = result.motion if result.motion is not None else 0.0
+        activity = result.total_people + self.violation_weight * result.total_serious_violations \
+            + self.motion_weight * motion
+
+        with self.condition:
+            camera = self.cameras.get(camera_id)
+            if camera is None:
+                return
+
+            camera.activity = 0.8 * camera.activity + 0.2 * activity
+
+            if time.perf_counter() - self.last_update >= self.update_interval:
+                self._allocate()
+
+    def _allocate(self) -> None:
+        # Minimum rate first, then the rest of the budget by activity
+        # (water filling, the rate over max_fps goes to the other cameras)
+        self.last_update = time.perf_counter()
+
+        cameras = list(self.cameras.values())
+        for camera in cameras:
+            camera.rate = min(camera.min_fps, self.max_fps)
+
+        remaining = self.budget - sum(camera.rate for camera in cameras)
+        if (remaining < 0) != self.over_budget:
+            self.over_budget = remaining < 0
+            if self.over_budget:
+                print(f"[WARNING] The minimum frame rates of the cameras go over the budget "
+                      f"of {self.budget:.1f} FPS")
+
+        active = [camera for camera in cameras if camera.rate < self.max_fps]
+        while remaining > 1e-6 and active:
+            # an idle camera still weighs as much as one person
+            weights = {camera.camera_id: 1.0 + camera.activity for camera in active}
+            total = sum(weights.values())
+
+            capped = [
+                camera for camera in active
+                if camera.rate + remaining * weights[camera.camera_id] / total >= self.max_fps
+            ]
+            if not capped:
+                for camera in active:
+                    camera.rate += remaining * weights[camera.camera_id] / total
+                break
+
+            for camera in capped:
+                remaining -= self.max_fps - camera.rate
+                camera.rate = self.max_fps
+                active.remove(camera)
+
+    def rate(self, camera_id: int) -> float:
+        # Frames per second given to the camera, 0 when unknown
+        camera = self.cameras.get(camera_id)
+        return camera.rate if camera is not None else 0.0
+
+    def wait(self, camera_id: int) -> bool:
+        """
+        Block until the next frame slot of the camera, return False
+        once the camera is unregistered
+        """
+        with self.condition:
+            while True:
+                camera = self.cameras.get(camera_id)
+                if camera is None:
+                    return False
+
+                delay = camera.next_slot - time.perf_counter()
+                if delay <= 0:
+                    break
+                self.condition.wait(delay)
+
+            # a camera without any rate still gets a frame now and then
+            camera.next_slot = time.perf_counter() + 1 / max(camera.rate, 0.1)
+            return True
+
+    def snapshot(self) -> dict:
+        with self.condition:
+            return {
+                camera.camera_id: {"rate": round(camera.rate, 2), "activity": round(camera.activity, 2)}
+                for camera in self.cameras.values()
+            }
@@ -0,0 +1,216 @@
+import json
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from sodistec.apps import config
+
+
+def percentiles(samples) -> dict:
+    # p50 and p95 of durations in seconds, in milliseconds
+    if not samples:
+        return {"p50": 0.0, "p95": 0.0}
+    (p50, p95) = np.percentile(np.fromiter(samples, dtype=float), [50, 95]) * 1000
+    return {"p50": round(float(p50), 3), "p95": round(float(p95), 3)}
+
+
+class _Stage:
+    """Time a block of code and record it into the camera statistics"""
+    __slots__ = ("stats", "name", "start")
+
+    def __init__(self, stats, name: str) -> None:
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stats.record(self.name, time.perf_counter() - self.start)
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class NullStats:
+    """
+    Statistics that record nothing, used when config.ENABLE_STATS is off
+    """
+    enabled = False
+
+    def __init__(self, camera_id: int = 0) -> None:
+        self.camera_id = camera_id
+
+    def stage(self, name: str):
+        return _NULL_STAGE
+
+    def record(self, name: str, seconds: float) -> None:
+        pass
+
+    def frame(self, sequence: int = None, age: float = None) -> None:
+        pass
+
+    def count(self, name: str, value: int = 1) -> None:
+        pass
+
+    def snapshot(self) -> dict:
+        return {"camera_id": self.camera_id}
+
+
+class CameraStats:
+    """
+    Rolling statistics of a camera: FPS, per stage latency, frame age and
+    the frames dropped (never processed) since the start
+    """
+    enabled = True
+
+    def __init__(self, camera_id: int = 0, window: int = config.STATS_WINDOW) -> None:
+        self.camera_id = camera_id
+        self.window = window
+
+        self.stages = {}
+        self.counters = {}
+        self.frame_times = deque(maxlen=window)
+        self.frame_ages = deque(maxlen=window)
+
+        self.frames = 0
+        self.dropped = 0
+        self.repeated = 0
+        self.last_sequence = None
+
+        self.lock = threading.Lock()
+
+    def stage(self, name: str):
+        return _Stage(self, name)
+
+    def record(self, name: str, seconds: float) -> None:
+        samples = self.stages.get(name)
+        if samples is None:
+            with self.lock:
+                samples = self.stages.setdefault(name, deque(maxlen=self.window))
+        samples.append(seconds)
+
+    def frame(self, sequence: int = None, age: float = None) -> None:
+        # Called once per processed frame, `sequence` is the capture frame
+        # number and `age` the time since the frame was captured
+        self.frames += 1
+        self.frame_times.append(time.perf_counter())
+
+        if age is not None:
+            self.frame_ages.append(age)
+
+        if sequence is not None:
+            if self.last_sequence is not None:
+                if sequence == self.last_sequence:
+                    self.repeated += 1
+                elif sequence > self.last_sequence + 1:
+                    self.dropped += sequence - self.last_sequence - 1
+            self.last_sequence = sequence
+
+    def count(self, name: str, value: int = 1) -> None:
+        # Event counter, e.g. the skipped detections
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    @property
+    def fps(self) -> float:
+        if len(self.frame_times) < 2:
+            return 0.0
+        elapsed = self.frame_times[-1] - self.frame_times[0]
+        return (len(self.frame_times) - 1) / elapsed if elapsed > 0 else 0.0
+
+    def snapshot(self) -> dict:
+        """Machine readable statistics, latencies in milliseconds"""
+        with self.lock:
+            return {
+                "camera_id": self.camera_id,
+                "fps": round(self.fps, 2),
+                "frames": self.frames,
+                "dropped": self.dropped,
+                "repeated": self.repeated,
+                "counters": dict(self.counters),
+                "frame_age": percentiles(list(self.frame_ages)),
+                "stages": {
+                    name: percentiles(list(samples)) for (name, samples) in self.stages.items()
+                },
+            }
+
+
+class RemoteStats(CameraStats):
+    """
+    Statistics of a camera running in another process, merge the last
+    received snapshot with the stages recorded in this process
+    """
+    def __init__(self, camera_id: int = 0, window: int = config.STATS_WINDOW) -> None:
+        super(RemoteStats, self).__init__(camera_id, window)
+        self.remote = {}
+
+    def update(self, snapshot: dict) -> None:
+        with self.lock:
+            self.remote = snapshot
+
+    def snapshot(self) -> dict:
+        local = super(RemoteStats, self).snapshot()
+
+        with self.lock:
+            if not self.remote:
+                return local
+
+            merged = dict(self.remote)
+            merged["stages"] = {**self.remote["stages"], **local["stages"]}
+            merged["counters"] = {**self.remote.get("counters", {}), **local["counters"]}
+            return merged
+
+
+def make_stats(camera_id: int):
+    return CameraStats(camera_id) if config.ENABLE_STATS else NullStats(camera_id)
+
+
+class StatsDumper:
+    """
+    Periodically append the statistics of every camera as one JSON line
+    """
+    def __init__(self, stats: list, path: str = config.STATS_DUMP_PATH,
+                 interval: float = config.STATS_DUMP_INTERVAL) -> None:
+        self.stats = stats
+        self.path = path
+        self.interval = interval
+
+        self.stopped = threading.Event()
+
+    def start(self):
+        t = threading.Thread(target=self._update)
+        t.daemon = True
+        t.start()
+
+        return self
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+    def dump(self) -> None:
+        line = {
+            "time": time.time(),
+            "cameras": [stats.snapshot() for stats in self.stats],
+        }
+        with open(self.path, "a") as f:
+            f.write(json.dumps(line) + "\n")
+
+    def _update(self) -> None:
+        while not self.stopped.wait(self.interval):
+            try:
+                self.dump()
+            except OSError as e:
+                print(f"[ERROR] Cannot write statistics: {e}")
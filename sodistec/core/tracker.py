@@ -0,0 +1,182 @@
+import warnings
+
+import numpy as np
+
+try:
+    from cv2 import cv2
+except ImportError:
+    import cv2
+
+from sodistec.apps import config
+from sodistec.core.decode import estimate_distances
+from sodistec.core.detections import Detections
+
+# Points followed inside every box by the optical flow, relative
+# to the box (center and the four quarters)
+FLOW_POINTS = np.array([[0.5, 0.5], [0.25, 0.25], [0.75, 0.25], [0.25, 0.75], [0.75, 0.75]])
+
+
+class Track:
+    __slots__ = ("track_id", "box", "confidence", "missed")
+
+    def __init__(self, track_id: int, box, confidence: float) -> None:
+        self.track_id = track_id
+        self.box = box
+        self.confidence = confidence
+        self.missed = 0
+
+
+class CentroidTracker:
+    """
+    Keep people boxes between two detections: the detections are associated
+    to the tracks by centroid distance, in between the boxes are moved with
+    sparse optical flow
+    """
+    def __init__(self,
+                 max_distance: float = config.TRACK_MAX_DISTANCE,
+                 max_missed: int = config.TRACK_MAX_MISSED,
+                 flow_scale: float = 0.5,
+                 ) -> None:
+
+        self.max_distance = max_distance
+        self.max_missed = max_missed
+        self.flow_scale = flow_scale
+
+        self.tracks = []
+        self.next_id = 0
+
+        # Downscaled gray version of the previous frame
+        self.previous = None
+
+        # Mean motion of the people, in pixels per frame
+        self.motion = 0.0
+
+    @property
+    def unique_people(self) -> int:
+        return self.next_id
+
+    def _gray(self, frame):
+        small = cv2.resize(frame, None, fx=self.flow_scale, fy=self.flow_scale,
+            interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+    def _visible(self) -> list:
+        # Tracks seen on the last keyframe
+        return [track for track in self.tracks if track.missed == 0]
+
+    def _detections(self, tracks: list) -> Detections:
+        # Same Detections as Pipeline.detect_people from the tracks
+        if not tracks:
+            return Detections.empty()
+
+        boxes = np.array([track.box for track in tracks], dtype="float").astype("int")
+        (x, y, w, h) = boxes.T
+
+        return Detections(
+            np.stack([x, y, x + w, y + h], axis=1),
+            np.stack([x + w // 2, y + h // 2], axis=1),
+            [track.confidence for track in tracks],
+            estimate_distances(x, w),
+            track_ids=[track.track_id for track in tracks],
+        )
+
+    def update(self, frame, detections: Detections) -> list:
+        """
+        Resync the tracks with the detections of a keyframe, set and
+        return the track id of every detection
+        """
+        self.previous = self._gray(frame)
+
+        # detections as (x, y, w, h) boxes and centroids
+        boxes = list(map(tuple, detections.xywh.tolist()))
+        centroids = detections.centroids.astype("float")
+        confidences = detections.confidences.tolist()
+
+        ids = [None] * len(detections)
+        matched = set()
+
+        if self.tracks and len(detections):
+            # scipy is slow to import, only load it when tracking
+            from scipy.optimize import linear_sum_assignment
+            from scipy.spatial import distance as dist
+
+            track_centroids = np.array(
+                [(b[0] + b[2] / 2, b[1] + b[3] / 2) for b in (t.box for t in self.tracks)]
+            )
+            cost = dist.cdist(track_centroids, centroids)
+            (rows, cols) = linear_sum_assignment(cost)
+
+            for (row, col) in zip(rows, cols):
+                if cost[row, col] > self.max_distance:
+                    continue
+
+                track = self.tracks[row]
+                track.box = boxes[col]
+                track.confidence = confidences[col]
+                track.missed = 0
+
+                ids[col] = track.track_id
+                matched.add(row)
+
+        # forget the tracks not detected for a while
+        tracks = []
+        for (index, track) in enumerate(self.tracks):
+            if index not in matched:
+                track.missed += 1
+            if track.missed <= self.max_missed:
+                tracks.append(track)
+
+        # new people
+        for (index, track_id) in enumerate(ids):
+            if track_id is None:
+                track = Track(self.next_id, boxes[index], confidences[index])
+                self.next_id += 1
+                tracks.append(track)
+                ids[index] = track.track_id
+
+        # the missed tracks are kept to be matched on the next keyframes,
+        # only the people seen on this keyframe are carried forward
+        self.tracks = tracks
+        detections.track_ids[:] = ids
+
+        return ids
+
+    def predict(self, frame) -> Detections:
+        """
+        Move the boxes to the given frame, return them as Detections
+        """
+        gray = self._gray(frame)
+        tracks = self._visible()
+
+        if self.previous is None or not tracks:
+            self.previous = gray
+            return Detections.empty()
+
+        boxes = np.array([track.box for track in tracks], dtype="float")
+
+        # follow a few points of every box from the previous frame
+        points = boxes[:, None, 0:2] + FLOW_POINTS[None, :, :] * boxes[:, None, 2:4]
+        points = (points.reshape(-1, 1, 2) * self.flow_scale).astype(np.float32)
+
+        (moved, status, _) = cv2.calcOpticalFlowPyrLK(
+            self.previous, gray, points, None, winSize=(15, 15), maxLevel=2
+        )
+
+        shift = ((moved - points).reshape(len(boxes), -1, 2)) / self.flow_scale
+        good = status.reshape(len(boxes), -1).astype(bool)
+
+        # median displacement of the points followed for every box
+        shift[~good] = np.nan
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            shift = np.nan_to_num(np.nanmedian(shift, axis=1))
+
+        (H, W) = frame.shape[:2]
+        for (track, (dx, dy)) in zip(tracks, shift):
+            (x, y, w, h) = track.box
+            track.box = (min(max(x + dx, 0), W - 1), min(max(y + dy, 0), H - 1), w, h)
+
+        self.motion = float(np.hypot(shift[:, 0], shift[:, 1]).mean())
+        self.previous = gray
+
+        return self._detections(tracks)
@@ -0,0 +1,82 @@
+import numpy as np
+
+from sodistec.apps import config
+
+
+def find_violations(centroids,
+                    distances,
+                    min_distance: float,
+                    min_radius: float,
+                    kdtree_min_people: int = config.KDTREE_MIN_PEOPLE,
+                    ):
+    """
+    Find every pair of people closer than `min_distance` pixels whose
+    estimated distance to the camera differ by less than `min_radius`,
+    or closer than `min_distance` metres when the centroids are floor
+    positions and the distances None
+
+    Return the set of violating indexes and an (n_pairs, 2) array of
+    the violating (i, j) pairs with i < j.
+    """
+    centroids = np.asarray(centroids, dtype="float")
+
+    if len(centroids) < 2:
+        return (set(), np.empty((0, 2), dtype="int"))
+
+    # scipy is imported on the first check, not at start-up
+    from scipy.spatial import cKDTree
+    from scipy.spatial import distance as dist
+
+    if len(centroids) >= kdtree_min_people:
+        # only visit the pairs within the pixel radius, so the cost
+        # grows with the number of close pairs instead of n^2
+        pairs = cKDTree(centroids).query_pairs(min_distance, output_type="ndarray")
+        (i, j) = (pairs[:, 0], pairs[:, 1])
+
+        # query_pairs includes pairs at exactly min_distance
+        pixel = np.hypot(*(centroids[i] - centroids[j]).T)
+    else:
+        # compute the Euclidean distances between all pairs
+        # and keep the upper triangular of the distance matrix
+        (i, j) = np.triu_indices(len(centroids), k=1)
+        pixel = dist.cdist(centroids, centroids, metric="euclidean")[i, j]
+
+    # check to see if the distance between any two centroid pairs is less
+    # than the configured number of pixels and both of them have about the
+    # same distance to the camera
+    mask = pixel < min_distance
+    if distances is not None:
+        distances = np.asarray(distances, dtype="float")
+        mask &= np.abs(distances[i] - distances[j]) < min_radius
+
+    pairs = np.stack([i[mask], j[mask]], axis=1)
+    pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+
+    return (set(np.unique(pairs).tolist()), pairs)
+
+
+def flag_violations(detections, min_distance: float, min_radius: float, ground = None):
+    """
+    Set the violation flags of the detections, return the violating
+    (i, j) pairs, with a GroundPlane the distance is measured between
+    the feet in metres
+    """
+    pairs = np.empty((0, 2), dtype="int")
+    detections.violations[:] = False
+
+    # ensure there are *at least* two people detections (required in
+    # order to compute our pairwise distance maps)
+    if len(detections) >= 2 and ground is not None:
+        # the people standing above the horizon
+        # of the calibration are left out
+        positions = ground.positions(detections)
+        valid = np.flatnonzero(np.isfinite(positions).all(axis=1))
+
+        (_, pairs) = find_violations(positions[valid], None, min_distance, min_radius)
+        pairs = valid[pairs]
+        detections.violations[pairs.reshape(-1)] = True
+    elif len(detections) >= 2:
+        (_, pairs) = find_violations(detections.centroids, detections.distances, min_distance, min_radius)
+        detections.violations[pairs.reshape(-1)] = True
+
+    return pairs
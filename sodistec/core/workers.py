@@ -0,0 +1,232 @@
+import multiprocessing as mp
+import queue
+import time
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from sodistec.apps import config
+from sodistec.contrib.yolo import yolo
+from sodistec.core.pipeline import FRAME_SIZE, FrameResult
+
+# Spawn (not fork) the camera processes, forking a process
+# running Qt or CUDA threads is not safe
+_context = mp.get_context("spawn")
+
+# Annotated frame slots shared by a camera process and the GUI process:
+# one written by the worker, one waiting to be painted, one on screen and
+# one still read by e.g. the MJPEG encoder
+FRAME_SLOTS = 4
+FRAME_SHAPE = (FRAME_SIZE[1], FRAME_SIZE[0], 3)
+
+
+class WorkerResult:
+    """
+    Compact detection result sent back by a camera process
+    """
+    __slots__ = ("camera_id", "sequence", "frame", "detections", "pairs", "unique_people", "motion", "stats")
+
+    def __init__(self, camera_id: int, sequence: int, frame, detections, pairs,
+                 unique_people: int, motion: float, stats) -> None:
+        self.camera_id = camera_id
+        self.sequence = sequence
+        self.frame = frame
+        self.detections = detections
+        self.pairs = pairs
+        self.unique_people = unique_people
+        self.motion = motion
+        self.stats = stats
+
+    @property
+    def total_people(self) -> int:
+        return len(self.detections)
+
+    @property
+    def total_serious_violations(self) -> int:
+        return self.detections.total_violations
+
+    def without_frame(self) -> FrameResult:
+        return FrameResult(None, self.detections, self.pairs, self.unique_people, motion=self.motion)
+
+
+def _settings() -> dict:
+    # Current settings of this process, a spawned process
+    # would only see the defaults of the modules otherwise
+    return {
+        module.__name__: {k: v for (k, v) in vars(module).items() if k.isupper()}
+        for module in (config, yolo)
+    }
+
+
+def _camera_worker(camera_id, video_input, use_gpu, capture_options, settings, shm_name,
+                   free_slots, results, stop_event, min_distance, rate) -> None:
+    # Capture and detection of one camera, runs in its own process
+    for module in (config, yolo):
+        for (name, value) in settings[module.__name__].items():
+            setattr(module, name, value)
+
+    from sodistec.contrib.multicapture import CaptureThread
+    from sodistec.core.pipeline import Pipeline
+    from sodistec.core.stats import make_stats
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    buffers = np.ndarray((FRAME_SLOTS, *FRAME_SHAPE), dtype=np.uint8, buffer=shm.buf)
+
+    stats = make_stats(camera_id)
+    pipeline = Pipeline(camera_id, use_gpu, None, stats)
+    capture = CaptureThread(video_input, **capture_options).start()
+
+    last_stats = time.perf_counter()
+    next_slot = 0.0
+
+    while not stop_event.is_set():
+        # frame rate given by the scheduler of the GUI process, if any
+        if rate.value > 0:
+            stop_event.wait(max(0.0, next_slot - time.perf_counter()))
+            next_slot = time.perf_counter() + 1 / rate.value
+
+        captured = capture.next(timeout=0.5)
+        if captured is None:
+            if capture.ended:
+                break
+            continue
+
+        # settings changed from the GUI process
+        config.MIN_DISTANCE = min_distance.value
+
+        # the frame is resized and drawn straight into a free slot, when
+        # the GUI still uses every slot it is processed but not sent
+        try:
+            slot = free_slots.get_nowait()
+        except queue.Empty:
+            slot = None
+
+        result = pipeline.process(captured.image, out=buffers[slot] if slot is not None else None)
+        stats.frame(captured.sequence, time.perf_counter() - captured.timestamp)
+
+        snapshot = None
+        if stats.enabled and time.perf_counter() - last_stats >= 1:
+            last_stats = time.perf_counter()
+            snapshot = stats.snapshot()
+
+        # the detections are a few small arrays, cheap to pickle
+        message = (captured.sequence, slot, result.detections, result.pairs,
+                   result.unique_people, result.motion, snapshot)
+
+        try:
+            results.put_nowait(message)
+        except queue.Full:
+            # the GUI is behind, drop the result and release its slot
+            if slot is not None:
+                free_slots.put(slot)
+
+    capture.stop()
+    del buffers
+    shm.close()
+
+    results.put(None)
+
+
+class CameraProcess:
+    """
+    Run the capture and the detection of a camera in a separate process,
+    annotated frames come back through shared memory without any copy,
+    only the compact results are pickled
+    """
+    def __init__(self,
+                 video_input,
+                 camera_id: int,
+                 use_gpu: bool = config.USE_GPU,
+                 capture_options: dict = None,
+                 ) -> None:
+
+        self.camera_id = camera_id
+
+        frame_bytes = int(np.prod(FRAME_SHAPE))
+        self.shm = shared_memory.SharedMemory(create=True, size=FRAME_SLOTS * frame_bytes)
+        self.buffers = np.ndarray((FRAME_SLOTS, *FRAME_SHAPE), dtype=np.uint8, buffer=self.shm.buf)
+
+        self.free_slots = _context.Queue()
+        for slot in range(FRAME_SLOTS):
+            self.free_slots.put(slot)
+
+        self.results = _context.Queue(maxsize=FRAME_SLOTS * 2)
+        self.stop_event = _context.Event()
+        self.min_distance = _context.Value("i", config.MIN_DISTANCE)
+
+        # frames per second to process, 0 for as fast as possible
+        self.rate = _context.Value("d", 0.0)
+
+        self.process = _context.Process(
+            target=_camera_worker,
+            args=(camera_id, video_input, use_gpu, capture_options or {}, _settings(), self.shm.name,
+                  self.free_slots, self.results, self.stop_event, self.min_distance, self.rate),
+        )
+        self.process.daemon = True
+
+        self.ended = False
+        self.stopped = False
+
+    def start(self):
+        self.process.start()
+        return self
+
+    def next(self, timeout: float = None):
+        """
+        Wait for the next result, return None on timeout or once the
+        camera process is over
+        """
+        # keep the settings of the GUI process in sync
+        self.min_distance.value = config.MIN_DISTANCE
+
+        try:
+            message = self.results.get(timeout=timeout)
+        except queue.Empty:
+            if not self.process.is_alive():
+                self.ended = True
+            return None
+
+        if message is None:
+            self.ended = True
+            return None
+
+        (sequence, slot, detections, pairs, unique_people, motion, snapshot) = message
+
+        # the frame is a view of its slot, given back to the worker once
+        # the view is gone: replaced on screen, encoded by the server...
+        frame = None
+        if slot is not None:
+            frame = self.buffers[slot]
+            weakref.finalize(frame, self._release, slot)
+
+        return WorkerResult(self.camera_id, sequence, frame, detections, pairs,
+                            unique_people, motion, snapshot)
+
+    def _release(self, slot: int) -> None:
+        if not self.stopped:
+            self.free_slots.put(slot)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self.stopped = True
+        self.stop_event.set()
+
+        # drain the results so the worker is never stuck on a full queue
+        deadline = time.monotonic() + timeout
+        while self.process.is_alive() and time.monotonic() < deadline:
+            try:
+                self.results.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+        self.process.join(max(0.0, deadline - time.monotonic()))
+        if self.process.is_alive():
+            self.process.terminate()
+
+        del self.buffers
+        try:
+            self.shm.close()
+        except BufferError:
+            # a frame is still shown, the memory goes with the process
+            pass
+        self.shm.unlink()